@@ -42,6 +42,47 @@
 #define SCALE_MAX_GRAMS 1000
 #define TARE_CONFIRMED 0x0A
 
+// Protocol v2: SYNC, LEN, OPCODE, PAYLOAD[LEN], CRC-8 over LEN..PAYLOAD
+#define PROTOCOL_VERSION 2
+#define CONFIRM_ID_V2 0xA2
+#define FRAME_SYNC 0xAA
+#define FRAME_MAX_PAYLOAD 128
+#define NO_OPCODE 0x00      // Plain text line (v1) / VERBOSE_DEBUG frame (v2)
+
+// Baud negotiation: every handshake starts at DEFAULT_BAUD
+#define SET_BAUD 0xB1
+#define DEFAULT_BAUD 9600
+#define MAX_BAUD 250000
+#define BAUD_CONFIRM_TIMEOUT 1000
+
+// v2 only: weight samples go out as WEIGHT_BATCH frames of (uint32 millis, int32 weight) pairs
+#define WEIGHT_BATCH 0x40
+#define WEIGHT_BATCH_MAX 8               // 64-byte payload
+#define WEIGHT_BATCH_MAX_AGE 50          // ms before a partial batch is sent anyway
+
+// Clock sync: the host sends TIME_PING, we answer TIME_ECHO + uint32 millis()
+#define TIME_PING 0x41
+#define TIME_ECHO 0x42
+
+// Host-set weight streaming rate: SET_SAMPLE_RATE "<ms between samples>\n", 0 = every reading
+#define SET_SAMPLE_RATE 0x43
+
+// Fill parameters pushed ahead of time: STAGE_FILL "<target grams>,<time limit ms>\n".
+// A target of 0 withdraws them, so the next fill asks the host as before.
+#define STAGE_FILL 0x44
+
+// Liveness: HEARTBEAT goes out whenever nothing else was sent for HEARTBEAT_INTERVAL ms
+#define HEARTBEAT 0xB2
+#define HEARTBEAT_INTERVAL 100
+
+// A fill that asked for its target gives up if the host has not answered by then
+#define TARGET_WEIGHT_TIMEOUT 2000
+// Staged fill values are dropped after this long without any command from the
+// host (it sends TIME_PING every 2 s), so a crashed host cannot leave fills armed
+#define STAGED_FILL_TIMEOUT 6000
+// Readings averaged for a tare (scale.tare()'s default)
+#define TARE_READINGS 10
+
 // ================= GLOBAL VARIABLES ================
 HX711 scale;
 float scaleCalibration = 427.530059; // Default calibration value
@@ -50,6 +91,23 @@ float cWeight1 = 0.0, cWeight2 = 0.0;
 float trueBaseline = 0.0;            // The initial tare value at startup
 float tareOffset = 0.0;              // Offset to adjust the tare value
 char station_serial[SERIAL_MAX_LEN] = {0};
+byte protocolVersion = 1;            // Raised to 2 after calibration if the host confirmed v2
+byte pendingProtocolVersion = 1;
+unsigned long currentBaud = DEFAULT_BAUD;
+
+struct WeightSample {
+    unsigned long millis;
+    long weight;
+};
+WeightSample weightBatch[WEIGHT_BATCH_MAX];
+byte weightBatchCount = 0;
+unsigned long sampleInterval = 0;
+unsigned long lastSampleSent = 0;
+unsigned long lastTransmit = 0;
+bool heartbeatEnabled = false;       // Only once the handshake is complete
+float stagedTargetWeight = 0.0;      // 0 = nothing staged
+unsigned long stagedTimeLimit = 0;
+unsigned long lastHostCommand = 0;   // millis() of the last command byte from the host
 
 // ================= UTILITY FUNCTIONS ==============
 
@@ -60,10 +118,216 @@ void read_serial_from_eeprom() {
     }
 }
 
+// ================= SERIAL FRAMING ================
+
+byte crc8_update(byte crc, byte data) {
+    crc ^= data;
+    for (byte i = 0; i < 8; ++i) {
+        crc = (crc & 0x80) ? (byte)((crc << 1) ^ 0x07) : (byte)(crc << 1);
+    }
+    return crc;
+}
+
+void flush_weight_batch();
+
+// Send one message: a bare opcode + payload in v1, a CRC-checked frame in v2
+void send_frame(byte opcode, const byte* payload, byte length) {
+    // Keep message order: queued samples go out before anything else
+    if (weightBatchCount > 0 && opcode != WEIGHT_BATCH) flush_weight_batch();
+    lastTransmit = millis();
+    if (protocolVersion < 2) {
+        Serial.write(opcode);
+        if (length > 0) Serial.write(payload, length);
+        return;
+    }
+    byte crc = crc8_update(0, length);
+    crc = crc8_update(crc, opcode);
+    for (byte i = 0; i < length; ++i) crc = crc8_update(crc, payload[i]);
+    Serial.write(FRAME_SYNC);
+    Serial.write(length);
+    Serial.write(opcode);
+    if (length > 0) Serial.write(payload, length);
+    Serial.write(crc);
+}
+
+void send_byte(byte opcode) {
+    send_frame(opcode, NULL, 0);
+}
+
+void send_value(byte opcode, long value) {
+    send_frame(opcode, (const byte*)&value, sizeof(value));
+}
+
+void send_value(byte opcode, unsigned long value) {
+    send_frame(opcode, (const byte*)&value, sizeof(value));
+}
+
+void flush_weight_batch() {
+    if (weightBatchCount == 0) return;
+    byte count = weightBatchCount;
+    weightBatchCount = 0;
+    send_frame(WEIGHT_BATCH, (const byte*)weightBatch, count * sizeof(WeightSample));
+}
+
+// One scale reading: CURRENT_WEIGHT in v1, batched with its timestamp in v2.
+// Readings closer together than sampleInterval are not sent. A batch goes out
+// once the next reading (one gap away) would make it older than WEIGHT_BATCH_MAX_AGE,
+// so at a slow sampleInterval every reading is sent straight away.
+void send_weight(long weight) {
+    unsigned long now = millis();
+    if (sampleInterval > 0 && now - lastSampleSent < sampleInterval) return;
+    unsigned long gap = now - lastSampleSent;
+    lastSampleSent = now;
+    if (protocolVersion < 2) {
+        send_value(CURRENT_WEIGHT, weight);
+        return;
+    }
+    weightBatch[weightBatchCount].millis = now;
+    weightBatch[weightBatchCount].weight = weight;
+    weightBatchCount++;
+    if (weightBatchCount >= WEIGHT_BATCH_MAX || now - weightBatch[0].millis + gap >= WEIGHT_BATCH_MAX_AGE) {
+        flush_weight_batch();
+    }
+}
+
+// Tell the host we are alive if nothing else has been sent for a while.
+// Also sends a partial weight batch once it is WEIGHT_BATCH_MAX_AGE old: with a
+// slow sampleInterval no new reading comes along to do it in send_weight().
+void heartbeat() {
+    if (weightBatchCount > 0 && millis() - weightBatch[0].millis >= WEIGHT_BATCH_MAX_AGE) {
+        flush_weight_batch();
+    }
+    if (heartbeatEnabled && millis() - lastTransmit >= HEARTBEAT_INTERVAL) {
+        send_byte(HEARTBEAT);
+    }
+}
+
+// delay() that keeps the heartbeat going
+void wait_ms(unsigned long ms) {
+    unsigned long start = millis();
+    while (millis() - start < ms) {
+        heartbeat();
+        delay(10);
+    }
+}
+
+// TIME_PING, SET_SAMPLE_RATE and STAGE_FILL; returns false for any other command
+bool handle_link_command(int cmd) {
+    lastHostCommand = millis();  // Every command read from the host passes through here
+    if (cmd == TIME_PING) {
+        send_value(TIME_ECHO, millis());
+        return true;
+    }
+    if (cmd == SET_SAMPLE_RATE) {
+        sampleInterval = Serial.readStringUntil('\n').toInt();
+        return true;
+    }
+    if (cmd == STAGE_FILL) {
+        String staged = Serial.readStringUntil('\n');
+        int comma = staged.indexOf(',');
+        stagedTargetWeight = staged.substring(0, comma).toFloat();
+        stagedTimeLimit = comma >= 0 ? staged.substring(comma + 1).toInt() : 0;
+        return true;
+    }
+    return false;
+}
+
+// Next command byte from the host, or -1 if none. Link commands are handled
+// here, so they work in every loop that listens for commands.
+int read_command() {
+    heartbeat();
+    while (Serial.available() > 0) {
+        int cmd = Serial.read();
+        if (handle_link_command(cmd)) continue;
+        return cmd;
+    }
+    return -1;
+}
+
+// For loops that take no commands (e.g. the fill loop): handle link commands,
+// leave anything else queued for later. Part of fill staging: a fill started
+// from staged values skips the REQUEST_TARGET_WEIGHT exchange, and without this
+// the AUTO and SMART fill loops would never read the port, so SET_SAMPLE_RATE
+// (full rate while filling) and TIME_PING would wait until the fill ended.
+void service_link() {
+    heartbeat();
+    while (Serial.available() > 0) {
+        int next = Serial.peek();
+        if (next != TIME_PING && next != SET_SAMPLE_RATE && next != STAGE_FILL) return;
+        handle_link_command(Serial.read());
+    }
+}
+
+// Text message; v1 keeps the old "opcode + println" form
+void send_text(byte opcode, const String& text) {
+    if (protocolVersion < 2) {
+        lastTransmit = millis();
+        if (opcode != NO_OPCODE) Serial.write(opcode);
+        Serial.println(text);
+        return;
+    }
+    if (opcode == NO_OPCODE) opcode = VERBOSE_DEBUG;
+    unsigned int length = text.length();
+    if (length > FRAME_MAX_PAYLOAD) length = FRAME_MAX_PAYLOAD;
+    send_frame(opcode, (const byte*)text.c_str(), (byte)length);
+}
+
+// ================= BAUD RATE =====================
+
+bool baud_supported(unsigned long baud) {
+    return baud == DEFAULT_BAUD || baud == 115200 || baud == 250000;
+}
+
+void set_baud(unsigned long baud) {
+    Serial.flush();
+    delay(10);
+    Serial.end();
+    Serial.begin(baud);
+    currentBaud = baud;
+}
+
+// SET_BAUD "<rate>\n": ack at the old rate, switch, and keep the new rate
+// only if the host confirms with SET_BAUD at that rate in time
+void handle_set_baud() {
+    String receivedData = Serial.readStringUntil('\n');
+    unsigned long baud = receivedData.toInt();
+    if (!baud_supported(baud)) {
+        send_text(VERBOSE_DEBUG, "Unsupported baud rate: " + receivedData);
+        return;
+    }
+    unsigned long previousBaud = currentBaud;
+    send_value(SET_BAUD, baud);
+    set_baud(baud);
+    unsigned long start = millis();
+    while (millis() - start < BAUD_CONFIRM_TIMEOUT) {
+        if (Serial.available() > 0 && Serial.read() == SET_BAUD) {
+            send_value(SET_BAUD, baud);
+            return;
+        }
+    }
+    set_baud(previousBaud);
+}
+
+// scale.read_average() that keeps the heartbeat going: a tare or a
+// calibration reading blocks for a second or more at 10 samples/s
+long read_average_alive(byte times) {
+    long sum = 0;
+    for (byte i = 0; i < times; ++i) {
+        heartbeat();
+        sum += scale.read();
+    }
+    return sum / times;
+}
+
+// scale.get_units() with the heartbeat going between readings
+float get_units_alive(byte times) {
+    return (read_average_alive(times) - scale.get_offset()) / scale.get_scale();
+}
+
 // Always use this for taring so tareOffset is tracked
 void tare_and_update_offset() {
-    float beforeTare = scale.get_units(3);
-    scale.tare();
+    float beforeTare = get_units_alive(3);
+    scale.set_offset(read_average_alive(TARE_READINGS));
     tareOffset += beforeTare;
 }
 
@@ -81,6 +345,16 @@ void handshake_station_id() {
     const char handshake_seq[] = "PMID";
     int handshake_pos = 0;
 
+    // Handshake and calibration always run in v1 at DEFAULT_BAUD so any host can answer them
+    weightBatchCount = 0;
+    sampleInterval = 0;
+    heartbeatEnabled = false;
+    stagedTargetWeight = 0.0;
+    stagedTimeLimit = 0;
+    protocolVersion = 1;
+    pendingProtocolVersion = 1;
+    if (currentBaud != DEFAULT_BAUD) set_baud(DEFAULT_BAUD);
+
     // 1. Blink and wait for 'PMID' sequence
     while (true) {
         unsigned long now = millis();
@@ -108,8 +382,13 @@ void handshake_station_id() {
         delay(500);
 
         // Send serial, then turn LED on
+        // Serial, then the highest protocol and baud rate we speak; v1 hosts only look at <SERIAL:...>
         Serial.print("<SERIAL:");
         Serial.print(station_serial);
+        Serial.print("><PROTO:");
+        Serial.print(PROTOCOL_VERSION);
+        Serial.print("><BAUD:");
+        Serial.print(MAX_BAUD);
         Serial.println(">");
         digitalWrite(LED_PIN, HIGH);
 
@@ -118,6 +397,10 @@ void handshake_station_id() {
             if (Serial.available() > 0) {
                 byte cmd = Serial.read();
                 if (cmd == CONFIRM_ID) break;
+                if (cmd == CONFIRM_ID_V2) {
+                    pendingProtocolVersion = 2;
+                    break;
+                }
             }
             delay(5);
         }
@@ -127,7 +410,7 @@ void handshake_station_id() {
 
 void request_and_apply_calibration() {
     while (true) {
-        Serial.write(REQUEST_CALIBRATION);
+        send_byte(REQUEST_CALIBRATION);
         unsigned long start = millis();
         bool received = false;
         while (millis() - start < 500) {
@@ -144,9 +427,10 @@ void request_and_apply_calibration() {
         }
         if (received) break;
     }
-    Serial.write(VERBOSE_DEBUG);
-    Serial.print("Calibration value received and applied: ");
-    Serial.println(scaleCalibration);
+    // Host has its decoder ready once it answered the calibration request
+    protocolVersion = pendingProtocolVersion;
+    heartbeatEnabled = true;
+    send_text(VERBOSE_DEBUG, String("Calibration value received and applied: ") + String(scaleCalibration));
 }
 
 // ================== SETUP =========================
@@ -158,7 +442,7 @@ void setup() {
     pinMode(LED_PIN, OUTPUT);
     digitalWrite(LED_PIN, LOW);
 
-    Serial.begin(9600);
+    Serial.begin(DEFAULT_BAUD);
     scale.begin(LOADCELL_DOUT_PIN, LOADCELL_SCK_PIN);
     delay(1000);
     scale.set_scale(scaleCalibration);
@@ -190,8 +474,7 @@ void handle_max_weight_block() {
         float trueWeight = get_true_weight(currentWeight); // Pass it in
 
         // --- Send current weight to GUI for live update ---
-        Serial.write(CURRENT_WEIGHT);
-        Serial.write((byte*)&currentWeight, sizeof(currentWeight));
+        send_weight(currentWeight);
 
         // Blink LED every 300ms
         unsigned long now = millis();
@@ -204,10 +487,10 @@ void handle_max_weight_block() {
         // If weight drops below 50g, break out after a short delay and send MAX_WEIGHT_END
         if (abs(trueWeight) < 50.0) {
             digitalWrite(LED_PIN, LOW);
-            delay(1500); // Wait a bit to ensure it's really clear
+            wait_ms(1500); // Wait a bit to ensure it's really clear
             if (!sentEnd) {
-                Serial.write(MAX_WEIGHT_END);
-                Serial.println("<INFO:MAX WEIGHT CLEARED>");
+                send_byte(MAX_WEIGHT_END);
+                send_text(NO_OPCODE, "<INFO:MAX WEIGHT CLEARED>");
                 sentEnd = true;
             }
             break;
@@ -215,11 +498,12 @@ void handle_max_weight_block() {
 
         // If not already sent, send the warning
         if (!sentWarning) {
-            Serial.write(MAX_WEIGHT_WARNING);
-            Serial.println("<ERR:MAX WEIGHT EXCEEDED>");
+            send_byte(MAX_WEIGHT_WARNING);
+            send_text(NO_OPCODE, "<ERR:MAX WEIGHT EXCEEDED>");
             sentWarning = true;
         }
 
+        heartbeat();
         delay(10); // Small delay to avoid busy loop
     }
 }
@@ -243,8 +527,8 @@ void loop() {
         } else if ((millis() - buttonLowStart) > BUTTON_STUCK_THRESHOLD) {
             if (!buttonWasStuck) {
                 digitalWrite(LED_PIN, HIGH);
-                Serial.write(BUTTON_ERROR);
-                Serial.println("<ERR:BUTTON STUCK>");
+                send_byte(BUTTON_ERROR);
+                send_text(NO_OPCODE, "<ERR:BUTTON STUCK>");
                 buttonWasStuck = true;
             }
         }
@@ -258,28 +542,27 @@ void loop() {
     }
 
     // --- SERIAL COMMANDS ---
-    if (Serial.available() > 0) {
-        byte messageType = Serial.read();
+    int messageType = read_command();
+    if (messageType >= 0) {
         if (messageType == RESET_HANDSHAKE) {
-            Serial.write(VERBOSE_DEBUG);
-            Serial.println("RESET_HANDSHAKE received. Restarting handshake...");
+            send_text(VERBOSE_DEBUG, "RESET_HANDSHAKE received. Restarting handshake...");
             handshake_station_id();
             request_and_apply_calibration();
             return; // Skip rest of loop until handshake is complete
         }
         if (messageType == TARE_SCALE) {
             tare_and_update_offset();
-            Serial.write(TARE_CONFIRMED); // Send confirmation byte ONLY after taring
+            send_byte(TARE_CONFIRMED); // Send confirmation byte ONLY after taring
         } else if (messageType == RESET_CALIBRATION) {
             recalibrate();
+        } else if (messageType == SET_BAUD) {
+            handle_set_baud();
         } else if (messageType == MANUAL_FILL_START) {
-            Serial.write(VERBOSE_DEBUG);
-            Serial.println("Manual fill started.");
+            send_text(VERBOSE_DEBUG, "Manual fill started.");
             manual_fill();
         }
         if (messageType == GET_ID) {
-            Serial.write(VERBOSE_DEBUG);
-            Serial.println("Resetting handshake...");
+            send_text(VERBOSE_DEBUG, "Resetting handshake...");
             handshake_station_id();
             request_and_apply_calibration();
         }
@@ -287,67 +570,85 @@ void loop() {
 
     // --- SEND CURRENT WEIGHT ---
     long weight = scale.get_units(3);
-    Serial.write(CURRENT_WEIGHT);
-    Serial.write((byte*)&weight, sizeof(weight));
+    send_weight(weight);
 }
 
 // ================== FILL FUNCTIONS =================
 
+// Staged values, if any, are only used while the host is still talking to us
+bool staged_fill_ready() {
+    if (stagedTargetWeight <= 0 || stagedTimeLimit == 0) return false;
+    if (millis() - lastHostCommand < STAGED_FILL_TIMEOUT) return true;
+    stagedTargetWeight = 0.0;
+    stagedTimeLimit = 0;
+    send_text(VERBOSE_DEBUG, "Staged fill expired: nothing from the host for a while.");
+    return false;
+}
+
 void fill() {
     digitalWrite(LED_PIN, HIGH);
 
-    Serial.write(REQUEST_TARGET_WEIGHT);
-    String receivedData = "";
     float targetWeight = 0.0;
+    unsigned long timeLimit = 0;
 
-    while (true) {
-        if (Serial.available() > 0) {
-            byte messageType = Serial.read();
-            if (messageType == TARGET_WEIGHT) {
-                receivedData = Serial.readStringUntil('\n');
-                targetWeight = receivedData.toFloat();
-                break;
-            } else if (messageType == STOP) {
-                Serial.println("E-Stop activated. Aborting fill process.");
+    // Pick up anything the host staged while we were reading the scale
+    read_command();
+    if (staged_fill_ready()) {
+        // Staged by the host: start without a round trip
+        targetWeight = stagedTargetWeight;
+        timeLimit = stagedTimeLimit;
+    } else {
+        send_byte(REQUEST_TARGET_WEIGHT);
+        String receivedData = "";
+        unsigned long requestedAt = millis();
+
+        while (true) {
+            int messageType = read_command();
+            if (messageType >= 0) {
+                if (messageType == TARGET_WEIGHT) {
+                    receivedData = Serial.readStringUntil('\n');
+                    targetWeight = receivedData.toFloat();
+                    break;
+                } else if (messageType == STOP) {
+                    send_text(NO_OPCODE, "E-Stop activated. Aborting fill process.");
+                    digitalWrite(LED_PIN, LOW);
+                    return;
+                }
+            }
+            if (millis() - requestedAt >= TARGET_WEIGHT_TIMEOUT) {
+                // Host gone or not listening to this station: back to the main loop
+                send_text(VERBOSE_DEBUG, "No target weight from host. Aborting fill process.");
                 digitalWrite(LED_PIN, LOW);
                 return;
             }
         }
-    }
 
-    Serial.write(REQUEST_TIME_LIMIT);
-    delay(200);
+        send_byte(REQUEST_TIME_LIMIT);
+        wait_ms(200);
 
-    unsigned long timeLimit = 0;
-    if (Serial.available() > 0) {
-        byte messageType = Serial.read();
-        if (messageType == REQUEST_TIME_LIMIT) {
-            String receivedData = Serial.readStringUntil('\n');
-            timeLimit = receivedData.toInt();
-            Serial.write(VERBOSE_DEBUG);
-            Serial.print("Received time limit: ");
-            Serial.println(timeLimit);
-        } else if (messageType == RELAY_DEACTIVATED) {
-            Serial.write(VERBOSE_DEBUG);
-            Serial.println("E-Stop activated. Aborting fill process.");
+        int messageType = read_command();
+        if (messageType >= 0) {
+            if (messageType == REQUEST_TIME_LIMIT) {
+                String receivedData = Serial.readStringUntil('\n');
+                timeLimit = receivedData.toInt();
+                send_text(VERBOSE_DEBUG, String("Received time limit: ") + String(timeLimit));
+            } else if (messageType == RELAY_DEACTIVATED) {
+                send_text(VERBOSE_DEBUG, "E-Stop activated. Aborting fill process.");
+                digitalWrite(LED_PIN, LOW);
+                return;
+            }
+        } else {
             digitalWrite(LED_PIN, LOW);
             return;
         }
-    } else {
-        digitalWrite(LED_PIN, LOW);
-        return;
     }
 
-    Serial.write(VERBOSE_DEBUG);
-    Serial.println("Target Weight Received: " + String(targetWeight));
-    Serial.write(VERBOSE_DEBUG);
-    Serial.println("Time Limit Received: " + String(timeLimit));
+    send_text(VERBOSE_DEBUG, "Target Weight Received: " + String(targetWeight));
+    send_text(VERBOSE_DEBUG, "Time Limit Received: " + String(timeLimit));
 
     long currentWeight = scale.get_units(3);
     float trueWeight = get_true_weight(currentWeight);
-    Serial.write(VERBOSE_DEBUG);
-    Serial.print("Current Weight: ");
-    Serial.println(currentWeight);
+    send_text(VERBOSE_DEBUG, String("Current Weight: ") + String(currentWeight));
 
     if (trueWeight > 0.2 * targetWeight) {
         digitalWrite(LED_PIN, LOW);
@@ -359,7 +660,7 @@ void fill() {
     unsigned long fillStartTime = millis();
     unsigned long fillEndTime = fillStartTime + timeLimit;
 
-    Serial.write(BEGIN_FILL);
+    send_byte(BEGIN_FILL);
 
     while (scale.get_units(3) < targetWeight) {
         unsigned long now = millis();
@@ -368,8 +669,8 @@ void fill() {
 
         // Max weight check during fill
         if (trueWeight >= SCALE_MAX_GRAMS) {
-            Serial.write(MAX_WEIGHT_WARNING);
-            Serial.println("<ERR:MAX WEIGHT DURING FILL>");
+            send_byte(MAX_WEIGHT_WARNING);
+            send_text(NO_OPCODE, "<ERR:MAX WEIGHT DURING FILL>");
             digitalWrite(RELAY_PIN, HIGH);
             digitalWrite(LED_PIN, HIGH);
             handle_max_weight_block();
@@ -379,34 +680,29 @@ void fill() {
             continue;
         }
 
-        Serial.write(CURRENT_WEIGHT);
-        Serial.write((byte*)&currentWeight, sizeof(currentWeight));
+        send_weight(currentWeight);
+        service_link();
         if (now >= fillEndTime) {
             digitalWrite(RELAY_PIN, HIGH);
             digitalWrite(LED_PIN, LOW);
 
             long finalWeight = scale.get_units(3);
-            Serial.write(FINAL_WEIGHT);
-            Serial.write((byte*)&finalWeight, sizeof(finalWeight));
+            send_value(FINAL_WEIGHT, finalWeight);
             unsigned long fillTime = now - fillStartTime;
-            Serial.write(FILL_TIME);
-            Serial.write((byte*)&fillTime, sizeof(fillTime));
+            send_value(FILL_TIME, fillTime);
             return;
         }
     }
 
     digitalWrite(RELAY_PIN, HIGH);
-    Serial.write(VERBOSE_DEBUG);
-    Serial.println("TARGET WEIGHT REACHED");
+    send_text(VERBOSE_DEBUG, "TARGET WEIGHT REACHED");
     digitalWrite(LED_PIN, LOW);
 
     long finalWeight = scale.get_units(3);
-    Serial.write(FINAL_WEIGHT);
-    Serial.write((byte*)&finalWeight, sizeof(finalWeight));
+    send_value(FINAL_WEIGHT, finalWeight);
 
     unsigned long fillTime = millis() - fillStartTime;
-    Serial.write(FILL_TIME);
-    Serial.write((byte*)&fillTime, sizeof(fillTime));
+    send_value(FILL_TIME, fillTime);
 }
 
 void manual_fill() {
@@ -420,8 +716,8 @@ void manual_fill() {
 
             // Max weight check during manual idle
             if (trueWeight >= SCALE_MAX_GRAMS) {
-                Serial.write(MAX_WEIGHT_WARNING);
-                Serial.println("<ERR:MAX WEIGHT DURING MANUAL (IDLE)>");
+                send_byte(MAX_WEIGHT_WARNING);
+                send_text(NO_OPCODE, "<ERR:MAX WEIGHT DURING MANUAL (IDLE)>");
                 digitalWrite(RELAY_PIN, HIGH);
                 digitalWrite(LED_PIN, HIGH);
                 handle_max_weight_block();
@@ -431,12 +727,11 @@ void manual_fill() {
                 continue;
             }
 
-            Serial.write(CURRENT_WEIGHT);
-            Serial.write((byte*)&weight, sizeof(weight));
+            send_weight(weight);
             digitalWrite(LED_PIN, LOW);
 
-            if (Serial.available() > 0) {
-                byte msg = Serial.read();
+            int msg = read_command();
+            if (msg >= 0) {
                 if (msg == EXIT_MANUAL_END) return;
             }
         }
@@ -448,8 +743,8 @@ void manual_fill() {
 
             // Max weight check during manual fill
             if (trueWeight >= SCALE_MAX_GRAMS) {
-                Serial.write(MAX_WEIGHT_WARNING);
-                Serial.println("<ERR:MAX WEIGHT DURING MANUAL>");
+                send_byte(MAX_WEIGHT_WARNING);
+                send_text(NO_OPCODE, "<ERR:MAX WEIGHT DURING MANUAL>");
                 digitalWrite(RELAY_PIN, HIGH);
                 digitalWrite(LED_PIN, HIGH);
                 handle_max_weight_block();
@@ -460,11 +755,10 @@ void manual_fill() {
             }
 
             digitalWrite(LED_PIN, HIGH);
-            Serial.write(CURRENT_WEIGHT);
-            Serial.write((byte*)&weight, sizeof(weight));
+            send_weight(weight);
 
-            if (Serial.available() > 0) {
-                byte msg = Serial.read();
+            int msg = read_command();
+            if (msg >= 0) {
                 if (msg == MANUAL_FILL_END) {
                     digitalWrite(RELAY_PIN, HIGH);
                     return;
@@ -478,27 +772,33 @@ void manual_fill() {
 void smart_fill() {
     tare_and_update_offset();
 
-    Serial.write(REQUEST_TARGET_WEIGHT);
+    send_byte(REQUEST_TARGET_WEIGHT);
     String receivedData = "";
     float targetWeight = 0.0;
+    unsigned long requestedAt = millis();
 
     while (true) {
-        if (Serial.available() > 0) {
-            byte messageType = Serial.read();
+        int messageType = read_command();
+        if (messageType >= 0) {
             if (messageType == TARGET_WEIGHT) {
                 receivedData = Serial.readStringUntil('\n');
                 targetWeight = receivedData.toFloat();
                 break;
             } else if (messageType == RELAY_DEACTIVATED) {
-                Serial.println("E-Stop activated. Aborting smart fill.");
+                send_text(NO_OPCODE, "E-Stop activated. Aborting smart fill.");
                 digitalWrite(LED_PIN, LOW);
                 return;
             }
         }
+        if (millis() - requestedAt >= TARGET_WEIGHT_TIMEOUT) {
+            send_text(VERBOSE_DEBUG, "No target weight from host. Aborting smart fill.");
+            digitalWrite(LED_PIN, LOW);
+            return;
+        }
     }
 
     digitalWrite(RELAY_PIN, HIGH);
-    Serial.write(SMART_FILL_START);
+    send_byte(SMART_FILL_START);
 
     long baselineWeight = scale.get_units(3);
     long startWeight = baselineWeight;
@@ -535,8 +835,8 @@ void smart_fill() {
 
         // Max weight check during smart fill
         if (trueWeight >= SCALE_MAX_GRAMS) {
-            Serial.write(MAX_WEIGHT_WARNING);
-            Serial.println("<ERR:MAX WEIGHT DURING SMART>");
+            send_byte(MAX_WEIGHT_WARNING);
+            send_text(NO_OPCODE, "<ERR:MAX WEIGHT DURING SMART>");
             digitalWrite(RELAY_PIN, HIGH);
             digitalWrite(LED_PIN, HIGH);
             handle_max_weight_block();
@@ -546,8 +846,8 @@ void smart_fill() {
             continue;
         }
 
-        Serial.write(CURRENT_WEIGHT);
-        Serial.write((byte*)&weight, sizeof(weight));
+        send_weight(weight);
+        service_link();
 
         if (weight >= (targetWeight * 0.5)) {
             halfWeight = weight;
@@ -576,8 +876,8 @@ void smart_fill() {
 
         // Max weight check during smart fill
         if (trueWeight >= SCALE_MAX_GRAMS) {
-            Serial.write(MAX_WEIGHT_WARNING);
-            Serial.println("<ERR:MAX WEIGHT DURING SMART>");
+            send_byte(MAX_WEIGHT_WARNING);
+            send_text(NO_OPCODE, "<ERR:MAX WEIGHT DURING SMART>");
             digitalWrite(RELAY_PIN, HIGH);
             digitalWrite(LED_PIN, HIGH);
             handle_max_weight_block();
@@ -587,39 +887,33 @@ void smart_fill() {
             continue;
         }
 
-        Serial.write(CURRENT_WEIGHT);
-        Serial.write((byte*)&weight, sizeof(weight));
+        send_weight(weight);
+        service_link();
         delay(10);
     }
-    Serial.print("Final weight: ");
-    Serial.println(endWeight);
+    send_text(NO_OPCODE, String("Final weight: ") + String(endWeight));
     digitalWrite(RELAY_PIN, LOW);
-    Serial.write(SMART_FILL_END);
+    send_byte(SMART_FILL_END);
 
     endWeight = scale.get_units(3);
     endTime = millis();
 
-    Serial.write(VERBOSE_DEBUG);
-    Serial.print("Flow rate (g/ms): ");
-    Serial.println(flowRate, 6);
-    Serial.write(VERBOSE_DEBUG);
-    Serial.print("Final weight: ");
-    Serial.println(endWeight);
+    send_text(VERBOSE_DEBUG, String("Flow rate (g/ms): ") + String(flowRate, 6));
+    send_text(VERBOSE_DEBUG, String("Final weight: ") + String(endWeight));
 }
 
 // ================== CALIBRATION ====================
 
 void recalibrate() {
-    Serial.println("Starting recalibration...");
+    send_text(NO_OPCODE, "Starting recalibration...");
     digitalWrite(LED_PIN, HIGH);
 
     // Step 1: Clear scale
     while (true) {
         long weight = scale.get_units(3);
-        Serial.write(CURRENT_WEIGHT);
-        Serial.write((byte*)&weight, sizeof(weight));
-        if (Serial.available() > 0) {
-            byte msg = Serial.read();
+        send_weight(weight);
+        int msg = read_command();
+        if (msg >= 0) {
             if (msg == CALIBRATION_CONTINUE) break;
         }
     }
@@ -627,27 +921,27 @@ void recalibrate() {
     tare_and_update_offset();
     scale.set_scale();
     tare_and_update_offset();
-    long cWeight1 = scale.get_units(10);
-    delay(500);
-    Serial.write(CALIBRATION_STEP_DONE);
+    long cWeight1 = get_units_alive(10);
+    wait_ms(500);
+    send_byte(CALIBRATION_STEP_DONE);
 
     // Step 2: Place calibration weight
     while (true) {
-        if (Serial.available() > 0) {
-            byte msg = Serial.read();
+        int msg = read_command();
+        if (msg >= 0) {
             if (msg == CALIBRATION_WEIGHT) {
                 String receivedData = Serial.readStringUntil('\n');
                 calibWeight = receivedData.toFloat();
                 delay(100);
-                Serial.write(CALIBRATION_STEP_DONE);
+                send_byte(CALIBRATION_STEP_DONE);
                 delay(200);
                 break;
             }
         }
     }
-    long cWeight2 = scale.get_units(10);
-    delay(500);
-    Serial.write(CALIBRATION_STEP_DONE);
+    long cWeight2 = get_units_alive(10);
+    wait_ms(500);
+    send_byte(CALIBRATION_STEP_DONE);
 
     // Step 3: Calculate and set new calibration value
     float delta = cWeight2 - cWeight1;
@@ -655,7 +949,6 @@ void recalibrate() {
         scaleCalibration = delta / calibWeight;
         scale.set_scale(scaleCalibration);
     }
-    Serial.write(CALIBRATION_WEIGHT);
-    Serial.println(scaleCalibration);
-    Serial.write(CALIBRATION_STEP_DONE);
+    send_text(CALIBRATION_WEIGHT, String(scaleCalibration));
+    send_byte(CALIBRATION_STEP_DONE);
 }
\ No newline at end of file
@@ -0,0 +1,317 @@
+import asyncio
+import collections
+import logging
+import re
+import time
+import serial
+import config
+from frame_decoder import make_decoder, negotiated_protocol, offered_baud, confirm_id_for
+from serial_engine import LINK_LOST, EVENT_QUEUE_SIZE
+
+# Handshake timeouts, matching the 60 x 0.1 s and 40 x 0.1 s polling loops of the sync path
+SERIAL_REPLY_TIMEOUT = 6.0
+CALIBRATION_REQUEST_TIMEOUT = 4.0
+
+SERIAL_PATTERN = re.compile(rb"<SERIAL:([A-Z\-]*SN\d{3,4})>")
+
+
+class QtAsyncioBridge:
+    """
+    Runs an asyncio event loop inside the PyQt6 event loop.
+    A QTimer steps the asyncio loop once per tick, so coroutines run on the
+    GUI thread between Qt events and never block the screen.
+    """
+    def __init__(self, interval_ms=5):
+        self.loop = asyncio.new_event_loop()
+        self.interval_ms = interval_ms
+        self._timer = None
+
+    def start(self):
+        from PyQt6.QtCore import QTimer
+        if self._timer is None:
+            self._timer = QTimer()
+            self._timer.timeout.connect(self.step)
+        self._timer.start(self.interval_ms)
+
+    def step(self):
+        """Run every asyncio callback that is ready right now, then return."""
+        if self.loop.is_running() or self.loop.is_closed():
+            return
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+    def create_task(self, coro):
+        return self.loop.create_task(coro)
+
+    def run_until_complete(self, coro, app=None):
+        """Drive coro to completion while keeping Qt responsive (for startup steps)."""
+        task = self.loop.create_task(coro)
+        while not task.done():
+            self.step()
+            if app is not None:
+                app.processEvents()
+            time.sleep(self.interval_ms / 1000.0)
+        return task.result()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.stop()
+        if self.loop.is_closed():
+            return
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+        self.step()
+        self.loop.close()
+
+
+class AsyncSerialPort:
+    """Awaitable reads on a pyserial port, fed by loop.add_reader."""
+    def __init__(self, arduino, loop):
+        self.arduino = arduino
+        self.loop = loop
+        self.buffer = bytearray()
+        self._waiter = None
+        self._error = None
+        self._fd = arduino.fileno()
+        loop.add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            size = self.arduino.in_waiting
+            data = self.arduino.read(size if size > 0 else 1)
+            self.buffer += data
+        except serial.SerialException as e:
+            self._error = e
+            self.detach()
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def wait_for_data(self):
+        if self._error is not None:
+            raise self._error
+        self._waiter = self.loop.create_future()
+        await self._waiter
+        if self._error is not None:
+            raise self._error
+
+    def write(self, data):
+        self.arduino.write(data)
+        self.arduino.flush()
+
+    def detach(self):
+        """Stop watching the port (the port itself stays open)."""
+        if self._fd is not None:
+            self.loop.remove_reader(self._fd)
+            self._fd = None
+
+
+async def read_station_serial(port_stream):
+    """
+    Wait for the '<SERIAL:PM-SNxxxx>' reply line, ignoring anything else.
+    Returns (serial number, protocol version, fastest baud rate) as offered on that line.
+    """
+    while True:
+        buffer = port_stream.buffer
+        match = SERIAL_PATTERN.search(buffer)
+        if match:
+            line_end = buffer.find(b'\n', match.end())
+            if line_end >= 0:
+                station_serial_number = match.group(1).decode()
+                offer = bytes(buffer[match.end():line_end])
+                del buffer[:line_end + 1]
+                return station_serial_number, negotiated_protocol(offer), offered_baud(offer)
+        await port_stream.wait_for_data()
+
+
+async def wait_for_byte(port_stream, wanted):
+    """Wait until the byte wanted arrives, discarding everything before it."""
+    while True:
+        index = port_stream.buffer.find(wanted)
+        if index >= 0:
+            del port_stream.buffer[:index + 1]
+            return
+        port_stream.buffer.clear()
+        await port_stream.wait_for_data()
+
+
+async def handshake_arduino(port, station_serials, scale_calibrations, DEBUG=False):
+    """
+    Open port and run the PMID handshake and calibration exchange.
+    Returns (station_index, arduino) on success or None.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    try:
+        arduino = serial.Serial(port, config.DEFAULT_BAUD, timeout=0.5)
+    except Exception as e:
+        logging.error(f"Error opening {port}: {e}")
+        if DEBUG:
+            print(f"[async_serial] Error opening {port}: {e}")
+        return None
+
+    port_stream = AsyncSerialPort(arduino, loop)
+    try:
+        # Send RESET_HANDSHAKE before PMID to allow handshake restart
+        port_stream.write(config.RESET_HANDSHAKE)
+        await asyncio.sleep(0.05)
+        for b in b'PMID':
+            port_stream.write(bytes([b]))
+            await asyncio.sleep(0.01)
+
+        station_serial_number, protocol_version, fastest_baud = await asyncio.wait_for(read_station_serial(port_stream), SERIAL_REPLY_TIMEOUT)
+        if DEBUG:
+            print(f"[async_serial] Station serial {station_serial_number} detected on {port}")
+        matched_entry = None
+        for entry in station_serials:
+            if entry and station_serial_number in entry:
+                matched_entry = entry
+                break
+        if matched_entry is None:
+            if DEBUG:
+                print(f"[async_serial] No recognized station detected on port {port}, skipping...")
+            arduino.close()
+            return None
+        station_index = station_serials.index(matched_entry)
+
+        port_stream.write(confirm_id_for(protocol_version))
+        await asyncio.wait_for(wait_for_byte(port_stream, config.REQUEST_CALIBRATION), CALIBRATION_REQUEST_TIMEOUT)
+        if DEBUG:
+            print(f"[async_serial] Station {station_index+1}: REQUEST_CALIBRATION received, sending calibration: {scale_calibrations[station_index]}")
+        port_stream.write(config.REQUEST_CALIBRATION + f"{scale_calibrations[station_index]}\n".encode('utf-8'))
+        # The station frames everything after the calibration reply if it accepted v2
+        arduino.protocol_version = protocol_version
+        # The switch-over is a short blocking exchange; keep it off the loop
+        port_stream.detach()
+        from startup import negotiate_baud
+        await loop.run_in_executor(None, negotiate_baud, arduino, fastest_baud, DEBUG)
+        if DEBUG:
+            print(f"[async_serial] Station {station_index+1} on {port} ready after {time.monotonic() - started:.2f} s (protocol v{protocol_version}, {arduino.baudrate} baud)")
+        return station_index, arduino
+    except asyncio.TimeoutError:
+        if DEBUG:
+            print(f"[async_serial] Handshake timed out on {port} after {time.monotonic() - started:.2f} s")
+        logging.error(f"Handshake timed out on {port}")
+        arduino.close()
+        return None
+    except Exception as e:
+        logging.error(f"Error initializing Arduino on {port}: {e}")
+        if DEBUG:
+            print(f"[async_serial] Error initializing Arduino on {port}: {e}")
+        arduino.close()
+        return None
+    finally:
+        port_stream.detach()
+
+
+async def connect_arduinos(ports, num_stations, station_serials, scale_calibrations, DEBUG=False):
+    """Handshake every port concurrently and return (station_connected, arduinos)."""
+    station_connected = [False] * num_stations
+    arduinos = [None] * num_stations
+    results = await asyncio.gather(
+        *(handshake_arduino(port, station_serials, scale_calibrations, DEBUG) for port in ports)
+    )
+    for result in results:
+        if result is None:
+            continue
+        station_index, arduino = result
+        if arduinos[station_index] is not None:
+            logging.error(f"Station {station_index+1} answered on two ports, keeping the first")
+            arduino.close()
+            continue
+        arduinos[station_index] = arduino
+        station_connected[station_index] = True
+    return station_connected, arduinos
+
+
+def step_connect_arduinos_async(context):
+    """asyncio variant of startup.step_connect_arduinos."""
+    try:
+        print("Step: Connect and initialize Arduinos (asyncio)")
+        bridge = context['async_bridge']
+        config_module = context['config']
+        station_connected, arduinos = bridge.run_until_complete(
+            connect_arduinos(
+                getattr(config_module, 'arduino_ports', []),
+                context['NUM_STATIONS'],
+                context['station_serials'],
+                context['scale_calibrations'],
+                context.get('DEBUG', False),
+            ),
+            context.get('app'),
+        )
+        context['station_connected'] = station_connected
+        context['arduinos'] = arduinos
+        print(f"[DEBUG] Final station_connected: {context['station_connected']}")
+        print(f"[DEBUG] Final arduinos: {context['arduinos']}")
+        return 'completed'
+    except Exception as e:
+        logging.error(f"Error in step_connect_arduinos_async: {e}")
+        print(f"[ERROR] Exception in step_connect_arduinos_async: {e}")
+
+
+class AsyncSerialEngine:
+    """
+    Serial engine that streams every station on the asyncio loop of a QtAsyncioBridge.
+    Produces the same (station_index, arduino, message_type, payload, received_at) events as
+    the threaded and selector engines.
+    """
+    def __init__(self, bridge, maxsize=EVENT_QUEUE_SIZE, watchdog=None):
+        self.bridge = bridge
+        self.loop = bridge.loop
+        self.maxsize = maxsize
+        self.watchdog = watchdog
+        self.events = collections.deque()
+        self.dropped_samples = 0
+        self._stations = {}  # station_index -> file descriptor
+
+    def start(self, arduinos):
+        for station_index, arduino in enumerate(arduinos):
+            if arduino is not None:
+                self.attach(station_index, arduino)
+        self.bridge.start()
+
+    def attach(self, station_index, arduino):
+        self.detach(station_index)
+        fd = arduino.fileno()
+        self.loop.add_reader(fd, self._on_readable, station_index, arduino, make_decoder(arduino))
+        self._stations[station_index] = fd
+        if config.DEBUG:
+            print(f"[AsyncSerialEngine] Streaming station {station_index+1}")
+
+    def detach(self, station_index):
+        fd = self._stations.pop(station_index, None)
+        if fd is not None and not self.loop.is_closed():
+            self.loop.remove_reader(fd)
+
+    def stop(self):
+        for station_index in list(self._stations):
+            self.detach(station_index)
+        self.bridge.stop()
+
+    def drain(self, max_events=None):
+        """Yield queued events; everything runs on the GUI thread, so no locking."""
+        count = 0
+        events = self.events
+        while events and (max_events is None or count < max_events):
+            yield events.popleft()
+            count += 1
+
+    def _post(self, event):
+        if len(self.events) >= self.maxsize and event[2] == config.CURRENT_WEIGHT:
+            self.dropped_samples += 1
+            return
+        self.events.append(event)
+
+    def _on_readable(self, station_index, arduino, decoder):
+        try:
+            decoder.read_from(arduino, block=True)
+            received_at = decoder.received_at
+            for message_type, payload in decoder.decode():
+                if self.watchdog is not None:
+                    self.watchdog.feed(station_index, message_type, received_at)
+                self._post((station_index, arduino, message_type, payload, received_at))
+        except serial.SerialException as e:
+            self.detach(station_index)
+            self._post((station_index, arduino, LINK_LOST, str(e).encode('utf-8', errors='replace'), time.monotonic()))
+        except Exception as e:
+            logging.error(f"Station {station_index+1}: error in async serial reader: {e}")
@@ -0,0 +1,147 @@
+"""
+Microbenchmark: decode + dispatch cost per serial frame.
+
+Compares the old dispatch (a fresh ctx dict per message, MESSAGE_HANDLERS.get()
+and **ctx expansion) against the 256-entry HANDLER_TABLE with one long-lived
+HandlerContext. Handlers are no-ops so only the dispatch overhead is measured.
+
+Run from the raspberry_pi directory:
+    python benchmarks/bench_dispatch.py [--frames N] [--repeat R]
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from frame_decoder import FrameDecoder
+from message_handlers import HandlerContext, MESSAGE_HANDLERS, build_handler_table
+
+NUM_STATIONS = 4
+
+
+def make_stream(frames):
+    """A fill-like stream: mostly CURRENT_WEIGHT, with the occasional status byte and debug line."""
+    chunks = []
+    for i in range(frames):
+        if i % 50 == 49:
+            chunks.append(config.VERBOSE_DEBUG + b"loop ok\n")
+        elif i % 20 == 19:
+            chunks.append(config.BEGIN_AUTO_FILL)
+        else:
+            chunks.append(config.CURRENT_WEIGHT + struct.pack('<i', i % 600))
+    return b''.join(chunks)
+
+
+def noop_legacy(station_index, arduino, payload, **ctx):
+    pass
+
+
+def noop_table(station_index, arduino, payload, ctx):
+    pass
+
+
+def noop_unknown_legacy(station_index, arduino, message_type, payload, **ctx):
+    pass
+
+
+def noop_unknown_table(station_index, arduino, message_type, payload, ctx):
+    pass
+
+
+LEGACY_HANDLERS = {message_type: noop_legacy for message_type in MESSAGE_HANDLERS}
+TABLE_HANDLERS = build_handler_table({message_type: noop_table for message_type in MESSAGE_HANDLERS})
+
+
+def run_decode_only(stream, chunk_size):
+    decoder = FrameDecoder()
+    count = 0
+    for start in range(0, len(stream), chunk_size):
+        decoder.feed(stream[start:start + chunk_size])
+        count += len(decoder.decode())
+    return count
+
+
+def run_legacy(stream, chunk_size):
+    decoder = FrameDecoder()
+    count = 0
+    app = object()
+    for start in range(0, len(stream), chunk_size):
+        decoder.feed(stream[start:start + chunk_size])
+        for message_type, payload in decoder.decode():
+            station_index = count % NUM_STATIONS
+            ctx = {
+                'FILL_LOCKED': False,
+                'DEBUG': False,
+                'target_weight': 500.0,
+                'scale_calibrations': [],
+                'time_limit': 3000,
+                'active_dialog': None,
+                'station_widgets': None,
+                'refresh_ui': None,
+                'app': app,
+            }
+            handler = LEGACY_HANDLERS.get(message_type)
+            if handler:
+                handler(station_index, None, payload, **ctx)
+            else:
+                noop_unknown_legacy(station_index, None, message_type, payload, **ctx)
+            count += 1
+    return count
+
+
+def run_table(stream, chunk_size):
+    decoder = FrameDecoder()
+    count = 0
+    ctx = HandlerContext(app=object())
+    table = TABLE_HANDLERS
+    for start in range(0, len(stream), chunk_size):
+        decoder.feed(stream[start:start + chunk_size])
+        for message_type, payload in decoder.decode():
+            station_index = count % NUM_STATIONS
+            handler = table[message_type[0]]
+            if handler is None:
+                noop_unknown_table(station_index, None, message_type, payload, ctx)
+            else:
+                handler(station_index, None, payload, ctx)
+            count += 1
+    return count
+
+
+def best_time(func, stream, chunk_size, repeat):
+    best = None
+    frames = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        frames = func(stream, chunk_size)
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode + dispatch cost per frame")
+    parser.add_argument("--frames", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--chunk", type=int, default=64, help="bytes per simulated serial read")
+    args = parser.parse_args()
+
+    stream = make_stream(args.frames)
+    print(f"{args.frames} frames, {len(stream)} bytes, {args.chunk}-byte reads, best of {args.repeat}")
+    results = {}
+    for name, func in (("decode only", run_decode_only), ("dict + **ctx (before)", run_legacy), ("table + slots (after)", run_table)):
+        elapsed, frames = best_time(func, stream, args.chunk, args.repeat)
+        results[name] = elapsed / frames * 1e9
+        print(f"  {name:<24} {results[name]:8.0f} ns/frame")
+    decode = results["decode only"]
+    before = results["dict + **ctx (before)"] - decode
+    after = results["table + slots (after)"] - decode
+    print(f"  dispatch overhead: {before:.0f} -> {after:.0f} ns/frame ({before / after if after > 0 else float('inf'):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
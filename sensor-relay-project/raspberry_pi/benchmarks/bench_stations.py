@@ -0,0 +1,245 @@
+"""
+Station-count scaling benchmark: can the host keep up with 8 or 16 stations?
+
+For each station count, a child process (PM_NUM_STATIONS=<n>, Qt offscreen)
+starts scale_simulator.py with that many stations running fill cycles as a
+process of its own (as the boards are on the machine, the simulated firmware
+does not share the host's interpreter), handshakes them, starts the serial
+engine and drives main.poll_hardware against a real RelayControlApp on the
+GUI timer's 35 ms period. It reports:
+  tick rate and tick duration (p50/p99): does the GUI hold its frame rate?
+  weight samples/s taken in from all stations
+  sample-to-pixel latency (display_latency.py) on the main screen, p50/p99
+
+A station count fails when tick p99 exceeds --tick-budget or display p99
+exceeds --latency-budget; the exit status is 1 if any count failed.
+With --label the numbers are added to that run in benchmarks/results.json,
+so bench_suite.py compare tracks them too.
+
+Run from the raspberry_pi directory:
+    python benchmarks/bench_stations.py [--stations 4 8 16] [--seconds 20] [--engine threaded]
+With --engine process the serial ports live in hardware_process.py's child
+process and the GUI side only reads the shared station table.
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# GUI timer period of main.py
+TICK = 0.035
+RESULT_PREFIX = "RESULT "
+SIMULATOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scale_simulator.py")
+# Seconds to wait for scale_simulator.py to print its ports
+SIMULATOR_START_TIMEOUT = 10.0
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def start_simulator(num_stations, link_dir):
+    """scale_simulator.py in its own process; returns (process, serial numbers, ports)."""
+    serials = [f"PM-SN{i+1:04d}" for i in range(num_stations)]
+    process = subprocess.Popen(
+        [sys.executable, SIMULATOR, "--stations", str(num_stations), "--serials", ",".join(serials),
+         "--link-dir", link_dir, "--cycle", "--seed", "1"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    deadline = time.monotonic() + SIMULATOR_START_TIMEOUT
+    while time.monotonic() < deadline:
+        line = process.stdout.readline()
+        if not line:
+            break
+        if line.startswith("arduino_ports="):
+            # Keep draining its periodic reports so the pipe never fills up
+            threading.Thread(target=process.stdout.read, daemon=True).start()
+            return process, serials, line.strip().split("=", 1)[1].split(",")
+    process.kill()
+    raise RuntimeError(f"scale_simulator.py did not start {num_stations} stations")
+
+
+def stop_simulator(process):
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def measure(engine_name, seconds):
+    """Child process: one station count (taken from PM_NUM_STATIONS by config.py)."""
+    import config
+    config.DEBUG = False
+    config.SERIAL_ENGINE = engine_name
+    from bench_suite import quiet
+    from PyQt6.QtWidgets import QApplication
+    from serial_engine import create_serial_engine
+    from startup import handshake_port
+    from display_latency import PATH_MAIN
+    num_stations = config.NUM_STATIONS
+
+    with quiet():
+        app_qt = QApplication(sys.argv[:1])
+        import main as host
+        from gui.gui import RelayControlApp
+        host.DEBUG = False
+        host.handler_ctx.DEBUG = False
+        link_dir = tempfile.mkdtemp(prefix="pm-bench-")
+        sim, serials, ports = start_simulator(num_stations, link_dir)
+        calibrations = [1.0] * num_stations
+        if engine_name == "process":
+            from hardware_process import HardwareProcess
+            host.hardware_process = HardwareProcess(num_stations, station_serials=serials)
+            host.hardware_process.start()
+            handshake = lambda port: (*host.hardware_process.connect(port), None)
+        else:
+            handshake = lambda port: handshake_port(port, serials, calibrations, config, False)
+        with ThreadPoolExecutor(max_workers=num_stations) as executor:
+            handshakes = list(executor.map(handshake, ports))
+        for station_index, arduino, _ in handshakes:
+            if arduino is not None:
+                host.arduinos[station_index] = arduino
+        connected = sum(arduino is not None for arduino in host.arduinos)
+        host.station_enabled[:] = [True] * num_stations
+        config.RELAY_POWER_ENABLED = True
+        host.hardware_engine = create_serial_engine(engine_name, hardware_process=host.hardware_process)
+        if host.hardware_engine is not None:
+            host.hardware_engine.start(host.arduinos)
+
+        app = RelayControlApp(station_enabled=[True] * num_stations)
+        app.target_weight = 200
+        app.time_limit = 3000
+        app.filling_mode = "AUTO"
+        app.active_dialog = app
+        host.display_latency.attach(app.station_widgets, PATH_MAIN)
+        app_qt.processEvents()
+
+        samples_before = sum(host.weight_coalescer.total_samples)
+        durations = []
+        started = time.perf_counter()
+        deadline = started
+        while time.perf_counter() - started < seconds:
+            tick_started = time.perf_counter()
+            host.poll_hardware(app)
+            app_qt.processEvents()
+            durations.append(time.perf_counter() - tick_started)
+            deadline += TICK
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+        elapsed = time.perf_counter() - started
+        samples = sum(host.weight_coalescer.total_samples) - samples_before
+
+        if host.hardware_engine is not None:
+            host.hardware_engine.stop()
+        for arduino in host.arduinos:
+            if arduino is not None:
+                arduino.close()
+        if host.hardware_process is not None:
+            host.hardware_process.stop()
+        stop_simulator(sim)
+        shutil.rmtree(link_dir, ignore_errors=True)
+
+    latencies = []
+    for histogram in host.display_latency.histograms[PATH_MAIN]:
+        latencies.extend(histogram.recent)
+    return {
+        "stations": num_stations,
+        "connected": connected,
+        "tick_rate": len(durations) / elapsed,
+        "tick_p50_ms": percentile(durations, 50) * 1000,
+        "tick_p99_ms": percentile(durations, 99) * 1000,
+        "samples_per_s": samples / elapsed,
+        "display_p50_ms": percentile(latencies, 50) * 1000,
+        "display_p99_ms": percentile(latencies, 99) * 1000,
+        "repaints": len(latencies),
+    }
+
+
+def run_child(num_stations, engine_name, seconds):
+    env = dict(os.environ, PM_NUM_STATIONS=str(num_stations))
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", "--engine", engine_name, "--seconds", str(seconds)],
+        env=env, capture_output=True, text=True,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    sys.stderr.write(completed.stdout[-2000:] + completed.stderr[-2000:])
+    return None
+
+
+def save(label, results_path, rows):
+    from bench_suite import load_results, metric
+    results = load_results(results_path)
+    entry = results.setdefault(label, {"metrics": {}})
+    for row in rows:
+        prefix = f"stations{row['stations']}"
+        entry["metrics"].update({
+            f"{prefix}.tick_p99": metric(row["tick_p99_ms"], "ms", False),
+            f"{prefix}.samples_per_s": metric(row["samples_per_s"], "samples/s", True),
+            f"{prefix}.display_p99": metric(row["display_p99_ms"], "ms", False),
+        })
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Added to '{label}' in {results_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame rate and display latency at 4, 8 and 16 stations")
+    parser.add_argument("--stations", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--engine", default="threaded", choices=("threaded", "selector", "process", "poll"))
+    parser.add_argument("--seconds", type=float, default=20.0, help="measured time per station count")
+    parser.add_argument("--tick-budget", type=float, default=TICK * 1000, help="max tick p99 in ms")
+    parser.add_argument("--latency-budget", type=float, default=100.0, help="max display p99 in ms")
+    parser.add_argument("--label", help="also store the numbers under this label in the results file")
+    parser.add_argument("--results", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json"))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(RESULT_PREFIX + json.dumps(measure(args.engine, args.seconds)))
+        return
+
+    rows = []
+    failed = []
+    print(f"{args.engine} engine, {args.seconds:.0f} s per run, budgets: tick p99 {args.tick_budget:.0f} ms, "
+          f"display p99 {args.latency_budget:.0f} ms")
+    print(f"  {'stations':>8} {'ticks/s':>8} {'tick p50':>9} {'tick p99':>9} {'samples/s':>10} "
+          f"{'disp p50':>9} {'disp p99':>9}")
+    for num_stations in args.stations:
+        row = run_child(num_stations, args.engine, args.seconds)
+        if row is None:
+            print(f"  {num_stations:>8} run failed")
+            failed.append(num_stations)
+            continue
+        ok = (row["connected"] == num_stations and row["tick_p99_ms"] <= args.tick_budget
+              and row["display_p99_ms"] <= args.latency_budget)
+        if not ok:
+            failed.append(num_stations)
+        print(f"  {num_stations:>8} {row['tick_rate']:8.1f} {row['tick_p50_ms']:7.1f}ms {row['tick_p99_ms']:7.1f}ms "
+              f"{row['samples_per_s']:10.0f} {row['display_p50_ms']:7.1f}ms {row['display_p99_ms']:7.1f}ms"
+              f"{'' if ok else '  OVER BUDGET' if row['connected'] == num_stations else '  NOT ALL CONNECTED'}")
+        rows.append(row)
+    if args.label and rows:
+        save(args.label, args.results, rows)
+    if failed:
+        print(f"Over budget at {', '.join(str(n) for n in failed)} stations")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Benchmark suite for the host's hot paths, runnable without a display.
+
+  ingest.*     frames/s through main.poll_hardware and the message handlers,
+               fed from a synthetic stream or a serial_trace.py recording
+  set_weight   cost of one StationWidget.set_weight call
+  display.*    sample-to-pixel latency (display_latency.py) of the main screen
+               and wizard weight labels, one sample per event-loop pass
+  wizard.*     startup wizard: reading config, handshaking scale_simulator
+               stations, building the dialog and rendering each prompt
+  stats_log    final-weight lines/s through main.log_final_weight
+
+Every metric is the best of --repeat runs. Each run is stored under a label
+in a JSON results file; compare flags every metric that got worse than the
+baseline by more than the threshold and exits 1.
+
+Run from the raspberry_pi directory:
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_suite.py run --label baseline
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_suite.py run --trace logs/traces/serial_20250101_120000.pmt
+    python benchmarks/bench_suite.py compare baseline latest [--threshold 10]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from bench_dispatch import make_stream
+from frame_decoder import make_decoder
+from serial_trace import REPLAY_TICK, ReplaySerial, build_sessions, drive, prepare_host, read_trace
+
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+# Bytes per station released per poll_hardware tick in the synthetic stream
+SYNTHETIC_CHUNK = 512
+
+
+def metric(value, unit, higher_is_better):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Send the handlers' and widgets' prints to /dev/null while timing."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def synthetic_sessions(frames, clock):
+    """One v1 session per station, each releasing SYNTHETIC_CHUNK bytes per tick."""
+    stream = make_stream(frames)
+    sessions = []
+    for station_index in range(config.NUM_STATIONS):
+        port = ReplaySerial({"port": f"synthetic{station_index}", "protocol_version": 1}, clock)
+        for tick, start in enumerate(range(0, len(stream), SYNTHETIC_CHUNK)):
+            port.add(tick * REPLAY_TICK, stream[start:start + SYNTHETIC_CHUNK])
+        sessions.append((0.0, station_index, port))
+    return sessions
+
+
+def count_frames(sessions):
+    """Messages the host will decode from the sessions' bytes."""
+    total = 0
+    for _, _, port in sessions:
+        decoder = make_decoder(port)
+        for _, data in port._chunks:
+            decoder.feed(data)
+            total += len(decoder.decode())
+    return total
+
+
+def best_of(repeat, bench, *args):
+    """Run bench repeat times and keep each metric's best value."""
+    best = {}
+    for _ in range(repeat):
+        for name, entry in bench(*args).items():
+            kept = best.get(name)
+            if kept is None:
+                better = True
+            elif entry["higher_is_better"]:
+                better = entry["value"] > kept["value"]
+            else:
+                better = entry["value"] < kept["value"]
+            if better:
+                best[name] = entry
+    return best
+
+
+def bench_ingest(host, frames, trace):
+    """Frames/s through poll_hardware, on a virtual clock (no sleeping)."""
+    replay_time = [0.0]
+
+    def clock():
+        return replay_time[0]
+
+    def advance():
+        replay_time[0] += REPLAY_TICK
+
+    if trace:
+        sessions = build_sessions(read_trace(trace)[1], clock)
+    else:
+        sessions = synthetic_sessions(frames, clock)
+    decoded = count_frames(sessions)
+    with quiet():
+        started = time.perf_counter()
+        ticks = drive(host, sessions, clock, advance)
+        elapsed = time.perf_counter() - started
+    return {
+        "ingest.frames_per_s": metric(decoded / elapsed, "frames/s", True),
+        "ingest.us_per_tick": metric(elapsed / ticks * 1e6, "us/tick", False),
+    }
+
+
+def bench_set_weight(app_qt, calls):
+    from gui.gui import StationWidget
+    with quiet():
+        widget = StationWidget(1, config.STATION_COLORS[0])
+        widget.resize(400, 300)
+        widget.show()
+        app_qt.processEvents()
+        started = time.perf_counter()
+        for i in range(calls):
+            widget.set_weight(i % 600, 500.0, "g")
+        elapsed = time.perf_counter() - started
+        widget.close()
+    return {"set_weight": metric(elapsed / calls * 1e6, "us/call", False)}
+
+
+def bench_display_latency(app_qt, renders):
+    from display_latency import DisplayLatency, PATH_MAIN, PATH_WIZARD
+    from gui.gui import StationBoxWidget, StationWidget
+    tracker = DisplayLatency(1)
+    results = {}
+    with quiet():
+        for path, widget in (
+            (PATH_MAIN, StationWidget(1, config.STATION_COLORS[0])),
+            (PATH_WIZARD, StationBoxWidget(0, "Station 1", config.STATION_COLORS[0], connected=True, enabled=True)),
+        ):
+            widget.resize(400, 300)
+            widget.show()
+            app_qt.processEvents()
+            tracker.attach([widget], path)
+            for i in range(renders):
+                weight = i % 600
+                tracker.arrived(0, weight, time.monotonic())
+                tracker.shown(0, path, widget.set_weight(weight, 500.0, "g"))
+                app_qt.processEvents()
+            widget.close()
+            latency = tracker.percentiles(0, path)
+            if latency:
+                results[f"display.{path}_p50"] = metric(latency[50] * 1000, "ms", False)
+                results[f"display.{path}_p99"] = metric(latency[99] * 1000, "ms", False)
+    return results
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - started) * 1000, result
+
+
+def bench_wizard(app_qt, stations, renders):
+    """The wizard steps that need no operator, and the rendering of each interactive prompt."""
+    import startup
+    from gui.gui import StartupWizardDialog
+    from scale_simulator import ScaleSimulator
+    results = {}
+    context = {
+        'NUM_STATIONS': config.NUM_STATIONS,
+        'config': config,
+        'config_file': "config.txt",
+        'DEBUG': False,
+    }
+    with quiet():
+        elapsed, _ = timed(startup.step_load_serials_and_ranges, context)
+        results["wizard.load_serials_and_ranges"] = metric(elapsed, "ms", False)
+
+        with tempfile.TemporaryDirectory() as link_dir:
+            sim = ScaleSimulator(stations, serial_numbers=context['station_serials'], link_dir=link_dir, seed=1)
+            saved_ports = list(config.arduino_ports)
+            sim.start()
+            try:
+                config.arduino_ports[:] = sim.ports
+                elapsed, _ = timed(startup.step_connect_arduinos, context)
+                results["wizard.connect_arduinos"] = metric(elapsed, "ms", False)
+                context['station_enabled'] = [True] * config.NUM_STATIONS
+                elapsed, _ = timed(startup.step_tare_scales, context)
+                results["wizard.tare_scales"] = metric(elapsed, "ms", False)
+            finally:
+                for arduino in context.get('arduinos', []):
+                    if arduino is not None:
+                        arduino.close()
+                config.arduino_ports[:] = saved_ports
+                sim.stop()
+
+        elapsed, wizard = timed(StartupWizardDialog, None, config.NUM_STATIONS, context.get('bottle_ranges'))
+        results["wizard.create_dialog"] = metric(elapsed, "ms", False)
+        wizard.set_station_labels(
+            names=[f"Station {i+1}" for i in range(config.NUM_STATIONS)],
+            connected=[True] * config.NUM_STATIONS,
+            enabled=[True] * config.NUM_STATIONS,
+        )
+        wizard.show()
+        bottle_ranges = context.get('bottle_ranges') or {}
+        full_ranges = {name: bottle_ranges[name]["full"] for name in bottle_ranges}
+        empty_range = next(iter(bottle_ranges.values()))["empty"] if bottle_ranges else (0, 0)
+        prompts = (
+            ("station_verification", wizard.show_station_verification),
+            ("empty_scale_prompt", wizard.show_empty_scale_prompt),
+            ("full_bottle_prompt", lambda: wizard.show_full_bottle_prompt(full_ranges)),
+            ("empty_bottle_prompt", lambda: wizard.show_empty_bottle_prompt(empty_range)),
+        )
+        for name, show in prompts:
+            started = time.perf_counter()
+            for _ in range(renders):
+                show()
+                wizard.repaint()
+                app_qt.processEvents()
+            results[f"wizard.{name}"] = metric((time.perf_counter() - started) / renders * 1000, "ms", False)
+        wizard.close()
+    return results
+
+
+def bench_stats_log(host, lines):
+    with tempfile.TemporaryDirectory() as log_dir:
+        saved = host.STATS_LOG_DIR, host.STATS_LOG_FILE
+        host.STATS_LOG_DIR = log_dir
+        host.STATS_LOG_FILE = os.path.join(log_dir, "stats.log")
+        try:
+            started = time.perf_counter()
+            for i in range(lines):
+                host.log_final_weight(i % config.NUM_STATIONS, 500 + i % 10)
+            elapsed = time.perf_counter() - started
+        finally:
+            host.STATS_LOG_DIR, host.STATS_LOG_FILE = saved
+    return {"stats_log": metric(lines / elapsed, "lines/s", True)}
+
+
+def run(args):
+    from PyQt6.QtWidgets import QApplication
+    host = prepare_host()
+    app_qt = QApplication.instance() or QApplication(sys.argv[:1])
+    metrics = {}
+    print(f"ingest ({'trace ' + args.trace if args.trace else f'{args.frames} synthetic frames per station'})...")
+    metrics.update(best_of(args.repeat, bench_ingest, host, args.frames, args.trace))
+    print("set_weight...")
+    metrics.update(best_of(args.repeat, bench_set_weight, app_qt, args.calls))
+    print("display latency...")
+    metrics.update(best_of(args.repeat, bench_display_latency, app_qt, args.renders * 10))
+    if not args.skip_wizard:
+        print("wizard...")
+        metrics.update(best_of(args.repeat, bench_wizard, app_qt, args.stations, args.renders))
+    print("stats_log...")
+    metrics.update(best_of(args.repeat, bench_stats_log, host, args.lines))
+
+    for name, entry in metrics.items():
+        print(f"  {name:<36} {entry['value']:12.3f} {entry['unit']}")
+    results = load_results(args.results)
+    results[args.label] = {
+        "recorded": datetime.now().isoformat(timespec="seconds"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "stream": args.trace or f"synthetic:{args.frames}",
+        "repeat": args.repeat,
+        "metrics": metrics,
+    }
+    with open(args.results, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Saved as '{args.label}' in {args.results}")
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def compare(args):
+    results = load_results(args.results)
+    for label in (args.baseline, args.current):
+        if label not in results:
+            print(f"No run labelled '{label}' in {args.results}")
+            return 2
+    baseline = results[args.baseline]["metrics"]
+    current = results[args.current]["metrics"]
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        before = baseline[name]["value"]
+        after = current[name]["value"]
+        change = (after - before) / before * 100 if before else 0.0
+        worse = -change if baseline[name]["higher_is_better"] else change
+        flag = "REGRESSION" if worse > args.threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"  {name:<36} {before:12.3f} -> {after:12.3f} {baseline[name]['unit']:<9} {change:+7.1f}%  {flag}")
+    for name in sorted(set(baseline) ^ set(current)):
+        print(f"  {name:<36} only in {'baseline' if name in baseline else 'current'}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0f}%: {', '.join(regressions)}")
+        return 1
+    print(f"No regressions over {args.threshold:.0f}%")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host hot-path benchmark suite")
+    parser.add_argument("--results", default=DEFAULT_RESULTS, help="JSON file holding labelled runs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("run", help="run the benchmarks and store the results")
+    bench.add_argument("--label", default="latest")
+    bench.add_argument("--trace", help="replay a serial_trace.py recording instead of the synthetic stream")
+    bench.add_argument("--frames", type=int, default=20000, help="synthetic frames per station")
+    bench.add_argument("--repeat", type=int, default=3, help="runs per benchmark; each metric keeps its best")
+    bench.add_argument("--calls", type=int, default=20000, help="set_weight calls")
+    bench.add_argument("--renders", type=int, default=20, help="renders per wizard prompt")
+    bench.add_argument("--stations", type=int, default=config.NUM_STATIONS, help="simulated stations to handshake")
+    bench.add_argument("--lines", type=int, default=20000, help="stats log lines")
+    bench.add_argument("--skip-wizard", action="store_true")
+    diff = sub.add_parser("compare", help="flag metrics that regressed against a baseline")
+    diff.add_argument("baseline", nargs="?", default="baseline")
+    diff.add_argument("current", nargs="?", default="latest")
+    diff.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import collections
+import logging
+import time
+import config
+from frame_decoder import PROTOCOL_V1, PROTOCOL_V2
+
+# How often each station is pinged, and when an unanswered ping is given up
+PING_INTERVAL = 2.0
+PING_TIMEOUT = 1.0
+# Pings kept per station; the one with the smallest round trip sets the offset
+CLOCK_WINDOW = 8
+# Best offsets kept for the drift fit (one per window, about 16 s apart)
+DRIFT_ANCHORS = 32
+# Transport latencies kept per station for the percentiles
+LATENCY_HISTORY = 2048
+
+MILLIS_WRAP = 1 << 32
+
+
+class StationClock:
+    """
+    Maps one station's millis() onto the host's time.monotonic().
+    Every ping gives (host send, device millis, host receive). As in NTP, the
+    device clock is assumed to have been read halfway through the round trip,
+    and of the last CLOCK_WINDOW pings only the one with the smallest round trip
+    is trusted. Successive best offsets give a linear drift estimate.
+    """
+    def __init__(self, window=CLOCK_WINDOW):
+        self.pings = collections.deque(maxlen=window)  # (rtt, offset, device_seconds)
+        self.anchors = collections.deque(maxlen=DRIFT_ANCHORS)  # (device_seconds, offset)
+        self.latencies = collections.deque(maxlen=LATENCY_HISTORY)
+        self.offset = None       # host seconds - device seconds at ref_device
+        self.drift = 0.0         # change of offset per device second
+        self.ref_device = 0.0
+        self.rtt = None
+        self._last_millis = None
+        self._wraps = 0
+        self._since_anchor = 0
+
+    def device_seconds(self, device_millis):
+        """Device time in seconds, unwrapping millis() across its 49-day rollover."""
+        if self._last_millis is not None and device_millis < self._last_millis - MILLIS_WRAP // 2:
+            self._wraps += 1
+        self._last_millis = device_millis
+        return (device_millis + self._wraps * MILLIS_WRAP) / 1000.0
+
+    def add_ping(self, sent_at, received_at, device_millis):
+        rtt = received_at - sent_at
+        if rtt < 0:
+            return
+        device = self.device_seconds(device_millis)
+        offset = (sent_at + received_at) / 2.0 - device
+        self.pings.append((rtt, offset, device))
+        best_rtt, best_offset, best_device = min(self.pings)
+        self.rtt = best_rtt
+        self._since_anchor += 1
+        # Anchor only on the best of a full window: a lone early ping may have
+        # been delayed, and would skew the drift fit for the whole session
+        if self._since_anchor >= self.pings.maxlen:
+            self._since_anchor = 0
+            self.anchors.append((best_device, best_offset))
+            self._fit_drift()
+        if len(self.anchors) < 2:
+            self.offset = best_offset
+            self.ref_device = best_device
+
+    def _fit_drift(self):
+        """Least-squares line through the anchor offsets."""
+        count = len(self.anchors)
+        if count < 2:
+            return
+        mean_x = sum(x for x, _ in self.anchors) / count
+        mean_y = sum(y for _, y in self.anchors) / count
+        sxx = sum((x - mean_x) ** 2 for x, _ in self.anchors)
+        if sxx <= 0:
+            return
+        sxy = sum((x - mean_x) * (y - mean_y) for x, y in self.anchors)
+        self.drift = sxy / sxx
+        self.ref_device = mean_x
+        self.offset = mean_y
+
+    def to_host(self, device_millis):
+        """Host time.monotonic() at which the device read device_millis, or None if not synced yet."""
+        if self.offset is None:
+            return None
+        device = self.device_seconds(device_millis)
+        return device + self.offset + self.drift * (device - self.ref_device)
+
+    def record_sample(self, device_millis, received_at):
+        """Transport latency of one sample: read by the host minus taken by the device."""
+        taken_at = self.to_host(device_millis)
+        if taken_at is None:
+            return None
+        latency = received_at - taken_at
+        self.latencies.append(latency)
+        return latency
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)):
+        """{percentile: seconds} over the recent samples, empty until synced."""
+        if not self.latencies:
+            return {}
+        ordered = sorted(self.latencies)
+        last = len(ordered) - 1
+        return {p: ordered[min(last, int(round(p / 100.0 * last)))] for p in percentiles}
+
+
+class ClockSync:
+    """
+    Pings the stations with TIME_PING and keeps a StationClock for each.
+    Protocol v1 firmware has no TIME_PING and is never pinged.
+    poll() and the on_* callbacks run on the GUI thread; received_at comes
+    from the serial reader, so queueing in the GUI does not count as latency.
+    """
+    def __init__(self, num_stations, interval=PING_INTERVAL, timeout=PING_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.clocks = [StationClock() for _ in range(num_stations)]
+        self._outstanding = [None] * num_stations  # time.monotonic() the ping went out
+        self._next_ping = [0.0] * num_stations
+
+    def reset(self, station_index):
+        """Forget a station's clock (its millis() restarts when the board resets)."""
+        self.clocks[station_index] = StationClock()
+        self._outstanding[station_index] = None
+        self._next_ping[station_index] = 0.0
+
+    def poll(self, arduinos, now=None):
+        if now is None:
+            now = time.monotonic()
+        for station_index, arduino in enumerate(arduinos):
+            if arduino is None or getattr(arduino, "protocol_version", PROTOCOL_V1) < PROTOCOL_V2:
+                continue
+            sent_at = self._outstanding[station_index]
+            if sent_at is not None:
+                if now - sent_at < self.timeout:
+                    continue
+                # Busy firmware (e.g. mid-fill) drops pings; just try again later
+                self._outstanding[station_index] = None
+            if now < self._next_ping[station_index]:
+                continue
+            try:
+                sent_at = time.monotonic()
+                arduino.write(config.TIME_PING)
+                self._outstanding[station_index] = sent_at
+                self._next_ping[station_index] = sent_at + self.interval
+            except Exception as e:
+                logging.error(f"Station {station_index+1}: TIME_PING failed: {e}")
+
+    def on_echo(self, station_index, device_millis, received_at):
+        sent_at = self._outstanding[station_index]
+        if sent_at is None:
+            return
+        self._outstanding[station_index] = None
+        self.clocks[station_index].add_ping(sent_at, received_at, device_millis)
+
+    def on_samples(self, station_index, samples, received_at):
+        """Record transport latency for (device millis, weight) samples."""
+        clock = self.clocks[station_index]
+        for device_millis, _ in samples:
+            clock.record_sample(device_millis, received_at)
+
+    def to_host(self, station_index, device_millis):
+        return self.clocks[station_index].to_host(device_millis)
+
+    def latency_percentiles(self, station_index, percentiles=(50, 90, 99)):
+        return self.clocks[station_index].latency_percentiles(percentiles)
+
+    def report(self):
+        """One line per synced station: round trip, drift and latency percentiles."""
+        lines = []
+        for station_index, clock in enumerate(self.clocks):
+            if clock.offset is None:
+                continue
+            latency = clock.latency_percentiles()
+            latency_text = " ".join(f"p{p}={v * 1000:.1f}ms" for p, v in latency.items()) or "no samples"
+            lines.append(
+                f"Station {station_index+1}: rtt={clock.rtt * 1000:.1f}ms "
+                f"drift={clock.drift * 1e6:+.0f}ppm latency {latency_text}"
+            )
+        return "\n".join(lines)
@@ -1,17 +1,52 @@
 # --- Button debounce and startup flags ---
 BUTTON_DELAY = 1000  # milliseconds, default delay after button press
-import RPi.GPIO as GPIO
 # Log directories
 LOG_DIR = "logs"
 ERROR_LOG_DIR = "logs/errors"
 STATS_LOG_DIR = "logs/stats"
 
+import os
 from datetime import datetime
+from station_state import StationRegistry
+from gpio_backend import load_gpio
 SESSION_ID = datetime.now().strftime("%Y%m%d_%H%M%S")
 
+def read_import_setting(config_path, key, env_var, default):
+    """
+    Return key= from config.txt as a string, or default if not set; the
+    env_var environment variable overrides the file (simulator, benchmarks,
+    headless runs). For settings needed while this module is imported.
+    """
+    value = default
+    try:
+        with open(config_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith(key + "="):
+                    value = line.split("=", 1)[1].strip()
+    except OSError:
+        pass
+    if os.environ.get(env_var):
+        value = os.environ[env_var]
+    return value
+
+def read_station_count(config_path, default=4):
+    """
+    Return num_stations= from config.txt (PM_NUM_STATIONS overrides), or default if not set.
+    Read here, at import, because every per-station list below is sized by it.
+    """
+    try:
+        count = int(read_import_setting(config_path, "num_stations", "PM_NUM_STATIONS", default))
+    except ValueError:
+        count = default
+    return max(1, count)
+
 # ========== CONFIG & CONSTANTS ==========
-NUM_STATIONS = 4
 config_file = "config.txt"
+NUM_STATIONS = read_station_count(os.path.join(os.path.dirname(os.path.abspath(__file__)), config_file))
+# RPi.GPIO or a stand-in (gpio_backend.py); gpio= in config.txt, PM_GPIO overrides
+GPIO_BACKEND = read_import_setting(os.path.join(os.path.dirname(os.path.abspath(__file__)), config_file), "gpio", "PM_GPIO", "auto")
+GPIO = load_gpio(GPIO_BACKEND)
 target_weight = 500.0
 time_limit = 3000
 scale_calibrations = []
@@ -20,17 +55,26 @@ DEBUG = True
 # ========== GLOBALS ==========
 E_STOP = False
 FILL_LOCKED = False
-last_fill_time = [None] * NUM_STATIONS
-last_final_weight = [None] * NUM_STATIONS
+# One StationState per station; the lists below are live views onto it
+stations = StationRegistry(NUM_STATIONS)
+last_fill_time = stations.column('last_fill_time')
+last_final_weight = stations.column('last_final_weight')
 fill_time_limit_reached = False
 SESSION_ID = datetime.now().strftime("%Y%m%d_%H%M%S")
-arduinos = [None] * NUM_STATIONS
-station_connected = [arduino is not None for arduino in arduinos]
-serial_numbers = [arduino.serial_number if arduino else None for arduino in arduinos]
+arduinos = stations.column('arduino')
+station_connected = stations.column('connected')
+station_enabled = stations.column('enabled')
+serial_numbers = stations.column('serial_number')
 filling_mode = "AUTO"
-station_max_weight_error = [False] * NUM_STATIONS
+station_max_weight_error = stations.column('max_weight_error')
 BOTTLE_WEIGHT_TOLERANCE = 25
 RELAY_POWER_ENABLED = False
+DEFAULT_BAUD = 9600  # Every handshake starts here
+SERIAL_BAUD_RATES = (250000, 115200)  # Offered to stations after the handshake, fastest first; () stays at DEFAULT_BAUD
+IDLE_SAMPLE_INTERVAL_MS = 200  # Weight streaming while a station is idle (5 Hz)
+ACTIVE_SAMPLE_INTERVAL_MS = 0  # While filling, in MANUAL mode and in the startup wizard; 0 = every reading
+STATION_STALL_TIMEOUT = 0.5  # Seconds without any message (heartbeats included) before a station is reconnected; config.txt stall_timeout= overrides
+SERIAL_ENGINE = "threaded"  # "threaded" (reader thread per station), "selector" (one thread for all ports), "asyncio" (coroutines on the Qt loop), "process" (separate hardware process, hardware_process.py) or "poll" (legacy GUI-thread polling); config.txt serial_engine= overrides
 
 # Protocol bytes
 REQUEST_TARGET_WEIGHT = b'\x01'
@@ -45,6 +89,8 @@ VERBOSE_DEBUG = b'\xFE'
 BEGIN_AUTO_FILL = b'\x10'
 SET_MANUAL_FILL = b'\x16'
 BEGIN_SMART_FILL = b'\x17'
+SMART_FILL_START = b'\x30'
+SMART_FILL_END = b'\x31'
 CALIBRATION_STEP_DONE = b'\x12'
 CALIBRATION_CONTINUE = b'\x13'
 CALIBRATION_WEIGHT = b'\x14'
@@ -54,7 +100,15 @@ FINAL_WEIGHT = b'\x11'
 GET_ID = b'\xA0'
 STOP = b'\xFD'
 CONFIRM_ID = b'\xA1'
+CONFIRM_ID_V2 = b'\xA2'  # CONFIRM_ID that also switches the station to framed protocol v2
 RESET_HANDSHAKE = b'\xB0'
+SET_BAUD = b'\xB1'  # Host: SET_BAUD "<rate>\n", station acks with SET_BAUD + uint32 rate
+HEARTBEAT = b'\xB2'  # Station: no payload, sent when it has been quiet for 100 ms
+WEIGHT_BATCH = b'\x40'  # v2 only: N x (uint32 device millis, int32 weight)
+TIME_PING = b'\x41'  # Host: no payload
+TIME_ECHO = b'\x42'  # Station: uint32 millis() when it answered TIME_PING
+SET_SAMPLE_RATE = b'\x43'  # Host: SET_SAMPLE_RATE "<ms between weight samples>\n", 0 = every reading
+STAGE_FILL = b'\x44'  # Host: STAGE_FILL "<target grams>,<time limit ms>\n", target 0 = ask at fill start
 BUTTON_ERROR = b'\xE0'
 MAX_WEIGHT_WARNING = b'\xE1'
 MAX_WEIGHT_END = b'\xE2'
@@ -70,23 +124,34 @@ E_STOP_PIN = 23
 BUZZER_PIN = 26
 RELAY_POWER_PIN = 17
 
-arduino_ports = [
-    '/dev/ttyACM0',
-    '/dev/ttyACM1',
-    '/dev/ttyACM2',
-    '/dev/ttyACM3'
-]
+# One port per station by default; config.txt arduino_ports= lists them or says auto (scan for boards)
+arduino_ports = [f'/dev/ttyACM{i}' for i in range(NUM_STATIONS)]
+# Scanned by arduino_ports=auto and when a station is not found on its last port
+ARDUINO_PORT_PATTERNS = ('/dev/ttyACM*', '/dev/ttyUSB*')
+ARDUINO_PORT_DISCOVERY = False  # Set by arduino_ports=auto
 
-# Station colors (for use in Python code and QSS generation)
-STATION_COLORS = [
+# Station colors (for use in Python code and QSS generation), repeated past the 16th station
+STATION_PALETTE = [
     "#b00f0f",  # Station 1 - red
     "#2314c9",  # Station 2 - blue
     "#0f9229",  # Station 3 - green
     "#c1b615",  # Station 4 - yellow
+    "#c2570c",  # Station 5 - orange
+    "#7a1fa2",  # Station 6 - purple
+    "#0f8a8a",  # Station 7 - teal
+    "#b8145e",  # Station 8 - magenta
+    "#5b6b0f",  # Station 9 - olive
+    "#1d6fb8",  # Station 10 - sky blue
+    "#8a4b14",  # Station 11 - brown
+    "#4a4fd1",  # Station 12 - indigo
+    "#d13a3a",  # Station 13 - light red
+    "#2f9e5b",  # Station 14 - mint
+    "#9e8a2f",  # Station 15 - mustard
+    "#6b6b6b",  # Station 16 - grey
 ]
+STATION_COLORS = [STATION_PALETTE[i % len(STATION_PALETTE)] for i in range(NUM_STATIONS)]
 
 # Other shared config values
-NUM_STATIONS = 4
 STATS_LOG_FILE = "stats.log"
 STATS_LOG_DIR = "logs/stats"
 ERROR_LOG_DIR = "logs/errors"
@@ -0,0 +1,120 @@
+import collections
+import time
+
+# Where a weight is drawn: the main screen's StationWidgets or the StartupWizardDialog's StationBoxWidgets
+PATH_MAIN = "main"
+PATH_WIZARD = "wizard"
+PATHS = (PATH_MAIN, PATH_WIZARD)
+
+# Histogram bucket upper bounds in milliseconds; the last bucket takes the rest
+BUCKET_BOUNDS_MS = (5, 10, 20, 35, 50, 75, 100, 150, 250, 500, 1000)
+# Latencies kept per station and path for the percentiles
+LATENCY_HISTORY = 2048
+
+
+class LatencyHistogram:
+    """Counts per bucket plus a window of recent values for percentiles (seconds)."""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.recent = collections.deque(maxlen=LATENCY_HISTORY)
+        self.total = 0
+        self.worst = 0.0
+
+    def add(self, latency):
+        latency_ms = latency * 1000.0
+        bucket = 0
+        for bound in BUCKET_BOUNDS_MS:
+            if latency_ms <= bound:
+                break
+            bucket += 1
+        self.counts[bucket] += 1
+        self.recent.append(latency)
+        self.total += 1
+        if latency > self.worst:
+            self.worst = latency
+
+    def percentiles(self, percentiles=(50, 90, 99)):
+        if not self.recent:
+            return {}
+        ordered = sorted(self.recent)
+        last = len(ordered) - 1
+        return {p: ordered[min(last, int(round(p / 100.0 * last)))] for p in percentiles}
+
+    def buckets(self):
+        """[(label, count), ...] with labels like '<=10ms' and '>1000ms'."""
+        labels = [f"<={bound}ms" for bound in BUCKET_BOUNDS_MS] + [f">{BUCKET_BOUNDS_MS[-1]}ms"]
+        return list(zip(labels, self.counts))
+
+
+class DisplayLatency:
+    """
+    Sample-to-pixel latency per station and display path.
+    A weight sample is tagged with the time the station took it, mapped onto
+    host time by clock_sync (the serial reader's received_at until the
+    station is synced, and for protocol v1). When a widget takes the newest sample and its
+    weight text changes, that tag waits for the widget's weight label to
+    finish its next repaint; the difference is the latency operators see,
+    which in MANUAL mode is how late they stop the fill.
+    Samples replaced before they are shown (coalescing) are not counted.
+    """
+    def __init__(self, num_stations):
+        self._arrived = [None] * num_stations  # taken time of the newest sample
+        self._shown = {path: [None] * num_stations for path in PATHS}  # taken_at last handed to the path
+        self._awaiting = {path: [None] * num_stations for path in PATHS}  # taken_at waiting for a repaint
+        self.histograms = {path: [LatencyHistogram() for _ in range(num_stations)] for path in PATHS}
+
+    def arrived(self, station_index, weight, taken_at, device_millis=None):
+        """WeightCoalescer consumer: remember when the newest sample was taken."""
+        self._arrived[station_index] = taken_at
+
+    def shown(self, station_index, path, changed=True):
+        """The widget on path was given the newest sample; changed is whether its text changed."""
+        taken_at = self._arrived[station_index]
+        if taken_at is None or taken_at == self._shown[path][station_index]:
+            return
+        self._shown[path][station_index] = taken_at
+        if changed:
+            self._awaiting[path][station_index] = taken_at
+
+    def painted(self, station_index, path, now=None):
+        """The weight label on path finished repainting."""
+        taken_at = self._awaiting[path][station_index]
+        if taken_at is None:
+            return None
+        self._awaiting[path][station_index] = None
+        latency = (now or time.monotonic()) - taken_at
+        self.histograms[path][station_index].add(latency)
+        return latency
+
+    def forget(self, station_index):
+        """Drop tags from a port that was replaced (reconnect)."""
+        self._arrived[station_index] = None
+        for path in PATHS:
+            self._shown[path][station_index] = None
+            self._awaiting[path][station_index] = None
+
+    def attach(self, widgets, path):
+        """Have each widget's weight label report its repaints to painted()."""
+        for station_index, widget in enumerate(widgets or []):
+            label = getattr(widget, "weight_label", None)
+            if label is not None and hasattr(label, "paint_probe"):
+                label.paint_probe = lambda station_index=station_index: self.painted(station_index, path)
+
+    def percentiles(self, station_index, path, percentiles=(50, 90, 99)):
+        return self.histograms[path][station_index].percentiles(percentiles)
+
+    def report(self, with_buckets=True):
+        """One line per station and path with samples, optionally followed by the histogram."""
+        lines = []
+        for path in PATHS:
+            for station_index, histogram in enumerate(self.histograms[path]):
+                if not histogram.total:
+                    continue
+                latency_text = " ".join(f"p{p}={v * 1000:.1f}ms" for p, v in histogram.percentiles().items())
+                lines.append(
+                    f"Station {station_index+1} [{path}]: {histogram.total} repaints "
+                    f"{latency_text} max={histogram.worst * 1000:.1f}ms"
+                )
+                if with_buckets:
+                    lines.append("    " + " ".join(f"{label}:{count}" for label, count in histogram.buckets() if count))
+        return "\n".join(lines)
@@ -0,0 +1,154 @@
+import collections
+import logging
+import queue
+import threading
+
+# ========== EVENTS ==========
+# received_at is the time.monotonic() at which the host handled the message
+# (or saw the E-STOP pin change, for EStop).
+
+# The weight a station shows this tick (one per station per poll_hardware tick at most).
+# taken_at is when the station took it, in host time.monotonic() (ClockSync.to_host);
+# the same as received_at until the station's clock is synced, and for protocol v1
+WeightSample = collections.namedtuple("WeightSample", "station_index weight received_at taken_at")
+# mode: "AUTO" or "SMART"
+FillStarted = collections.namedtuple("FillStarted", "station_index mode received_at")
+# FINAL_WEIGHT arrived; its FILL_TIME may still be on the way
+FinalWeight = collections.namedtuple("FinalWeight", "station_index final_weight received_at")
+# Both FINAL_WEIGHT and FILL_TIME are in; timed_out when the fill hit its time limit
+FillCompleted = collections.namedtuple(
+    "FillCompleted", "station_index final_weight fill_time_ms timed_out target_weight received_at"
+)
+# active: the station's MAX_WEIGHT block started (True) or ended (False)
+MaxWeight = collections.namedtuple("MaxWeight", "station_index active received_at")
+EStop = collections.namedtuple("EStop", "active received_at")
+
+# Delivery modes
+DELIVER_SYNC = "sync"        # called inside publish()
+DELIVER_BATCHED = "batched"  # called once per flush() with the list of events since the last flush
+DELIVER_THREAD = "thread"    # called one event at a time on the subscriber's own thread
+
+
+class Subscription:
+    """One subscriber: callback, the event types it takes and how they are delivered."""
+    __slots__ = ('callback', 'event_types', 'delivery', 'name', 'pending', 'dropped', '_queue', '_thread')
+
+    def __init__(self, callback, event_types, delivery, name=None, maxsize=0):
+        self.callback = callback
+        self.event_types = event_types
+        self.delivery = delivery
+        self.name = name or getattr(callback, "__name__", "subscriber")
+        self.pending = []
+        self.dropped = 0
+        self._queue = None
+        self._thread = None
+        if delivery == DELIVER_THREAD:
+            self._queue = queue.Queue(maxsize=maxsize)
+            self._thread = threading.Thread(target=self._run, name=f"bus-{self.name}", daemon=True)
+            self._thread.start()
+
+    def offer(self, event):
+        if self.delivery == DELIVER_SYNC:
+            self.deliver(event)
+        elif self.delivery == DELIVER_BATCHED:
+            self.pending.append(event)
+        else:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                # A slow background subscriber loses events rather than stalling the publisher
+                self.dropped += 1
+
+    def deliver(self, event):
+        try:
+            self.callback(event)
+        except Exception:
+            logging.error(f"Event subscriber {self.name} failed on {type(event).__name__}", exc_info=True)
+
+    def flush(self):
+        if not self.pending:
+            return
+        events, self.pending = self.pending, []
+        try:
+            self.callback(events)
+        except Exception:
+            logging.error(f"Event subscriber {self.name} failed on a batch of {len(events)}", exc_info=True)
+
+    def stop(self, timeout=1.0):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            self.deliver(event)
+
+
+class EventBus:
+    """
+    In-process publish/subscribe for station events.
+    Publishers (the message handlers, poll_hardware) build one small
+    namedtuple per event and never touch the GUI; each subscriber picks its
+    event types and how to receive them:
+      sync     in the publisher's call, for cheap bookkeeping
+      batched  a list per flush(), which poll_hardware calls once per tick
+      thread   on a background thread, for file or network I/O
+    Publishing an event type nobody subscribed to costs one dict lookup.
+    """
+    def __init__(self):
+        self._routes = {}  # event type -> tuple of Subscription
+        self._subscriptions = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, event_types, callback, delivery=DELIVER_SYNC, name=None, maxsize=0):
+        """Deliver events of event_types (a type or a tuple of types) to callback. Returns the Subscription."""
+        if not isinstance(event_types, (tuple, list)):
+            event_types = (event_types,)
+        subscription = Subscription(callback, tuple(event_types), delivery, name, maxsize)
+        with self._lock:
+            self._subscriptions.append(subscription)
+            self._rebuild()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+                self._rebuild()
+        subscription.flush()
+        subscription.stop()
+
+    def _rebuild(self):
+        routes = {}
+        for subscription in self._subscriptions:
+            for event_type in subscription.event_types:
+                routes[event_type] = routes.get(event_type, ()) + (subscription,)
+        self._routes = routes
+
+    def wants(self, event_type):
+        """True if anyone subscribed to event_type (skip building events nobody reads)."""
+        return event_type in self._routes
+
+    def publish(self, event):
+        for subscription in self._routes.get(type(event), ()):
+            subscription.offer(event)
+
+    def flush(self):
+        """Deliver everything the batched subscribers have collected."""
+        for subscription in self._subscriptions:
+            if subscription.pending:
+                subscription.flush()
+
+    def stop(self):
+        """Deliver what is left and stop the background subscribers."""
+        self.flush()
+        for subscription in list(self._subscriptions):
+            subscription.stop()
+
+    def dropped(self):
+        """{subscriber name: events dropped} for background subscribers that fell behind."""
+        return {s.name: s.dropped for s in self._subscriptions if s.dropped}
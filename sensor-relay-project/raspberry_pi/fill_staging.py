@@ -0,0 +1,58 @@
+import logging
+import config
+from frame_decoder import PROTOCOL_V1, PROTOCOL_V2
+
+# Staged target that tells a station to ask the host again (fills locked or relay power off)
+WITHDRAWN = 0
+
+
+class FillStager:
+    """
+    Keeps each station's cached fill parameters in step with the host.
+    The station starts a fill straight away from the target weight and time
+    limit sent with STAGE_FILL, instead of asking for them and waiting for the
+    next poll_hardware tick. While fills must not start, the staged values are
+    withdrawn so the station asks first and gets STOP.
+    Only changes are sent, so apply() can run every tick.
+    """
+    def __init__(self, num_stations):
+        self._sent = [None] * num_stations  # (target_weight, time_limit) the station holds
+
+    def reset(self, station_index):
+        """A station that just handshaked has nothing staged."""
+        self._sent[station_index] = (WITHDRAWN, 0)
+
+    def withdraw_all(self, arduinos):
+        """Withdraw every station's staged fill, e.g. when the host shuts down."""
+        self._sent = [None] * len(self._sent)
+        self.apply(arduinos, WITHDRAWN, 0, allowed=False)
+
+    def apply(self, arduinos, target_weight, time_limit, allowed=True, cutoff=None, enabled=None, arm=None):
+        """
+        cutoff(station_index, target_weight), if given, returns the weight to stage for that station;
+        arm(station_index, target_weight, staged weight) is called once it has been written.
+        Stations that are not enabled[station_index] get WITHDRAWN: the host ignores their
+        messages, so they must not start a fill of their own. Ports on protocol v1 (old
+        firmware, no STAGE_FILL) are left alone.
+        """
+        staged_all = (target_weight, int(time_limit)) if allowed and target_weight > 0 else (WITHDRAWN, 0)
+        for station_index, arduino in enumerate(arduinos):
+            if arduino is None or getattr(arduino, "protocol_version", PROTOCOL_V1) < PROTOCOL_V2:
+                continue
+            if enabled is not None and not enabled[station_index]:
+                staged = (WITHDRAWN, 0)
+            elif cutoff is not None and staged_all[0] != WITHDRAWN:
+                staged = (cutoff(station_index, target_weight), staged_all[1])
+            else:
+                staged = staged_all
+            if self._sent[station_index] == staged:
+                continue
+            try:
+                arduino.write(config.STAGE_FILL + f"{staged[0]},{staged[1]}\n".encode('utf-8'))
+                self._sent[station_index] = staged
+                if arm is not None and staged[0] != WITHDRAWN:
+                    arm(station_index, target_weight, staged[0])
+                if config.DEBUG:
+                    print(f"[FillStager] Station {station_index+1}: staged target {staged[0]} g, time limit {staged[1]} ms")
+            except Exception as e:
+                logging.error(f"Station {station_index+1}: STAGE_FILL failed: {e}")
@@ -0,0 +1,300 @@
+import re
+import struct
+import time
+import config
+
+# Frame kinds, indexed by the message byte
+KIND_BYTE = 0    # Bare opcode with no payload
+KIND_FIXED = 1   # Opcode followed by a fixed-size binary payload
+KIND_LINE = 2    # Opcode followed by text up to and including '\n'
+
+FRAME_BUFFER_SIZE = 4096
+# A text line longer than this is treated as garbage and skipped a byte at a time
+MAX_LINE_LENGTH = 256
+
+# Protocol v2 frames: SYNC, LEN, OPCODE, PAYLOAD[LEN], CRC-8 (poly 0x07) over LEN..PAYLOAD
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+HOST_PROTOCOL_VERSION = PROTOCOL_V2
+FRAME_SYNC = 0xAA
+FRAME_OVERHEAD = 4  # sync, len, opcode, crc
+FRAME_MAX_PAYLOAD = 128
+# Appended to the handshake reply by firmware that speaks v2: <SERIAL:PM-SN0001><PROTO:2>
+PROTOCOL_PATTERN = re.compile(rb"<PROTO:(\d+)>")
+# Fastest baud rate the firmware can switch to: <BAUD:250000>
+BAUD_PATTERN = re.compile(rb"<BAUD:(\d+)>")
+
+# Reuse one bytes object per opcode so decoding does not allocate for it
+OPCODE_BYTES = [bytes([i]) for i in range(256)]
+
+FIXED_FORMATS = {
+    config.CURRENT_WEIGHT: struct.Struct('<i'),
+    config.FINAL_WEIGHT: struct.Struct('<i'),
+    config.FILL_TIME: struct.Struct('<I'),
+    config.SET_BAUD: struct.Struct('<I'),
+    config.TIME_ECHO: struct.Struct('<I'),
+}
+
+BARE_OPCODES = (
+    config.REQUEST_TARGET_WEIGHT,
+    config.REQUEST_CALIBRATION,
+    config.REQUEST_TIME_LIMIT,
+    config.TARE_CONFIRMED,
+    config.BEGIN_AUTO_FILL,
+    config.BEGIN_SMART_FILL,
+    config.SMART_FILL_START,
+    config.SMART_FILL_END,
+    config.CALIBRATION_STEP_DONE,
+    config.RELAY_DEACTIVATED,
+    config.BUTTON_ERROR,
+    config.MAX_WEIGHT_WARNING,
+    config.MAX_WEIGHT_END,
+    config.HEARTBEAT,
+)
+
+LINE_OPCODES = (
+    config.VERBOSE_DEBUG,
+    config.CALIBRATION_WEIGHT,
+)
+
+
+def _build_tables():
+    kinds = [KIND_BYTE] * 256
+    formats = [None] * 256
+    # Printable ASCII is the start of a plain Serial.println() from the firmware
+    for i in range(0x20, 0x7F):
+        kinds[i] = KIND_LINE
+    for opcode in BARE_OPCODES:
+        kinds[opcode[0]] = KIND_BYTE
+    for opcode in LINE_OPCODES:
+        kinds[opcode[0]] = KIND_LINE
+    for opcode, fmt in FIXED_FORMATS.items():
+        kinds[opcode[0]] = KIND_FIXED
+        formats[opcode[0]] = fmt
+    return kinds, formats
+
+FRAME_KINDS, FRAME_FORMATS = _build_tables()
+
+
+def _build_crc8_table(poly=0x07):
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+CRC8_TABLE = _build_crc8_table()
+
+
+def crc8(data, crc=0):
+    """CRC-8 (poly 0x07, init 0), the same as crc8_update() in scale_controller.ino."""
+    table = CRC8_TABLE
+    for b in data:
+        crc = table[crc ^ b]
+    return crc
+
+
+def encode_frame(message_type, payload=b''):
+    """Build one v2 frame for message_type (a single byte) and payload bytes."""
+    body = bytes((len(payload),)) + message_type + payload
+    return bytes((FRAME_SYNC,)) + body + bytes((crc8(body),))
+
+
+def negotiated_protocol(reply):
+    """Protocol version to use for a station, given its handshake reply line."""
+    if isinstance(reply, str):
+        reply = reply.encode('utf-8', errors='replace')
+    match = PROTOCOL_PATTERN.search(reply)
+    if not match:
+        return PROTOCOL_V1
+    return max(PROTOCOL_V1, min(int(match.group(1)), HOST_PROTOCOL_VERSION))
+
+
+def offered_baud(reply):
+    """Fastest baud rate advertised in a handshake reply line, or None."""
+    if isinstance(reply, str):
+        reply = reply.encode('utf-8', errors='replace')
+    match = BAUD_PATTERN.search(reply)
+    return int(match.group(1)) if match else None
+
+
+def confirm_id_for(protocol_version):
+    """The CONFIRM_ID byte that accepts protocol_version."""
+    return config.CONFIRM_ID_V2 if protocol_version >= PROTOCOL_V2 else config.CONFIRM_ID
+
+
+def make_decoder(arduino):
+    """Decoder for the protocol negotiated on this port during the handshake."""
+    if getattr(arduino, "protocol_version", PROTOCOL_V1) >= PROTOCOL_V2:
+        return FramedDecoder()
+    return FrameDecoder()
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for the scale_controller serial stream.
+    Bytes are appended to a reusable buffer and only complete frames are
+    returned; a partial frame stays buffered until the rest arrives.
+    Fixed-size payloads are returned unpacked (int), text payloads as bytes.
+    """
+    def __init__(self, capacity=FRAME_BUFFER_SIZE):
+        self._buffer = bytearray(capacity)
+        self._start = 0
+        self._end = 0
+        # time.monotonic() of the last read_from() that returned data
+        self.received_at = 0.0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def reset(self):
+        self._start = 0
+        self._end = 0
+
+    def _reserve(self, size):
+        """Make room for size more bytes at the end of the buffer."""
+        if self._end + size <= len(self._buffer):
+            return
+        pending = self._end - self._start
+        if self._start:
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+            self._start = 0
+            self._end = pending
+        if pending + size > len(self._buffer):
+            self._buffer.extend(bytes(pending + size - len(self._buffer)))
+
+    def feed(self, data):
+        size = len(data)
+        if not size:
+            return
+        self._reserve(size)
+        self._buffer[self._end:self._end + size] = data
+        self._end += size
+
+    def read_from(self, arduino, block=False):
+        """
+        Read everything the port has buffered in a single call.
+        With block=True wait (up to the port timeout) for at least one byte.
+        Returns the number of bytes read.
+        """
+        size = arduino.in_waiting
+        if size <= 0:
+            if not block:
+                return 0
+            data = arduino.read(1)
+            if not data:
+                return 0
+            self.received_at = time.monotonic()
+            self.feed(data)
+            size = arduino.in_waiting
+            if size <= 0:
+                return 1
+            data = arduino.read(size)
+            self.feed(data)
+            return len(data) + 1
+        data = arduino.read(size)
+        self.received_at = time.monotonic()
+        self.feed(data)
+        return len(data)
+
+    def decode(self):
+        """Return a list of (message_type, payload) for every complete frame."""
+        frames = []
+        buf = self._buffer
+        pos = self._start
+        end = self._end
+        kinds = FRAME_KINDS
+        with memoryview(buf) as view:
+            while pos < end:
+                opcode = buf[pos]
+                kind = kinds[opcode]
+                if kind == KIND_FIXED:
+                    fmt = FRAME_FORMATS[opcode]
+                    if end - pos <= fmt.size:
+                        break
+                    frames.append((OPCODE_BYTES[opcode], fmt.unpack_from(view, pos + 1)[0]))
+                    pos += 1 + fmt.size
+                elif kind == KIND_LINE:
+                    newline = buf.find(b'\n', pos + 1, end)
+                    if newline < 0:
+                        if end - pos <= MAX_LINE_LENGTH:
+                            break
+                        # No newline in sight: report the byte and resync on the next one
+                        frames.append((OPCODE_BYTES[opcode], b''))
+                        pos += 1
+                        continue
+                    frames.append((OPCODE_BYTES[opcode], bytes(view[pos + 1:newline + 1])))
+                    pos = newline + 1
+                else:
+                    frames.append((OPCODE_BYTES[opcode], b''))
+                    pos += 1
+        if pos >= end:
+            self._start = self._end = 0
+        else:
+            self._start = pos
+        return frames
+
+
+class FramedDecoder(FrameDecoder):
+    """
+    Decoder for protocol v2 frames.
+    Anything that is not a well-formed frame with a matching CRC is skipped up
+    to the next sync byte, so a dropped or corrupted byte costs one frame
+    instead of desynchronizing the stream. Payloads are returned like
+    FrameDecoder returns them: unpacked ints for fixed formats, else bytes.
+    """
+    def __init__(self, capacity=FRAME_BUFFER_SIZE):
+        super().__init__(capacity)
+        self.bad_frames = 0
+        self.skipped_bytes = 0
+
+    def decode(self):
+        frames = []
+        buf = self._buffer
+        pos = self._start
+        end = self._end
+        formats = FRAME_FORMATS
+        table = CRC8_TABLE
+        sync = FRAME_SYNC
+        with memoryview(buf) as view:
+            while pos < end:
+                if buf[pos] != sync:
+                    next_sync = buf.find(b'\xAA', pos, end)
+                    if next_sync < 0:
+                        self.skipped_bytes += end - pos
+                        pos = end
+                        break
+                    self.skipped_bytes += next_sync - pos
+                    pos = next_sync
+                if end - pos < FRAME_OVERHEAD:
+                    break
+                length = buf[pos + 1]
+                if length > FRAME_MAX_PAYLOAD:
+                    self.bad_frames += 1
+                    pos += 1
+                    continue
+                frame_end = pos + FRAME_OVERHEAD + length
+                if frame_end > end:
+                    break
+                crc = 0
+                for b in view[pos + 1:frame_end - 1]:
+                    crc = table[crc ^ b]
+                if crc != buf[frame_end - 1]:
+                    self.bad_frames += 1
+                    pos += 1
+                    continue
+                opcode = buf[pos + 2]
+                fmt = formats[opcode]
+                if fmt is not None and fmt.size == length:
+                    payload = fmt.unpack_from(view, pos + 3)[0]
+                else:
+                    payload = bytes(view[pos + 3:frame_end - 1])
+                frames.append((OPCODE_BYTES[opcode], payload))
+                pos = frame_end
+        if pos >= end:
+            self._start = self._end = 0
+        else:
+            self._start = pos
+        return frames
@@ -0,0 +1,54 @@
+# GPIO backends, chosen by gpio= in config.txt or the PM_GPIO environment variable:
+#   auto         RPi.GPIO on a Pi, SimulatedGPIO anywhere else (the default); on a Pi
+#                without a working RPi.GPIO it fails rather than ignore the E-STOP
+#   real         RPi.GPIO; fails off a Pi instead of silently simulating
+#   mock         SimulatedGPIO: inputs pulled up, no button pressed, E-STOP released
+#   file:<path>  FileGPIO: input levels read from <path> ("23=0" presses the E-STOP)
+GPIO_BACKENDS = ("auto", "real", "mock", "file")
+
+# Device tree model files; on a Pi they read e.g. "Raspberry Pi 4 Model B Rev 1.4"
+PI_MODEL_FILES = ("/proc/device-tree/model", "/sys/firmware/devicetree/base/model")
+
+
+def is_raspberry_pi():
+    """True if the device tree says this is a Raspberry Pi."""
+    for path in PI_MODEL_FILES:
+        try:
+            with open(path, "rb") as f:
+                if b"Raspberry Pi" in f.read():
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+def load_gpio(backend="auto"):
+    """Return the GPIO module (or stand-in) for backend."""
+    name, _, argument = backend.partition(":")
+    name = name.strip().lower()
+    if name == "file":
+        from sim_gpio import FileGPIO
+        if not argument:
+            raise ValueError("gpio=file needs a path, e.g. gpio=file:/tmp/gpio.txt")
+        return FileGPIO(argument.strip())
+    if name == "mock":
+        from sim_gpio import SimulatedGPIO
+        return SimulatedGPIO()
+    if name == "real":
+        import RPi.GPIO as GPIO
+        return GPIO
+    if name != "auto":
+        raise ValueError(f"Unknown GPIO backend {backend!r}, expected one of {', '.join(GPIO_BACKENDS)}")
+    try:
+        import RPi.GPIO as GPIO
+        return GPIO
+    except (ImportError, RuntimeError) as e:
+        if is_raspberry_pi():
+            # A simulated E-STOP is never pressed: on the machine that must not happen quietly
+            raise RuntimeError(
+                f"RPi.GPIO is not usable on this Raspberry Pi ({e}). Install python3-rpi.gpio, "
+                "or set gpio=mock in config.txt to run without the buttons and E-STOP."
+            ) from e
+        # Not on a Pi (e.g. running against scale_simulator): no buttons pressed, E-STOP released
+        from sim_gpio import SimulatedGPIO
+        return SimulatedGPIO()
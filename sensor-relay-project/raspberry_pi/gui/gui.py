@@ -5,6 +5,7 @@ from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QRectF, QPropertyAnimation, QVa
 from PyQt6.QtGui import QPainter, QPen, QColor, QFont, QPainterPath, QPixmap, QCursor, QFontMetrics, QPalette
 from config import STATION_COLORS, NUM_STATIONS
 import sys
+import math
 from gui.languages import LANGUAGES
 import logging
 import os
@@ -14,6 +15,14 @@ from startup import step_station_verification, step_clear_all_scales, step_filli
 
 DEBUG = True
 
+# Station boxes per row in the startup wizard and the station status dialog
+STATION_BOXES_PER_ROW = 4
+
+def station_grid_shape(num_stations):
+    """(rows, columns) of the main screen grid: 2x2 for four stations, 2x4 for eight, 4x4 for sixteen."""
+    rows = max(1, int(math.sqrt(num_stations)))
+    return rows, math.ceil(num_stations / rows)
+
 # --- Animation Manager ---
 class AnimationManager:
     def __init__(self):
@@ -130,7 +139,19 @@ def frame_paintEvent(self, event):
     def _final_reject(self):
         super().reject()
 
-class OutlinedLabel(QLabel):
+class ProbedLabel(QLabel):
+    """
+    QLabel that calls paint_probe() after each repaint has finished.
+    Weight labels use it to measure sample-to-pixel latency (display_latency.py).
+    """
+    paint_probe = None
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.paint_probe is not None:
+            self.paint_probe()
+
+class OutlinedLabel(ProbedLabel):
     """
     QLabel with optional outline effect for station names and other prominent labels.
     Uses native Qt methods for appearance, no stylesheets.
@@ -209,6 +230,9 @@ class OutlinedLabel(QLabel):
             painter.setPen(QPen(text_color, 1))
             painter.setBrush(text_color)
             painter.drawPath(path)
+        painter.end()
+        if self.paint_probe is not None:
+            self.paint_probe()
 
 class StationBoxWidget(QWidget):
     def __init__(self, station_index, name, color, connected=None, enabled=None, weight_text=None, parent=None):
@@ -285,7 +309,7 @@ class StationBoxWidget(QWidget):
             layout.addWidget(self.enabled_label)
 
         # Weight label
-        self.weight_label = QLabel(self.tr("--") if weight_text is None else weight_text)
+        self.weight_label = ProbedLabel(self.tr("--") if weight_text is None else weight_text)
         self.weight_label.setFont(QFont("Arial", 24, QFont.Weight.Bold))
         self.weight_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.weight_label.setMinimumHeight(24)
@@ -334,11 +358,13 @@ class StationBoxWidget(QWidget):
                 text = f"{current_oz:.1f} / {target_oz:.1f} {self.tr('oz')}"
             else:
                 text = f"{current_oz:.1f} {self.tr('oz')}"
+        changed = text != self.weight_text
         self.weight_text = text
         if self.weight_label:
             self.weight_label.setText(text)
             # Default style: green, transparent, bold
             self.weight_label.setStyleSheet("color: #11BD33; background: transparent; font-weight: bold;")
+        return changed
 
     def set_highlight(self, highlighted):
         self._highlighted = highlighted
@@ -409,7 +435,7 @@ class StationBoxWidget(QWidget):
         painter.drawPath(text_path)
 
 class StationWidget(QWidget):
-    def __init__(self, station_number, bg_color, enabled=True, bar_on_left=False, *args, **kwargs):
+    def __init__(self, station_number, bg_color, enabled=True, bar_on_left=False, *args, scale=1.0, **kwargs):
         super().__init__(*args, **kwargs)
         print(f"[DEBUG] StationWidget {station_number} bg_color={bg_color} enabled={enabled}")
         self.bg_color = QColor(bg_color)
@@ -441,21 +467,22 @@ class StationWidget(QWidget):
         main_layout.setSpacing(0)
 
         self.progress_bar = BottleProgressBar(parent=self)
-        self.progress_bar.setFixedWidth(60)
+        self.progress_bar.setFixedWidth(max(20, round(60 * scale)))
 
         content_layout = QVBoxLayout()
         content_layout.setContentsMargins(0, 0, 0, 0)
         content_layout.setSpacing(0)
 
-        # Large weight label
+        # Large weight label (scale < 1 when the grid has more than two rows or columns)
+        weight_font_size = max(12, round(76 * scale))
         self.weight_label = OutlinedLabel(self.tr("0 / 0 g"), parent=self)
         self.weight_label.setAlignment(Qt.AlignmentFlag.AlignRight)
-        self.weight_label.setFont(QFont("Arial", 76, QFont.Weight.Bold))  # Large font for weight display
-        self.weight_label.setStyleSheet("font-size: 76pt; color: #fff;")
+        self.weight_label.setFont(QFont("Arial", weight_font_size, QFont.Weight.Bold))  # Large font for weight display
+        self.weight_label.setStyleSheet(f"font-size: {weight_font_size}pt; color: #fff;")
         content_layout.addWidget(self.weight_label, stretch=1, alignment=Qt.AlignmentFlag.AlignVCenter)  # Center vertically
 
         # Status label
-        self.status_label = OutlinedLabel(self.tr("READY"), font_size=20, bold=True, color="#fff", border_radius=8, outline_width=3)
+        self.status_label = OutlinedLabel(self.tr("READY"), font_size=max(9, round(20 * scale)), bold=True, color="#fff", border_radius=8, outline_width=3)
         self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.status_label.setWordWrap(True)
         self.status_label.setStyleSheet("background: transparent;")
@@ -482,6 +509,8 @@ class StationWidget(QWidget):
             self.setLayout(offline_layout)
 
     def set_weight(self, current_weight, target_weight, unit="g"):
+        """Show a weight; returns True if the weight text changed (a repaint is coming)."""
+        changed = False
         try:
             if self.weight_label is not None:
                 if unit == "g":
@@ -491,12 +520,14 @@ class StationWidget(QWidget):
                     new_text = f"{current_oz:.2f} {self.tr('oz')}"
                 if self.weight_label.text() != new_text:
                     self.weight_label.setText(new_text)
+                    changed = True
                     pass  # No dynamic font resizing
             if self.progress_bar is not None:
                 self.progress_bar.set_max(target_weight)
                 self.progress_bar.set_value(current_weight)
         except Exception as e:
             logging.error(f"Error in StationWidget.set_weight (station_number={getattr(self, 'station_number', '?')}): {e}", exc_info=True)
+        return changed
 
     def resizeEvent(self, event):
         try:
@@ -720,15 +751,18 @@ class MenuDialog(QDialog):
             label.setText(text)
 
 class RelayControlApp(QWidget):
-    def __init__(self, station_enabled=None, filling_mode_callback=None):
+    def __init__(self, station_enabled=None, filling_mode_callback=None, connect_station_callback=None):
         try:
             super().__init__()
             self.filling_mode_callback = filling_mode_callback
+            # main.try_connect_station: passed in, since importing main from here
+            # loads a second copy of it when the app runs as "python main.py"
+            self.connect_station_callback = connect_station_callback
             if DEBUG:
                 print(f"[DEBUG] RelayControlApp.__init__ called with station_enabled={station_enabled}")
             else:
                 logging.info(f"RelayControlApp.__init__ called with station_enabled={station_enabled}")
-            self.setWindowTitle("Four Station Control")
+            self.setWindowTitle(f"{NUM_STATIONS} Station Control")
             self.setFixedSize(1024, 600)
             self.setStyleSheet("background-color: #222;")
             
@@ -739,28 +773,27 @@ class RelayControlApp(QWidget):
             if station_enabled is not None:
                 self.station_enabled = station_enabled
             else:
-                self.station_enabled = [False, False, False, False]
+                self.station_enabled = [False] * NUM_STATIONS
 
-            # --- Main grid layout (2x2 for four stations) ---
+            # --- Main grid layout (2x2 for four stations, filled column by column) ---
             grid = QGridLayout()
             grid.setContentsMargins(8, 8, 8, 8)  # Thin margin for outer border
             grid.setSpacing(8)  # Thin spacing for grid lines
 
-            self.station_widgets = [None] * 4
-            for i in range(4):
-                bar_on_left = (i in [0, 1])
+            rows, columns = station_grid_shape(NUM_STATIONS)
+            scale = min(1.0, 2.0 / rows, 2.0 / columns)
+            self.station_widgets = [None] * NUM_STATIONS
+            for i in range(NUM_STATIONS):
+                row, column = i % rows, i // rows
+                bar_on_left = column < columns / 2  # Progress bars on the outer edges
                 if self.station_enabled[i]:
-                    widget = StationWidget(i + 1, self.bg_colors[i], enabled=True, bar_on_left=bar_on_left)
+                    widget = StationWidget(i + 1, self.bg_colors[i], enabled=True, bar_on_left=bar_on_left, scale=scale)
                     widget.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
                 else:
                     widget = OfflineStationWidget(self.bg_colors[i])
                     widget.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
                 self.station_widgets[i] = widget
-
-            grid.addWidget(self.station_widgets[0], 0, 0)
-            grid.addWidget(self.station_widgets[1], 1, 0)
-            grid.addWidget(self.station_widgets[2], 0, 1)
-            grid.addWidget(self.station_widgets[3], 1, 1)
+                grid.addWidget(widget, row, column)
 
             # --- Right-side column for button labels ---
             self.button_column = ButtonColumnWidget(parent=self)
@@ -1001,13 +1034,15 @@ class RelayControlApp(QWidget):
                 print(f"StationStatusDialog: Station {station_index+1} selected for (re)connect")
             else:
                 logging.info(f"StationStatusDialog: Station {station_index+1} selected for (re)connect")
-            from main import try_connect_station  # Import your connect function
-            success = try_connect_station(station_index)
+            if self.connect_station_callback is None:
+                logging.error(f"No station connect callback; cannot reconnect station {station_index+1}")
+                return
+            success = self.connect_station_callback(station_index)
             if success:
                 if DEBUG:
-                    print(f"Station {station_index+1} connected and enabled.")
+                    print(f"Station {station_index+1} reconnecting and enabled.")
                 else:
-                    logging.info(f"Station {station_index+1} connected and enabled.")
+                    logging.info(f"Station {station_index+1} reconnecting and enabled.")
                 self.station_enabled[station_index] = True
                 self.update_station_states(self.station_enabled)
             else:
@@ -1719,14 +1754,14 @@ class StationStatusDialog(QDialog):
         self.bg_colors = bg_colors
         self.station_enabled = station_enabled
 
-        # Selection: 0-3 for stations, 4 for accept
+        # Selection: 0..num_stations-1 for stations, num_stations for accept
         self.selected_index = 0
-        self.num_stations = 4
+        self.num_stations = len(station_enabled)
 
         # Create frames and widgets
         self.station_frames = []
         self.station_boxes = []
-        stations_layout = QHBoxLayout()
+        stations_layout = QGridLayout()
         stations_layout.setSpacing(24)
         for i in range(self.num_stations):
             box_widget = StationBoxWidget(
@@ -1751,7 +1786,7 @@ class StationStatusDialog(QDialog):
             # Use custom paintEvent for highlight and rounded corners
             frame.paintEvent = lambda event, f=frame: frame_paintEvent(f, event)
             self.station_frames.append(frame)
-            stations_layout.addWidget(frame)
+            stations_layout.addWidget(frame, i // STATION_BOXES_PER_ROW, i % STATION_BOXES_PER_ROW)
         layout.addLayout(stations_layout)
 
         # Accept button
@@ -1957,7 +1992,7 @@ class OfflineStationWidget(QWidget):
 class StartupWizardDialog(QDialog):
     step_completed = pyqtSignal(dict)
 
-    def __init__(self, parent=None, num_stations=4, bottle_ranges=None):
+    def __init__(self, parent=None, num_stations=NUM_STATIONS, bottle_ranges=None):
         super().__init__(parent)
         self.setWindowFlags(Qt.WindowType.FramelessWindowHint | Qt.WindowType.Dialog)
         self.setModal(True)
@@ -1998,7 +2033,7 @@ class StartupWizardDialog(QDialog):
         self.info_label.setPalette(info_palette)
         self.main_layout.addWidget(self.info_label)
 
-        self.stations_layout = QHBoxLayout()
+        self.stations_layout = QGridLayout()
         self.stations_layout.setSpacing(10)
         self.station_boxes = []
         self.station_frames = []
@@ -2027,7 +2062,7 @@ class StartupWizardDialog(QDialog):
             frame.setSizePolicy(QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Minimum)
             frame.paintEvent = lambda event, f=frame: frame_paintEvent(f, event)
             self.station_frames.append(frame)
-            self.stations_layout.addWidget(frame)
+            self.stations_layout.addWidget(frame, i // STATION_BOXES_PER_ROW, i % STATION_BOXES_PER_ROW)
         self.main_layout.addLayout(self.stations_layout, stretch=2)
         self.main_layout.addStretch(1)
 
@@ -2213,11 +2248,12 @@ class StartupWizardDialog(QDialog):
     def set_weight(self, station_index, weight, target_weight=None, unit="g"):
         """
         Update the weight label for a specific station during startup wizard.
+        Returns True if the label text changed.
         """
         self.station_weights[station_index] = weight
         box = self.station_boxes[station_index]
         if hasattr(box, "set_weight"):
-            box.set_weight(weight, target_weight, unit)
+            return box.set_weight(weight, target_weight, unit)
         else:
             # Fallback: set text directly
             if hasattr(box, "weight_label") and box.weight_label:
@@ -39,6 +39,7 @@ LANGUAGES = {
         "SMART": "SMART",
         "CONNECTED": "CONNECTED",
         "DISCONNECTED": "DISCONNECTED",
+        "RECONNECTING": "RECONNECTING",
         "TARGET WEIGHT SAVED:": "TARGET WEIGHT SAVED:",
         "TIME LIMIT SAVED:": "TIME LIMIT SAVED:",
         "ERROR": "ERROR",
@@ -169,6 +170,7 @@ LANGUAGES = {
         "SMART": "INTELIGENTE",
         "CONNECTED": "CONECTADO",
         "DISCONNECTED": "DESCONECTADO",
+        "RECONNECTING": "RECONECTANDO",
         "TARGET WEIGHT SAVED:": "PESO OBJETIVO GUARDADO:",
         "TIME LIMIT SAVED:": "LÍMITE DE TIEMPO GUARDADO:",
         "ERROR": "ERROR",
@@ -0,0 +1,745 @@
+"""
+Hardware I/O in its own process (serial_engine=process in config.txt).
+
+The child process owns every serial port: it runs the handshakes, streams the
+stations with the threaded serial engine and broadcasts E-STOP to the boards
+as soon as it sees the pin, whatever the GUI is doing. The two processes share
+one multiprocessing.shared_memory segment:
+
+  header         layout version, station count, child ready/E-STOP flags
+  station table  one fixed-size row per station: newest weight, link status,
+                 fill phase, error flags, last receive time; written only by
+                 the child under a per-row sequence counter (seqlock), so the
+                 GUI reads a consistent row without taking a lock
+  command ring   GUI -> child: bytes to write to a port, attach/detach/close,
+                 connect requests
+  event ring     child -> GUI: every message in arrival order (weights
+                 included, so no sample is lost between ticks), LINK_LOST
+                 and connect replies
+
+Both rings have exactly one producer and one consumer process, so the head and
+tail indices are each written by one side only and need no lock between the
+processes. The GUI drains the event ring once per poll_hardware tick; the
+table is what a status view or the stall watchdog reads without replaying it.
+
+Run by HardwareProcess as:
+    python hardware_process.py --shm <name> --stations <n> [--trace <file>] [--serials <sn,sn,...>]
+"""
+import argparse
+import collections
+import itertools
+import logging
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import serial
+
+import config
+from frame_decoder import OPCODE_BYTES, PROTOCOL_V1
+from serial_engine import LINK_LOST
+
+LAYOUT_MAGIC = 0x504D4857  # "PMHW"
+
+# Header: magic, num_stations, child ready, E-STOP pressed, child heartbeat (monotonic)
+HEADER = struct.Struct('<IHBBd')
+HEADER_SIZE = 64
+
+# Station row: seq, weight, device millis, received_at, samples, link, phase, errors,
+# protocol, last_rx, heartbeats. seq is odd while the child is writing the row.
+ROW = struct.Struct('<IiIdIBBBBdI')
+ROW_SEQ = struct.Struct('<I')
+
+# Ring slots: u16 length, then the record
+RING_INDEX = struct.Struct('<I')
+RING_LENGTH = struct.Struct('<H')
+RING_CONTROL_SIZE = 128  # head and tail on separate cache lines
+COMMAND_SLOTS = 256
+COMMAND_SLOT_SIZE = 64
+EVENT_SLOTS = 512
+EVENT_SLOT_SIZE = 288  # room for a MAX_LINE_LENGTH text line
+
+# Command record: op, link id, then data
+COMMAND = struct.Struct('<BH')
+CMD_WRITE = 1
+CMD_ATTACH = 2
+CMD_DETACH = 3
+CMD_CLOSE = 4
+CMD_CONNECT = 5  # data: u16 request id + port name
+CMD_SHUTDOWN = 6
+COMMAND_DATA_SIZE = COMMAND_SLOT_SIZE - RING_LENGTH.size - COMMAND.size
+
+# Event record: link id, kind, code, payload kind, received_at, then data
+EVENT = struct.Struct('<HBBBd')
+EVENT_MESSAGE = 1  # code = message type byte
+EVENT_LINK_LOST = 2
+EVENT_CONNECTED = 3  # code = station index or NO_STATION, data = CONNECT_REPLY
+NO_STATION = 0xFF
+CONNECT_REPLY = struct.Struct('<HBI')  # request id, protocol version, baud rate
+CONNECT_REQUEST = struct.Struct('<H')
+PAYLOAD_NONE = 0
+PAYLOAD_INT = 1
+PAYLOAD_BYTES = 2
+PAYLOAD_INT_FORMAT = struct.Struct('<q')
+
+# Station table values
+LINK_OFFLINE = 0
+LINK_ONLINE = 1
+PHASE_IDLE = 0
+PHASE_AUTO = 1
+PHASE_SMART = 2
+PHASE_MANUAL = 3
+PHASE_DONE = 4
+ERROR_LINK = 0x01
+ERROR_MAX_WEIGHT = 0x02
+ERROR_BUTTON = 0x04
+
+# Child loop sleep when there was nothing to do
+SERVER_IDLE_SLEEP = 0.002
+# How long the GUI waits for the child to come up, and for one connect request
+# (serial reply + calibration + baud switch timeouts of the handshake)
+START_TIMEOUT = 10.0
+CONNECT_TIMEOUT = 15.0
+COMMAND_RING_WAIT = 0.1
+
+StationSnapshot = collections.namedtuple(
+    "StationSnapshot",
+    "weight device_millis received_at samples link phase errors protocol last_rx heartbeats",
+)
+
+
+def segment_size(num_stations):
+    return (HEADER_SIZE + ROW.size * num_stations
+            + RING_CONTROL_SIZE + COMMAND_SLOTS * COMMAND_SLOT_SIZE
+            + RING_CONTROL_SIZE + EVENT_SLOTS * EVENT_SLOT_SIZE)
+
+
+class StationTable:
+    """Fixed-layout per-station rows; one writer (the child), any number of readers."""
+    def __init__(self, buf, num_stations, offset=HEADER_SIZE):
+        self.buf = buf
+        self.num_stations = num_stations
+        self.offset = offset
+        self._seq = [0] * num_stations
+
+    def write(self, station_index, values):
+        """values: the StationSnapshot fields in order."""
+        at = self.offset + station_index * ROW.size
+        seq = self._seq[station_index] + 1
+        ROW_SEQ.pack_into(self.buf, at, seq)
+        ROW.pack_into(self.buf, at, seq, *values)
+        self._seq[station_index] = seq + 1
+        ROW_SEQ.pack_into(self.buf, at, seq + 1)
+
+    def read(self, station_index):
+        """Consistent snapshot of one row, retried while the child is mid-write."""
+        at = self.offset + station_index * ROW.size
+        while True:
+            row = ROW.unpack_from(self.buf, at)
+            if not row[0] & 1 and ROW_SEQ.unpack_from(self.buf, at)[0] == row[0]:
+                return StationSnapshot._make(row[1:])
+
+
+class ShmRing:
+    """
+    Single-producer, single-consumer ring of fixed-size slots.
+    The producer only writes head, the consumer only writes tail; a slot is
+    filled before head moves past it and read before tail does.
+    """
+    def __init__(self, buf, offset, slots, slot_size):
+        self.buf = buf
+        self.head_at = offset
+        self.tail_at = offset + RING_CONTROL_SIZE // 2
+        self.slots_at = offset + RING_CONTROL_SIZE
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - RING_LENGTH.size
+
+    def push(self, record):
+        """Append one record; False if the ring is full."""
+        head = RING_INDEX.unpack_from(self.buf, self.head_at)[0]
+        tail = RING_INDEX.unpack_from(self.buf, self.tail_at)[0]
+        if (head - tail) & 0xFFFFFFFF >= self.slots:
+            return False
+        at = self.slots_at + (head % self.slots) * self.slot_size
+        RING_LENGTH.pack_into(self.buf, at, len(record))
+        self.buf[at + RING_LENGTH.size:at + RING_LENGTH.size + len(record)] = record
+        RING_INDEX.pack_into(self.buf, self.head_at, (head + 1) & 0xFFFFFFFF)
+        return True
+
+    def pop(self):
+        """Oldest record as bytes, or None if the ring is empty."""
+        tail = RING_INDEX.unpack_from(self.buf, self.tail_at)[0]
+        if tail == RING_INDEX.unpack_from(self.buf, self.head_at)[0]:
+            return None
+        at = self.slots_at + (tail % self.slots) * self.slot_size
+        length = RING_LENGTH.unpack_from(self.buf, at)[0]
+        record = bytes(self.buf[at + RING_LENGTH.size:at + RING_LENGTH.size + length])
+        RING_INDEX.pack_into(self.buf, self.tail_at, (tail + 1) & 0xFFFFFFFF)
+        return record
+
+
+def open_layout(buf, num_stations):
+    """(table, command ring, event ring) views on a segment."""
+    table = StationTable(buf, num_stations)
+    commands_at = HEADER_SIZE + ROW.size * num_stations
+    commands = ShmRing(buf, commands_at, COMMAND_SLOTS, COMMAND_SLOT_SIZE)
+    events_at = commands_at + RING_CONTROL_SIZE + COMMAND_SLOTS * COMMAND_SLOT_SIZE
+    events = ShmRing(buf, events_at, EVENT_SLOTS, EVENT_SLOT_SIZE)
+    return table, commands, events
+
+
+def encode_payload(payload):
+    if payload is None:
+        return PAYLOAD_NONE, b''
+    if isinstance(payload, int):
+        return PAYLOAD_INT, PAYLOAD_INT_FORMAT.pack(payload)
+    return PAYLOAD_BYTES, bytes(payload)
+
+
+def decode_payload(payload_kind, data):
+    if payload_kind == PAYLOAD_INT:
+        return PAYLOAD_INT_FORMAT.unpack(data)[0]
+    if payload_kind == PAYLOAD_BYTES:
+        return data
+    return None
+
+
+# ========== GUI SIDE ==========
+
+class RemotePort:
+    """
+    Stand-in for a serial port owned by the hardware process.
+    Writes go over the command ring; reads arrive through ProcessSerialEngine,
+    so in_waiting is always 0 here.
+    """
+    def __init__(self, hardware, link_id, port, protocol_version, baudrate):
+        self.hardware = hardware
+        self.link_id = link_id
+        self.port = port
+        self.protocol_version = protocol_version
+        self.baudrate = baudrate
+        self.is_open = True
+        self.in_waiting = 0
+
+    def write(self, data):
+        if not self.is_open:
+            raise OSError(f"{self.port} is closed")
+        if not self.hardware.command(CMD_WRITE, self.link_id, bytes(data)):
+            raise serial.SerialException(f"{self.port}: write dropped, hardware process not accepting commands")
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self, size=1):
+        return b''
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.hardware.command(CMD_CLOSE, self.link_id)
+            self.hardware.forget(self)
+
+    def __repr__(self):
+        return f"RemotePort({self.port!r}, link={self.link_id})"
+
+
+class HardwareProcess:
+    """
+    GUI-side handle on the hardware process: starts it, owns the shared
+    segment, pushes commands and collects events. Safe to call from the GUI
+    thread and the reconnect supervisor threads (a lock serializes this
+    process's side of each ring).
+    """
+    def __init__(self, num_stations, trace_path=None, station_serials=None):
+        self.num_stations = num_stations
+        self.trace_path = trace_path
+        self.station_serials = station_serials
+        self.shm = None
+        self.table = None
+        self.process = None
+        self.events = collections.deque()
+        self._commands = None
+        self._events = None
+        self._command_lock = threading.Lock()
+        self._event_lock = threading.Lock()
+        self._links = {}  # link id -> RemotePort
+        self._replies = {}  # request id -> (station_index, link_id, protocol, baud)
+        self._waiting = set()
+        self._request_ids = itertools.count(1)
+        self._exited = False
+
+    def start(self, timeout=START_TIMEOUT):
+        self.shm = shared_memory.SharedMemory(create=True, size=segment_size(self.num_stations))
+        self.shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        HEADER.pack_into(self.shm.buf, 0, LAYOUT_MAGIC, self.num_stations, 0, 0, 0.0)
+        self.table, self._commands, self._events = open_layout(self.shm.buf, self.num_stations)
+        args = [sys.executable, os.path.abspath(__file__), "--shm", self.shm.name, "--stations", str(self.num_stations)]
+        if self.trace_path:
+            args += ["--trace", self.trace_path]
+        if self.station_serials:
+            args += ["--serials", ",".join(serial or "" for serial in self.station_serials)]
+        self.process = subprocess.Popen(args, cwd=os.path.dirname(os.path.abspath(__file__)))
+        deadline = time.monotonic() + timeout
+        while not self.header()[2]:
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("hardware process did not start")
+            time.sleep(0.01)
+        if config.DEBUG:
+            print(f"[HardwareProcess] Started pid {self.process.pid}, shared segment {self.shm.name}")
+
+    def header(self):
+        return HEADER.unpack_from(self.shm.buf, 0)
+
+    def estop_pressed(self):
+        """E-STOP as last seen by the hardware process."""
+        return bool(self.header()[3])
+
+    def command(self, op, link_id=0, data=b''):
+        """Queue a command for the child; writes longer than one slot are split."""
+        chunks = [data[i:i + COMMAND_DATA_SIZE] for i in range(0, len(data), COMMAND_DATA_SIZE)] or [b'']
+        with self._command_lock:
+            for chunk in chunks:
+                record = COMMAND.pack(op, link_id) + chunk
+                deadline = time.monotonic() + COMMAND_RING_WAIT
+                while not self._commands.push(record):
+                    if time.monotonic() > deadline or self._exited:
+                        logging.error(f"Hardware process command ring full, dropped command {op} for link {link_id}")
+                        return False
+                    time.sleep(0.001)
+        return True
+
+    def connect(self, port, timeout=CONNECT_TIMEOUT):
+        """Have the child open and handshake port. Returns (station_index, RemotePort) or (None, None)."""
+        request_id = next(self._request_ids) & 0xFFFF
+        with self._event_lock:
+            self._waiting.add(request_id)
+        self.command(CMD_CONNECT, 0, CONNECT_REQUEST.pack(request_id) + port.encode('utf-8'))
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline and not self._exited:
+                self.poll()
+                with self._event_lock:
+                    reply = self._replies.pop(request_id, None)
+                if reply is not None:
+                    station_index, link_id, protocol_version, baudrate = reply
+                    if station_index is None:
+                        return None, None
+                    arduino = RemotePort(self, link_id, port, protocol_version, baudrate)
+                    self._links[link_id] = arduino
+                    return station_index, arduino
+                time.sleep(0.01)
+        finally:
+            with self._event_lock:
+                self._waiting.discard(request_id)
+        logging.error(f"Hardware process: no connect reply for {port} within {timeout:.0f} s")
+        return None, None
+
+    def poll(self):
+        """Move everything from the event ring into self.events (and connect replies to their waiters)."""
+        with self._event_lock:
+            pop = self._events.pop
+            record = pop()
+            while record is not None:
+                link_id, kind, code, payload_kind, received_at = EVENT.unpack_from(record)
+                data = record[EVENT.size:]
+                if kind == EVENT_CONNECTED:
+                    request_id, protocol_version, baudrate = CONNECT_REPLY.unpack(data)
+                    station_index = None if code == NO_STATION else code
+                    if request_id in self._waiting:
+                        self._replies[request_id] = (station_index, link_id, protocol_version, baudrate)
+                    elif station_index is not None:
+                        # The requester gave up; do not leave the port open in the child
+                        self.command(CMD_CLOSE, link_id)
+                else:
+                    arduino = self._links.get(link_id)
+                    if arduino is not None:
+                        if kind == EVENT_LINK_LOST:
+                            self.events.append((arduino, LINK_LOST, data, received_at))
+                        else:
+                            self.events.append((arduino, OPCODE_BYTES[code], decode_payload(payload_kind, data), received_at))
+                record = pop()
+            if not self._exited and self.process is not None and self.process.poll() is not None:
+                self._exited = True
+                logging.error(f"Hardware process exited with status {self.process.returncode}")
+                for arduino in list(self._links.values()):
+                    if arduino.is_open:
+                        self.events.append((arduino, LINK_LOST, b"hardware process exited", time.monotonic()))
+
+    def forget(self, arduino):
+        self._links.pop(getattr(arduino, "link_id", None), None)
+
+    def stop(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.command(CMD_SHUTDOWN)
+                try:
+                    self.process.wait(timeout=2.0)
+                except subprocess.TimeoutExpired:
+                    self.process.terminate()
+                    self.process.wait(timeout=2.0)
+            self.process = None
+        if self.shm is not None:
+            self.table = self._commands = self._events = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class ProcessSerialEngine:
+    """
+    Serial engine backed by a HardwareProcess. drain() feeds the stall
+    watchdog from each attached station's table row and then yields the
+    queued events in arrival order, weights included, in the same
+    (station_index, arduino, message_type, payload, received_at) form as the
+    in-process engines.
+    """
+    def __init__(self, hardware, watchdog=None):
+        self.hardware = hardware
+        self.watchdog = watchdog
+        self.ports = {}  # station_index -> RemotePort
+        self._last_rx = [0.0] * hardware.num_stations
+
+    def start(self, arduinos):
+        for station_index, arduino in enumerate(arduinos):
+            if arduino is not None:
+                self.attach(station_index, arduino)
+
+    def attach(self, station_index, arduino):
+        self.detach(station_index)
+        self.ports[station_index] = arduino
+        self.hardware.command(CMD_ATTACH, arduino.link_id, bytes((station_index,)))
+        if config.DEBUG:
+            print(f"[ProcessSerialEngine] Streaming station {station_index+1} from {arduino.port}")
+
+    def detach(self, station_index):
+        arduino = self.ports.pop(station_index, None)
+        if arduino is not None:
+            self.hardware.command(CMD_DETACH, arduino.link_id)
+
+    def stop(self):
+        for station_index in list(self.ports):
+            self.detach(station_index)
+
+    def drain(self, max_events=None):
+        hardware = self.hardware
+        hardware.poll()
+        if self.watchdog is not None:
+            read = hardware.table.read
+            for station_index in list(self.ports):
+                row = read(station_index)
+                if row.last_rx != self._last_rx[station_index]:
+                    self._last_rx[station_index] = row.last_rx
+                    self.watchdog.feed(station_index, config.HEARTBEAT if row.heartbeats else None, row.last_rx)
+        ports = {id(arduino): station_index for station_index, arduino in self.ports.items()}
+        count = 0
+        events = hardware.events
+        while events and (max_events is None or count < max_events):
+            arduino, message_type, payload, received_at = events.popleft()
+            station_index = ports.get(id(arduino))
+            if station_index is None:
+                continue
+            count += 1
+            yield station_index, arduino, message_type, payload, received_at
+
+
+def step_connect_arduinos_process(context):
+    """Hardware process variant of startup.step_connect_arduinos."""
+    try:
+        print("Step: Connect and initialize Arduinos (hardware process)")
+        hardware = context['hardware_process']
+        NUM_STATIONS = context['NUM_STATIONS']
+        ports = list(getattr(context['config'], 'arduino_ports', []))
+        station_connected = [False] * NUM_STATIONS
+        arduinos = [None] * NUM_STATIONS
+        started = time.monotonic()
+        if ports:
+            with ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="handshake") as executor:
+                futures = {executor.submit(hardware.connect, port): port for port in ports}
+                for future in as_completed(futures):
+                    station_index, arduino = future.result()
+                    if arduino is None:
+                        continue
+                    if arduinos[station_index] is not None:
+                        logging.error(f"Station {station_index+1} answered on {futures[future]} as well, keeping the first port")
+                        arduino.close()
+                        continue
+                    arduinos[station_index] = arduino
+                    station_connected[station_index] = True
+                    print(f"[DEBUG] Station {station_index+1} connected on {futures[future]} "
+                          f"(protocol v{arduino.protocol_version} at {arduino.baudrate} baud)")
+        print(f"Arduino discovery finished in {time.monotonic() - started:.2f} s")
+        context['station_connected'] = station_connected
+        context['arduinos'] = arduinos
+        print(f"[DEBUG] Final station_connected: {context['station_connected']}")
+        return 'completed'
+    except Exception as e:
+        logging.error(f"Error in step_connect_arduinos_process: {e}")
+        print(f"[ERROR] Exception in step_connect_arduinos_process: {e}")
+
+
+# ========== HARDWARE PROCESS ==========
+
+class HardwareServer:
+    """The child: serial ports, handshakes and E-STOP, publishing into the shared segment."""
+    def __init__(self, shm, num_stations, trace_path=None, station_serials=None):
+        from serial_engine import ThreadedSerialEngine
+        self.shm = shm
+        self.num_stations = num_stations
+        self.station_serials = station_serials
+        self.table, self.commands, self.events = open_layout(shm.buf, num_stations)
+        self.engine = ThreadedSerialEngine()
+        self.rows = [[0, 0, 0.0, 0, LINK_OFFLINE, PHASE_IDLE, 0, PROTOCOL_V1, 0.0, 0] for _ in range(num_stations)]
+        self.links = {}  # link id -> (station_index, arduino)
+        self.streaming = {}  # station_index -> link id
+        self.pending_events = collections.deque()  # waiting for room in the event ring
+        self.connected = collections.deque()  # (request_id, station_index, arduino) from handshake threads
+        self.estop = False
+        self.running = True
+        self.trace = None
+        self._link_ids = itertools.count(1)
+        self._parent = os.getppid()
+        if trace_path:
+            from serial_trace import TraceWriter
+            self.trace = TraceWriter(trace_path)
+
+    def set_header(self, ready):
+        HEADER.pack_into(self.shm.buf, 0, LAYOUT_MAGIC, self.num_stations, ready, self.estop, time.monotonic())
+
+    def publish(self, station_index):
+        self.table.write(station_index, self.rows[station_index])
+
+    def post(self, record):
+        if self.pending_events or not self.events.push(record):
+            self.pending_events.append(record)
+
+    def setup_gpio(self):
+        from config import GPIO, E_STOP_PIN
+        try:
+            GPIO.setwarnings(False)
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(E_STOP_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        except Exception as e:
+            logging.error(f"Hardware process: E-STOP input setup failed: {e}")
+
+    def check_estop(self):
+        """Stop every board the moment the E-STOP goes down."""
+        from config import GPIO, E_STOP_PIN
+        pressed = GPIO.input(E_STOP_PIN) == GPIO.LOW
+        if pressed == self.estop:
+            return
+        self.estop = pressed
+        if pressed:
+            for link_id in self.streaming.values():
+                station_index, arduino = self.links[link_id]
+                try:
+                    arduino.write(config.E_STOP_ACTIVATED)
+                    arduino.flush()
+                except Exception as e:
+                    logging.error(f"Station {station_index+1}: E-STOP write failed: {e}")
+                self.rows[station_index][5] = PHASE_IDLE
+                self.publish(station_index)
+
+    def connect(self, request_id, port):
+        """Handshake thread for one CMD_CONNECT."""
+        from startup import handshake_port
+        from utils import load_station_serials, load_scale_calibrations
+        station_index, arduino, timings = handshake_port(
+            port, self.station_serials or load_station_serials(), load_scale_calibrations(), config, config.DEBUG
+        )
+        self.connected.append((request_id, station_index, arduino))
+
+    def finish_connects(self):
+        while self.connected:
+            request_id, station_index, arduino = self.connected.popleft()
+            if arduino is None or station_index is None or station_index >= self.num_stations:
+                self.post(EVENT.pack(0, EVENT_CONNECTED, NO_STATION, PAYLOAD_NONE, time.monotonic())
+                          + CONNECT_REPLY.pack(request_id, 0, 0))
+                continue
+            if self.trace is not None:
+                arduino = self.trace.wrap(station_index, arduino)
+            link_id = next(self._link_ids) & 0xFFFF
+            self.links[link_id] = (station_index, arduino)
+            protocol_version = getattr(arduino, "protocol_version", PROTOCOL_V1)
+            self.post(EVENT.pack(link_id, EVENT_CONNECTED, station_index, PAYLOAD_NONE, time.monotonic())
+                      + CONNECT_REPLY.pack(request_id, protocol_version, arduino.baudrate))
+
+    def track_write(self, station_index, data):
+        """Fill phase changes the host commands."""
+        row = self.rows[station_index]
+        opcode = data[:1]
+        if opcode == config.MANUAL_FILL_START:
+            row[5] = PHASE_MANUAL
+        elif opcode in (config.EXIT_MANUAL_END, config.E_STOP_ACTIVATED, config.STOP):
+            row[5] = PHASE_IDLE
+        else:
+            return
+        self.publish(station_index)
+
+    def handle_commands(self):
+        handled = 0
+        touched = set()
+        record = self.commands.pop()
+        while record is not None:
+            handled += 1
+            op, link_id = COMMAND.unpack_from(record)
+            data = record[COMMAND.size:]
+            link = self.links.get(link_id)
+            if op == CMD_WRITE and link is not None:
+                station_index, arduino = link
+                try:
+                    arduino.write(data)
+                    touched.add(link_id)
+                    self.track_write(station_index, data)
+                except Exception as e:
+                    logging.error(f"Station {station_index+1}: write failed in hardware process: {e}")
+            elif op == CMD_ATTACH and link is not None:
+                station_index, arduino = link
+                self.streaming[station_index] = link_id
+                row = self.rows[station_index]
+                row[4] = LINK_ONLINE
+                row[6] &= ~ERROR_LINK
+                row[7] = getattr(arduino, "protocol_version", PROTOCOL_V1)
+                self.publish(station_index)
+                self.engine.attach(station_index, arduino)
+            elif op in (CMD_DETACH, CMD_CLOSE) and link is not None:
+                station_index, arduino = link
+                if self.streaming.get(station_index) == link_id:
+                    del self.streaming[station_index]
+                    self.engine.detach(station_index)
+                    self.rows[station_index][4] = LINK_OFFLINE
+                    self.publish(station_index)
+                if op == CMD_CLOSE:
+                    del self.links[link_id]
+                    touched.discard(link_id)
+                    try:
+                        arduino.close()
+                    except Exception:
+                        pass
+            elif op == CMD_CONNECT:
+                request_id = CONNECT_REQUEST.unpack_from(data)[0]
+                port = data[CONNECT_REQUEST.size:].decode('utf-8', errors='replace')
+                threading.Thread(target=self.connect, args=(request_id, port), name=f"connect-{port}", daemon=True).start()
+            elif op == CMD_SHUTDOWN:
+                self.running = False
+            record = self.commands.pop()
+        for link_id in touched:
+            try:
+                self.links[link_id][1].flush()
+            except Exception:
+                pass
+        return handled
+
+    def handle_events(self):
+        handled = 0
+        for station_index, arduino, message_type, payload, received_at in self.engine.drain():
+            handled += 1
+            link_id = self.streaming.get(station_index)
+            if link_id is None or self.links[link_id][1] is not arduino:
+                continue
+            row = self.rows[station_index]
+            if message_type is LINK_LOST:
+                row[4] = LINK_OFFLINE
+                row[6] |= ERROR_LINK
+                self.publish(station_index)
+                self.post(EVENT.pack(link_id, EVENT_LINK_LOST, 0, PAYLOAD_BYTES, received_at) + payload)
+                continue
+            row[8] = received_at
+            if message_type == config.CURRENT_WEIGHT:
+                row[0], row[1], row[2] = payload, 0, received_at
+                row[3] += 1
+                self.post(EVENT.pack(link_id, EVENT_MESSAGE, message_type[0], PAYLOAD_INT, received_at)
+                          + PAYLOAD_INT_FORMAT.pack(payload))
+            elif message_type == config.WEIGHT_BATCH:
+                count = len(payload) // 8
+                if count:
+                    row[1], row[0] = struct.unpack_from('<Ii', payload, (count - 1) * 8)
+                    row[2] = received_at
+                    row[3] += count
+                    # Whole samples per slot; a batch too big for one slot goes as several
+                    room = (self.events.capacity - EVENT.size) // 8 * 8
+                    for start in range(0, count * 8, room):
+                        self.post(EVENT.pack(link_id, EVENT_MESSAGE, message_type[0], PAYLOAD_BYTES, received_at)
+                                  + payload[start:min(start + room, count * 8)])
+            elif message_type == config.HEARTBEAT:
+                row[9] += 1
+            else:
+                if message_type == config.BEGIN_AUTO_FILL:
+                    row[5] = PHASE_AUTO
+                    row[6] &= ~ERROR_BUTTON
+                elif message_type == config.BEGIN_SMART_FILL:
+                    row[5] = PHASE_SMART
+                    row[6] &= ~ERROR_BUTTON
+                elif message_type == config.FINAL_WEIGHT:
+                    row[5] = PHASE_DONE
+                elif message_type == config.MAX_WEIGHT_WARNING:
+                    row[6] |= ERROR_MAX_WEIGHT
+                elif message_type == config.MAX_WEIGHT_END:
+                    row[6] &= ~ERROR_MAX_WEIGHT
+                elif message_type == config.BUTTON_ERROR:
+                    row[6] |= ERROR_BUTTON
+                payload_kind, data = encode_payload(payload)
+                self.post(EVENT.pack(link_id, EVENT_MESSAGE, message_type[0], payload_kind, received_at)
+                          + data[:self.events.capacity - EVENT.size])
+            self.publish(station_index)
+        return handled
+
+    def run(self):
+        self.setup_gpio()
+        self.engine.start([])
+        self.set_header(ready=1)
+        try:
+            while self.running:
+                while self.pending_events and self.events.push(self.pending_events[0]):
+                    self.pending_events.popleft()
+                busy = self.handle_commands()
+                self.finish_connects()
+                self.check_estop()
+                busy += self.handle_events()
+                self.set_header(ready=1)
+                if os.getppid() != self._parent:
+                    logging.error("Hardware process: GUI process went away, shutting down")
+                    break
+                if not busy:
+                    time.sleep(SERVER_IDLE_SLEEP)
+        finally:
+            self.engine.stop()
+            for station_index, arduino in self.links.values():
+                try:
+                    arduino.close()
+                except Exception:
+                    pass
+            if self.trace is not None:
+                self.trace.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Station serial I/O for main.py (serial_engine=process)")
+    parser.add_argument("--shm", required=True, help="shared memory segment created by the GUI process")
+    parser.add_argument("--stations", type=int, required=True)
+    parser.add_argument("--trace", help="capture serial traffic to this file (serial_trace.py format)")
+    parser.add_argument("--serials", help="comma-separated station serial numbers instead of those in config.txt")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s - hardware - %(levelname)s - %(message)s")
+    shm = shared_memory.SharedMemory(name=args.shm)
+    # The GUI process created the segment and unlinks it; keep this process's tracker off it
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, "shared_memory")
+    try:
+        serials = [serial or None for serial in args.serials.split(",")] if args.serials else None
+        HardwareServer(shm, args.stations, args.trace, serials).run()
+    finally:
+        shm.close()
+
+
+if __name__ == "__main__":
+    main()
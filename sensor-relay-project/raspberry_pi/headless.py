@@ -0,0 +1,154 @@
+"""
+Headless fill engine: the serial engine, message handlers, fill staging,
+E-STOP handling, reconnects and stats logging of main.py, without PyQt6 or a
+display. For servers, containers and load tests (e.g. against
+scale_simulator.py); the touchscreen startup wizard is replaced by
+command-line options.
+
+    python headless.py --target 500 --time-limit 3000
+    python headless.py --gpio file:/tmp/gpio.txt --seconds 60    # echo 23=0 > /tmp/gpio.txt: E-STOP
+    python headless.py --stations 8 --ports auto --gpio mock
+
+Settings come from config.txt like main.py (serial_engine=, arduino_ports=,
+stationN_enabled=, ...). serial_engine=asyncio needs the Qt event loop and
+falls back to threaded here.
+"""
+import argparse
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Same period as main.py's poll_hardware QTimer
+TICK = 0.035
+
+
+class HeadlessApp:
+    """The attributes poll_hardware reads from the GUI app, without a GUI."""
+    active_dialog = None
+    overlay_widget = None
+    refresh_ui = None
+    station_widgets = None
+
+    def __init__(self, target_weight, time_limit, filling_mode):
+        self.target_weight = target_weight
+        self.time_limit = time_limit
+        self.filling_mode = filling_mode
+
+    def tr(self, text):
+        return text
+
+
+def prepare_host(args):
+    """
+    Pick the GPIO backend and station count, then import main (which imports
+    config, which creates GPIO). Must run before anything imports config.
+    """
+    if args.gpio:
+        os.environ["PM_GPIO"] = args.gpio
+    if args.stations:
+        os.environ["PM_NUM_STATIONS"] = str(args.stations)
+    import config
+    config.DEBUG = args.debug
+    import main as host
+    host.DEBUG = args.debug
+    host.handler_ctx.DEBUG = args.debug
+    return host
+
+
+def connect_stations(host):
+    """Handshake every enabled station in parallel; the reconnect supervisor keeps looking for the rest."""
+    enabled = [station.index for station in host.stations if station.enabled]
+    ports = {station_index: host.station_port(station_index) for station_index in enabled}
+    with ThreadPoolExecutor(max_workers=max(1, len(enabled))) as executor:
+        found = dict(zip(enabled, executor.map(lambda i: host.connect_station(i, ports[i]), enabled)))
+    missing = []
+    for station_index, arduino in found.items():
+        if arduino is None:
+            missing.append(station_index)
+        else:
+            host.install_station_port(station_index, arduino)
+    return missing
+
+
+def print_event(event):
+    """Console subscriber: one line per fill and E-STOP change."""
+    if hasattr(event, "fill_time_ms"):
+        result = "TIMEOUT" if event.timed_out else "complete"
+        print(f"Station {event.station_index+1}: fill {result}, {event.final_weight} g "
+              f"(target {event.target_weight:g} g) in {event.fill_time_ms / 1000.0:.2f} s")
+    else:
+        print("E-STOP pressed" if event.active else "E-STOP released")
+
+
+def run(args):
+    host = prepare_host(args)
+    import config
+    from event_bus import FillCompleted, EStop, DELIVER_THREAD
+
+    host.load_settings(args.config)
+    if args.ports == "auto":
+        config.ARDUINO_PORT_DISCOVERY = True
+        host.arduino_ports[:] = host.discover_arduino_ports()
+    elif args.ports:
+        host.arduino_ports[:] = [port.strip() for port in args.ports.split(",") if port.strip()]
+    if config.SERIAL_ENGINE == "asyncio":
+        print("serial_engine=asyncio needs the Qt event loop; using threaded")
+        config.SERIAL_ENGINE = "threaded"
+    host.event_bus.subscribe(FillCompleted, host.log_fill_completed, DELIVER_THREAD, name="stats_log")
+    host.event_bus.subscribe((FillCompleted, EStop), print_event, name="console")
+    host.setup_gpio()
+
+    stopping = []
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    try:
+        if config.SERIAL_ENGINE == "process":
+            host.start_hardware_process()
+        started = time.monotonic()
+        missing = connect_stations(host)
+        online = [station.index + 1 for station in host.stations if station.arduino is not None]
+        print(f"Stations online: {online} ({time.monotonic() - started:.1f} s)")
+        host.start_serial_engine()
+        for station_index in missing:
+            print(f"Station {station_index+1} not found on {host.station_port(station_index)}, retrying in the background")
+            host.reconnect_supervisor.request(station_index, host.station_port(station_index))
+
+        app = HeadlessApp(args.target, args.time_limit, args.mode)
+        host.filling_mode_callback(args.mode)
+        host.GPIO.output(config.RELAY_POWER_PIN, host.GPIO.HIGH)
+        config.RELAY_POWER_ENABLED = True
+        print(f"Filling: {args.mode} mode, target {args.target:g} g, time limit {args.time_limit} ms "
+              f"({config.SERIAL_ENGINE} engine, {config.GPIO_BACKEND} GPIO)")
+
+        deadline = time.monotonic()
+        end = deadline + args.seconds if args.seconds else None
+        while not stopping and (end is None or time.monotonic() < end):
+            host.poll_hardware(app)
+            deadline += TICK
+            time.sleep(max(0.0, deadline - time.monotonic()))
+    finally:
+        config.RELAY_POWER_ENABLED = False
+        host.GPIO.output(config.RELAY_POWER_PIN, host.GPIO.LOW)
+        print("Shutting down...")
+        host.shutdown()
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the fill engine without the GUI.")
+    parser.add_argument("--target", type=float, default=500.0, help="target weight in grams (default 500)")
+    parser.add_argument("--time-limit", type=int, default=3000, help="fill time limit in ms (default 3000)")
+    parser.add_argument("--mode", choices=("AUTO", "MANUAL"), default="AUTO", help="filling mode (default AUTO)")
+    parser.add_argument("--gpio", help="GPIO backend: auto, real, mock or file:<path> (default: gpio= in config.txt)")
+    parser.add_argument("--stations", type=int, help="number of stations (default: num_stations= in config.txt)")
+    parser.add_argument("--ports", help="comma-separated serial ports, or auto (default: arduino_ports= in config.txt)")
+    parser.add_argument("--config", default="config.txt", help="config file (default config.txt)")
+    parser.add_argument("--seconds", type=float, default=0, help="stop after this long (default: until Ctrl-C)")
+    parser.add_argument("--debug", action="store_true", help="print the per-message debug output")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
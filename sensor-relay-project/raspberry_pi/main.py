@@ -7,15 +7,29 @@ import serial
 import config
 from config import GPIO
 from datetime import datetime
-from PyQt6.QtWidgets import QApplication
 import faulthandler
 faulthandler.enable()
-from PyQt6.QtCore import QTimer, Qt
-from gui.gui import RelayControlApp, MenuDialog, SelectionDialog, InfoDialog, StartupWizardDialog
-from gui.languages import LANGUAGES
+# PyQt6 and the gui package are imported by main() and the button handler, so
+# headless.py, serial_trace.py and the benchmarks can import this module without Qt
 import re
-from message_handlers import MESSAGE_HANDLERS, handle_unknown
-from startup import prestartup_steps
+import asyncio
+from message_handlers import dispatch_message, decode_weight_batch, HandlerContext
+from frame_decoder import make_decoder
+from serial_engine import create_serial_engine, LINK_LOST
+from async_serial import QtAsyncioBridge, handshake_arduino, SERIAL_REPLY_TIMEOUT, CALIBRATION_REQUEST_TIMEOUT
+from hardware_process import HardwareProcess
+from weight_coalescer import WeightCoalescer
+from clock_sync import ClockSync
+from display_latency import DisplayLatency, PATH_MAIN, PATH_WIZARD
+from event_bus import EventBus, EStop, FillCompleted, DELIVER_THREAD
+from station_display import StationDisplay
+from sample_rate import SampleRateController
+from fill_staging import FillStager
+from relay_cutoff import PredictiveCutoff
+from reconnect_supervisor import ReconnectSupervisor, STATION_CONNECTING, STATION_ONLINE
+from stall_watchdog import StallWatchdog
+from serial_trace import TraceWriter
+from startup import prestartup_steps, handshake_port
 from startup import (
     run_startup_sequence,
     step_load_serials_and_ranges,
@@ -34,6 +48,12 @@ from utils import (
     load_station_serials,
     load_bottle_sizes,
     load_bottle_weight_ranges,
+    load_serial_engine,
+    load_stall_timeout,
+    load_arduino_ports,
+    discover_arduino_ports,
+    load_serial_trace_dir,
+    load_predictive_cutoff,
     clear_serial_buffer,
     update_station_status
 )
@@ -47,15 +67,13 @@ from config import (
     DEBUG,
     E_STOP,
     FILL_LOCKED,
-    last_fill_time,
-    last_final_weight,
     fill_time_limit_reached,
     SESSION_ID,
+    stations,
     arduinos,
     station_connected,
-    serial_numbers,
+    station_enabled,
     filling_mode,
-    station_max_weight_error,
     BOTTLE_WEIGHT_TOLERANCE,
     RELAY_POWER_ENABLED,
     UP_BUTTON_PIN,
@@ -71,6 +89,10 @@ from config import (
     REQUEST_TIME_LIMIT,
     arduino_ports,
     E_STOP_ACTIVATED,
+    CURRENT_WEIGHT,
+    WEIGHT_BATCH,
+    TIME_ECHO,
+    HEARTBEAT,
 )
 
 from config import STATS_LOG_FILE, STATS_LOG_DIR
@@ -95,6 +117,45 @@ print(f"Logging to: {os.path.abspath(ERROR_LOG_FILE)}")
 logging.error("Test error log entry: If you see this, logging is working.")
 
 
+# Background serial engine (None means poll_hardware reads the ports itself)
+hardware_engine = None
+# asyncio loop bridged into Qt, only when serial_engine=asyncio
+async_bridge = None
+# Child process that owns the serial ports, only when serial_engine=process
+hardware_process = None
+# Recovers lost stations off the GUI thread
+reconnect_supervisor = None
+# Flags stations that stopped sending (heartbeats included), off the GUI timer
+stall_watchdog = None
+# Raw serial capture (serial_trace= in config.txt), None when off
+serial_trace = None
+# Host/station clock offsets and per-sample transport latency
+clock_sync = ClockSync(NUM_STATIONS)
+# Newest CURRENT_WEIGHT per station, shown once per poll_hardware tick; samples timed on the host clock
+weight_coalescer = WeightCoalescer(NUM_STATIONS, clock=clock_sync.to_host)
+# Sample-to-pixel latency of the weight labels, per station and screen
+display_latency = DisplayLatency(NUM_STATIONS)
+weight_coalescer.subscribe(display_latency.arrived)
+# Idle vs. full-rate weight streaming per station
+sample_rates = SampleRateController(NUM_STATIONS)
+# Target weight and time limit cached on the stations so fills start at once
+fill_stager = FillStager(NUM_STATIONS)
+# Learns each station's overshoot and closes the relay that much before target
+predictive_cutoff = PredictiveCutoff(NUM_STATIONS)
+weight_coalescer.subscribe(predictive_cutoff.on_sample)
+# Station events published by the message handlers and poll_hardware
+event_bus = EventBus()
+# Shared by every message handler; poll_hardware refreshes it once per tick
+handler_ctx = HandlerContext(DEBUG=DEBUG, scale_calibrations=scale_calibrations, sample_rates=sample_rates,
+                             display_latency=display_latency, bus=event_bus, cutoff=predictive_cutoff)
+# Draws the events of each tick on the station widgets, after the ports are read
+station_display = StationDisplay(handler_ctx)
+station_display.subscribe(event_bus)
+predictive_cutoff.subscribe(event_bus)
+# Per-station stream decoders for the polling path: station_index -> (arduino, decoder)
+station_decoders = {}
+
+
 # ========== BUTTON DELAY VARIABLE ========== 
 ## BUTTON_DELAY is now managed in config.py
 
@@ -138,6 +199,10 @@ def log_final_weight(station_index, final_weight):
     with open(STATS_LOG_FILE, "a") as f:
         f.write(f"{datetime.now().isoformat()} session={SESSION_ID} station={station_index+1} weight={final_weight}\n")
 
+def log_fill_completed(event):
+    """Stats logger: event_bus subscriber on its own thread, so file writes stay off the GUI thread."""
+    log_final_weight(event.station_index, event.final_weight)
+
 def filling_mode_callback(mode):
     global filling_mode
     filling_mode = mode
@@ -166,111 +231,96 @@ def filling_mode_callback(mode):
                     print(f"[main.py] Failed to send EXIT_MANUAL_END to station {i+1}: {e}")
 
 
+def station_port(station_index):
+    """The port a station was last seen on, else its configured one (None if it has none)."""
+    port = stations[station_index].port
+    if port is None and station_index < len(arduino_ports):
+        port = arduino_ports[station_index]
+    return port
+
+def candidate_ports(station_index, port):
+    """
+    Ports to look for a station on: its own port first, then, with port
+    discovery on (arduino_ports=auto) or no port configured, every other
+    serial device that no live station is using.
+    """
+    candidates = [port] if port else []
+    if config.ARDUINO_PORT_DISCOVERY or not port:
+        in_use = {getattr(arduino, "port", None) for arduino in list(arduinos) if arduino is not None}
+        candidates += [p for p in discover_arduino_ports() if p != port and p not in in_use]
+    return candidates
+
+def connect_station(station_index, port):
+    """
+    Open port and handshake the station expected there, then try the other
+    candidate_ports() (USB boards can come back under a new name).
+    Safe to call from a ReconnectSupervisor thread: it does not modify arduinos.
+    Returns the ready serial port or None.
+    """
+    for candidate in candidate_ports(station_index, port):
+        arduino = connect_station_on(station_index, candidate)
+        if arduino is not None:
+            return arduino
+    return None
+
+def connect_station_on(station_index, port):
+    """Handshake port and return it if the expected station answered, else None."""
+    if DEBUG:
+        print(f"connect_station called for station {station_index+1} on {port}")
+    else:
+        logging.info(f"connect_station called for station {station_index+1} on {port}")
+    station_serials = load_station_serials()
+    if async_bridge is not None:
+        # Run the coroutine handshake on the asyncio loop that Qt is stepping
+        future = asyncio.run_coroutine_threadsafe(
+            handshake_arduino(port, station_serials, scale_calibrations, DEBUG), async_bridge.loop
+        )
+        result = future.result(timeout=SERIAL_REPLY_TIMEOUT + CALIBRATION_REQUEST_TIMEOUT + 2.0)
+        found_index, arduino = result if result else (None, None)
+    elif hardware_process is not None:
+        # The hardware process opens and handshakes the port; we get a RemotePort back
+        found_index, arduino = hardware_process.connect(port)
+    else:
+        found_index, arduino, timings = handshake_port(port, station_serials, scale_calibrations, config, DEBUG)
+    if arduino is None:
+        return None
+    if found_index != station_index:
+        logging.error(f"Expected station {station_index+1} on {port} but found station {found_index+1}")
+        arduino.close()
+        return None
+    return arduino
+
 def reconnect_arduino(station_index, port):
+    """
+    Operator-requested reconnect: drop the station's port and hand the station to
+    the reconnect supervisor, which handshakes it off the GUI thread (the asyncio
+    handshake needs the GUI thread free to step its loop). Returns True once the
+    reconnect is under way; process_reconnect_events installs the port.
+    Before the serial engine has started it reconnects synchronously.
+    """
     if DEBUG:
         print(f"reconnect_arduino called for {port}")
     else:
         logging.info(f"reconnect_arduino called for {port}")
     try:
+        if reconnect_supervisor is not None:
+            reconnect_supervisor.cancel(station_index)
+        if hardware_engine is not None:
+            hardware_engine.detach(station_index)
         if arduinos[station_index]:
             try:
                 arduinos[station_index].close()
             except Exception:
                 pass
             arduinos[station_index] = None
+            station_connected[station_index] = False
 
-        arduino = serial.Serial(port, 9600, timeout=0.5)
-        # Clear serial buffer before handshake
-        if arduino.in_waiting > 0:
-            arduino.read(arduino.in_waiting)
-        time.sleep(0.5)
-
-        arduino.write(RESET_HANDSHAKE)
-        arduino.flush()
-        if DEBUG:
-            print(f"Sent RESET_HANDSHAKE to {port}")
-        else:
-            logging.info(f"Sent RESET_HANDSHAKE to {port}")
-        time.sleep(0.5)
-
-        arduino.write(b'PMID')
-        arduino.flush()
-        if DEBUG:
-            print(f"Sent 'PMID' handshake to {port}")
-        else:
-            logging.info(f"Sent 'PMID' handshake to {port}")
-
-        station_serials = load_station_serials()
-        station_serial_number = None
-        for _ in range(60):
-            # Ignore weight messages and only look for handshake response
-            if arduino.in_waiting > 0:
-                peek = arduino.read(1)
-                if peek == b'<' or peek == b'S':
-                    # Try to read a line for handshake
-                    line = peek + arduino.read_until(b'\n')
-                    try:
-                        line_decoded = line.decode(errors='replace').strip()
-                    except Exception:
-                        line_decoded = str(line)
-                    if DEBUG:
-                        print(f"Received from {port}: {repr(line_decoded)}")
-                    else:
-                        logging.info(f"Received from {port}: {repr(line_decoded)}")
-                    match = re.match(r"<SERIAL:(PM-SN\d{4})>", line_decoded)
-                    if match:
-                        station_serial_number = match.group(1)
-                        if DEBUG:
-                            print(f"Station serial {station_serial_number} detected on {port}")
-                        else:
-                            logging.info(f"Station serial {station_serial_number} detected on {port}")
-                        break
-                else:
-                    # Ignore weight messages (binary data)
-                    continue
-            time.sleep(0.1)
-        if station_serial_number is None or station_serial_number not in station_serials:
-            if DEBUG:
-                print(f"No recognized station detected on port {port}, skipping...")
-            else:
-                logging.error(f"No recognized station detected on port {port}, skipping...")
-            arduino.close()
-            return False
-
-        station_index = station_serials.index(station_serial_number)
-
-        arduino.write(CONFIRM_ID)
-        arduino.flush()
-        if DEBUG:
-            print(f"Sent CONFIRM_ID to station {station_index+1} on {port}")
-        else:
-            logging.info(f"Sent CONFIRM_ID to station {station_index+1} on {port}")
-
-        got_request = False
-        for _ in range(40):
-            if arduino.in_waiting > 0:
-                req = arduino.read(1)
-                if req == REQUEST_CALIBRATION:
-                    if DEBUG:
-                        print(f"Station {station_index+1}: REQUEST_CALIBRATION received, sending calibration: {scale_calibrations[station_index]}")
-                    else:
-                        logging.info(f"Station {station_index+1}: REQUEST_CALIBRATION received, sending calibration: {scale_calibrations[station_index]}")
-                    arduino.write(REQUEST_CALIBRATION)
-                    arduino.write(f"{scale_calibrations[station_index]}\n".encode('utf-8'))
-                    got_request = True
-                    break
-                else:
-                    arduino.reset_input_buffer()
-            time.sleep(0.1)
-        if not got_request:
-            if DEBUG:
-                print(f"Station {station_index+1}: Did not receive calibration request, skipping.")
-            else:
-                logging.error(f"Station {station_index+1}: Did not receive calibration request, skipping.")
-            arduino.close()
+        if reconnect_supervisor is not None:
+            return reconnect_supervisor.request(station_index, port)
+        arduino = connect_station(station_index, port)
+        if arduino is None:
             return False
-
-        arduinos[station_index - 1] = arduino
+        install_station_port(station_index, arduino)
         if DEBUG:
             print(f"Station {station_index+1} on {port} reconnected and ready.")
         else:
@@ -283,8 +333,99 @@ def reconnect_arduino(station_index, port):
         logging.error(f"Error reconnecting Arduino on {port}: {e}")
         return False
 
+def install_station_port(station_index, arduino):
+    """Make a freshly handshaked port the live port for station_index."""
+    if serial_trace is not None:
+        arduino = serial_trace.wrap(station_index, arduino)
+    station = stations[station_index]
+    station.arduino = arduino
+    station.port = getattr(arduino, "port", None)
+    station.connected = True
+    station_decoders.pop(station_index, None)
+    weight_coalescer.discard(station_index)
+    display_latency.forget(station_index)
+    clock_sync.reset(station_index)
+    sample_rates.reset(station_index, getattr(arduino, "protocol_version", 1))
+    fill_stager.reset(station_index)
+    if stall_watchdog is not None:
+        stall_watchdog.forget(station_index)
+    if hardware_engine is not None:
+        hardware_engine.attach(station_index, arduino)
+    if E_STOP:
+        # Keep a board that came back during an E-STOP in the stopped state
+        arduino.write(E_STOP_ACTIVATED)
+        arduino.flush()
+
+def station_lost(station_index, arduino, reason):
+    """Drop a failed port and hand the station to the reconnect supervisor."""
+    if DEBUG:
+        print(f"Lost connection to Arduino {station_index+1}: {reason}")
+    logging.error(f"Lost connection to station {station_index+1}: {reason}")
+    port = getattr(arduino, "port", None) or station_port(station_index)
+    if hardware_engine is not None:
+        hardware_engine.detach(station_index)
+    try:
+        arduino.close()
+    except Exception:
+        pass
+    station = stations[station_index]
+    if station.arduino is arduino:
+        station.arduino = None
+        station.connected = False
+        display_latency.forget(station_index)
+        if stall_watchdog is not None:
+            stall_watchdog.forget(station_index)
+    if reconnect_supervisor is not None:
+        reconnect_supervisor.request(station_index, port)
+
+def process_reconnect_events(station_widgets, app):
+    """Apply state changes reported by the reconnect supervisor (GUI thread)."""
+    if reconnect_supervisor is None:
+        return
+    tr = getattr(app, "tr", lambda k: k)
+    for station_index, state, arduino, detail in reconnect_supervisor.drain():
+        if DEBUG:
+            print(f"[reconnect] Station {station_index+1}: {state} ({detail})")
+        else:
+            logging.info(f"Station {station_index+1} reconnect: {state} ({detail})")
+        if state == STATION_ONLINE:
+            install_station_port(station_index, arduino)
+        widget = station_widgets[station_index] if station_widgets else None
+        if widget is None:
+            continue
+        try:
+            if hasattr(widget, "set_status"):
+                if state == STATION_ONLINE:
+                    widget.set_status(tr("READY"), color="#fff")
+                elif state == STATION_CONNECTING:
+                    widget.set_status(tr("RECONNECTING"), color="#F6EB61")
+                else:
+                    widget.set_status(tr("DISCONNECTED"), color="#FF2222")
+            elif hasattr(widget, "set_connected"):
+                widget.set_connected(state == STATION_ONLINE, config.STATION_COLORS[station_index])
+        except Exception as e:
+            logging.error(f"Error updating station {station_index+1} reconnect status: {e}")
+
+def process_stalls():
+    """Send stations the watchdog found silent down the reconnect path (GUI thread)."""
+    if stall_watchdog is None:
+        return
+    for station_index, silence in stall_watchdog.drain():
+        station = stations[station_index]
+        arduino = station.arduino
+        if arduino is None or not station.enabled:
+            continue
+        try:
+            if arduino.in_waiting > 0:
+                # The station is talking; it is this side that has not read it yet
+                stall_watchdog.feed(station_index, HEARTBEAT, time.monotonic())
+                continue
+        except serial.SerialException:
+            pass
+        station_lost(station_index, arduino, f"stalled, no message for {silence * 1000:.0f} ms")
+
 def try_connect_station(station_index):
-    port = arduino_ports[station_index]
+    port = station_port(station_index)
     if DEBUG:
         print(f"Attempting to (re)connect to station {station_index+1} on port {port}...")
     try:
@@ -346,6 +487,7 @@ def poll_hardware(app):
                 if arduino:
                     arduino.write(E_STOP_ACTIVATED)
                     arduino.flush()
+            event_bus.publish(EStop(True, time.monotonic()))
         elif not estop_pressed and E_STOP:
             if DEBUG:
                 print("E-STOP released")
@@ -357,56 +499,149 @@ def poll_hardware(app):
             if hasattr(app, '_prev_active_dialog') and app._prev_active_dialog is not None:
                 app.active_dialog = app._prev_active_dialog
             app._prev_active_dialog = None
+            event_bus.publish(EStop(False, time.monotonic()))
+
+        # --- Unified context for handlers (one object, refreshed in place) ---
+        ctx = handler_ctx
+        if ctx.app is not app:
+            ctx.app = app
+        ctx.FILL_LOCKED = FILL_LOCKED
+        ctx.target_weight = getattr(app, "target_weight", target_weight)
+        ctx.time_limit = getattr(app, "time_limit", time_limit)
+        ctx.active_dialog = active_dialog
+        ctx.station_widgets = station_widgets
+        ctx.refresh_ui = refresh_ui
+
+        process_stalls()
+        process_reconnect_events(station_widgets, app)
+        predictive_cutoff.auto_mode = filling_mode == "AUTO"
+        fill_stager.apply(
+            arduinos, ctx.target_weight, ctx.time_limit,
+            allowed=not E_STOP and not FILL_LOCKED and config.RELAY_POWER_ENABLED,
+            cutoff=predictive_cutoff.cutoff_weight,
+            enabled=station_enabled,
+            arm=predictive_cutoff.arm,
+        )
+
+        if not E_STOP:
+            clock_sync.poll(arduinos)
+            # Bottle checks and manual fills need every reading; idle stations do not
+            sample_rates.all_active = (
+                filling_mode == "MANUAL"
+                or (active_dialog is not None and active_dialog.__class__.__name__ == "StartupWizardDialog")
+            )
+            sample_rates.apply(arduinos)
+
+        if hardware_engine is not None:
+            dispatch_engine_events(ctx)
+            flush_weights(ctx)
+            event_bus.flush()
+            return
 
-        for station_index, arduino in enumerate(arduinos):
-            # ...existing code...
-            if arduino is None or not station_enabled[station_index]:
+        for station in stations:
+            arduino = station.arduino
+            if arduino is None or not station.enabled:
                 continue
+            station_index = station.index
             try:
+                decoder = get_station_decoder(station_index, arduino)
                 if E_STOP:
                     while arduino.in_waiting > 0:
                         arduino.read(arduino.in_waiting)
+                        if stall_watchdog is not None:
+                            stall_watchdog.feed(station_index, None, time.monotonic())
+                    decoder.reset()
                     continue
 
-                # ...existing code...
-
-                while arduino.in_waiting > 0:
-                    message_type = arduino.read(1)
-                    # ...existing code...
-                    handler = MESSAGE_HANDLERS.get(message_type)
-                    # --- Unified context for handlers ---
-                    ctx = {
-                        'FILL_LOCKED': FILL_LOCKED,
-                        'DEBUG': DEBUG,
-                        'target_weight': getattr(app, "target_weight", target_weight),
-                        'scale_calibrations': scale_calibrations,
-                        'time_limit': getattr(app, "time_limit", time_limit),
-                        'active_dialog': active_dialog,
-                        'station_widgets': station_widgets,
-                        'refresh_ui': refresh_ui,
-                        'app': app,
-                    }
-                    # Remove legacy update_station_weight logic
-                    # Weight updates should use widget.set_weight directly
-
-                    if handler:
-                        handler(station_index, arduino, **ctx)
-                    else:
-                        handle_unknown(station_index, arduino, message_type, **ctx)
+                # One read per station per tick; partial frames stay in the decoder
+                decoder.read_from(arduino)
+                received_at = decoder.received_at
+                for message_type, payload in decoder.decode():
+                    if stall_watchdog is not None:
+                        stall_watchdog.feed(station_index, message_type, received_at)
+                    route_message(station_index, arduino, message_type, payload, received_at, ctx)
             except serial.SerialException as e:
-                if DEBUG:
-                    print(f"Lost connection to Arduino {station_index+1}: {e}")
-                port = arduino_ports[station_index]
-                reconnect_arduino(station_index, port)
+                station_lost(station_index, arduino, e)
             except Exception as e:
                 if DEBUG:
                     print(f"[poll_hardware] Exception for station {station_index+1}: {e}")
                 logging.error(f"Error in poll_hardware: {e}")
+        flush_weights(ctx)
+        event_bus.flush()
     except Exception as e:
         logging.error(f"Error in poll_hardware: {e}")
         if DEBUG:
             print(f"Error in poll_hardware: {e}")
 
+def route_message(station_index, arduino, message_type, payload, received_at, ctx):
+    """Coalesce weight samples; dispatch everything else straight away."""
+    if message_type == CURRENT_WEIGHT:
+        weight_coalescer.offer(station_index, arduino, payload, received_at)
+        return
+    if message_type == WEIGHT_BATCH:
+        samples = decode_weight_batch(payload)
+        clock_sync.on_samples(station_index, samples, received_at)
+        weight_coalescer.offer_batch(station_index, arduino, samples, received_at)
+        return
+    if message_type == TIME_ECHO:
+        clock_sync.on_echo(station_index, payload, received_at)
+        return
+    if message_type == HEARTBEAT:
+        return
+    # Show the station's last weight before a message that may overwrite it (e.g. FINAL_WEIGHT)
+    sample = weight_coalescer.take(station_index)
+    if sample is not None:
+        dispatch_weight(station_index, *sample, ctx)
+    dispatch_message(station_index, arduino, message_type, payload, ctx)
+
+def dispatch_weight(station_index, arduino, weight, taken_at, ctx):
+    """Hand a coalesced weight to its handler along with when the station took it."""
+    ctx.taken_at = taken_at
+    try:
+        dispatch_message(station_index, arduino, CURRENT_WEIGHT, weight, ctx)
+    finally:
+        ctx.taken_at = None
+
+def flush_weights(ctx):
+    """Publish the newest weight of each station, once per tick."""
+    if E_STOP:
+        weight_coalescer.discard()
+        return
+    for station_index, arduino, weight, taken_at in weight_coalescer.flush():
+        if arduino is not stations[station_index].arduino:
+            continue
+        try:
+            dispatch_weight(station_index, arduino, weight, taken_at, ctx)
+        except Exception as e:
+            logging.error(f"Error updating weight for station {station_index+1}: {e}")
+
+def get_station_decoder(station_index, arduino):
+    """Return the decoder for this port, starting a fresh one after a reconnect."""
+    entry = station_decoders.get(station_index)
+    if entry is None or entry[0] is not arduino:
+        entry = (arduino, make_decoder(arduino))
+        station_decoders[station_index] = entry
+    return entry[1]
+
+def dispatch_engine_events(ctx):
+    """Hand messages decoded by the background readers to MESSAGE_HANDLERS."""
+    for station_index, arduino, message_type, payload, received_at in hardware_engine.drain():
+        # Drop messages from a port that has since been replaced or disabled
+        station = stations[station_index]
+        if arduino is not station.arduino or not station.enabled:
+            continue
+        if message_type is LINK_LOST:
+            station_lost(station_index, arduino, payload.decode(errors='replace'))
+            continue
+        if E_STOP:
+            continue
+        try:
+            route_message(station_index, arduino, message_type, payload, received_at, ctx)
+        except Exception as e:
+            if DEBUG:
+                print(f"[poll_hardware] Exception for station {station_index+1}: {e}")
+            logging.error(f"Error in poll_hardware: {e}")
+
 # ========== GUI/BUTTON HANDLING ==========
 def button_delay():
     # Deprecated: replaced by QTimer-based debounce
@@ -414,6 +649,8 @@ def button_delay():
 
 def handle_button_presses(app):
     global DEBUG
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtCore import QTimer
     try:
         dialog = getattr(app, "active_dialog", None)
         if dialog is None:
@@ -488,19 +725,102 @@ def handle_button_presses(app):
         if DEBUG:
             print(f"Error in handle_button_presses: {e}")
 
+# ========== ENGINE LIFECYCLE (shared with headless.py) ==========
+
+def load_settings(config_path):
+    """Read the config.txt settings the fill engine runs with."""
+    global hardware_process, serial_trace
+    # In place: the handlers and reconnect handshakes hold this list
+    scale_calibrations[:] = load_scale_calibrations()
+    print("[DEBUG] load_scale_calibrations() complete")
+    station_enabled[:] = load_station_enabled(config_path)
+    config.SERIAL_ENGINE = load_serial_engine(config_path, config.SERIAL_ENGINE)
+    config.STATION_STALL_TIMEOUT = load_stall_timeout(config_path, config.STATION_STALL_TIMEOUT)
+    # e.g. the ptys of scale_simulator.py; updated in place so every importer sees it
+    arduino_ports[:] = load_arduino_ports(config_path, arduino_ports)
+    trace_dir = load_serial_trace_dir(config_path)
+    if trace_dir and config.SERIAL_ENGINE == "process":
+        # The ports live in the hardware process, so that is where the bytes are captured
+        hardware_process = HardwareProcess(NUM_STATIONS, os.path.join(os.path.abspath(trace_dir), f"serial_{SESSION_ID}.pmt"))
+        print(f"[DEBUG] Capturing serial traffic to {hardware_process.trace_path}")
+    elif trace_dir:
+        serial_trace = TraceWriter(os.path.join(trace_dir, f"serial_{SESSION_ID}.pmt"))
+        print(f"[DEBUG] Capturing serial traffic to {serial_trace.path}")
+    print(f"[DEBUG] Loaded station_enabled: {station_enabled}")
+    predictive_cutoff.enabled, model_path = load_predictive_cutoff(config_path)
+    predictive_cutoff.load(model_path)
+    predictive_cutoff.subscribe_saver(event_bus)
+    print(f"[DEBUG] Predictive cutoff {'on' if predictive_cutoff.enabled else 'off'}, model {model_path}")
+
+def start_hardware_process():
+    """process engine: serial ports, handshakes and the E-STOP broadcast in a child process."""
+    global hardware_process
+    if hardware_process is None:
+        hardware_process = HardwareProcess(NUM_STATIONS)
+    hardware_process.start()
+    print(f"[DEBUG] Hardware process started (pid {hardware_process.process.pid})")
+
+def start_serial_engine():
+    """Start the serial engine, stall watchdog and reconnect supervisor on the open ports."""
+    global hardware_engine, stall_watchdog, reconnect_supervisor
+    stall_watchdog = StallWatchdog(NUM_STATIONS, config.STATION_STALL_TIMEOUT)
+    hardware_engine = create_serial_engine(config.SERIAL_ENGINE, async_bridge, stall_watchdog, hardware_process)
+    if hardware_engine is not None:
+        hardware_engine.start(arduinos)
+        print(f"[DEBUG] Serial engine '{config.SERIAL_ENGINE}' started")
+    reconnect_supervisor = ReconnectSupervisor(connect_station)
+    stall_watchdog.start()
+
+def shutdown():
+    """Stop the engine and helpers, report the session and release the GPIO pins."""
+    if stall_watchdog is not None:
+        stall_watchdog.stop()
+        print(f"[DEBUG] Stalls detected per station: {stall_watchdog.stall_count}")
+    if reconnect_supervisor is not None:
+        reconnect_supervisor.stop()
+    event_bus.stop()
+    dropped_events = event_bus.dropped()
+    if dropped_events:
+        print(f"[DEBUG] Events dropped by slow subscribers: {dropped_events}")
+    print(f"[DEBUG] Completed fills per station: {[station.fill_count for station in stations]}")
+    print(f"[DEBUG] Weight samples per station: {weight_coalescer.total_samples}, "
+          f"coalesced away: {weight_coalescer.dropped_samples}")
+    clock_report = clock_sync.report()
+    if clock_report:
+        print(f"[DEBUG] Station clocks and sample latency:\n{clock_report}")
+        logging.error(f"Station clocks and sample latency:\n{clock_report}")
+    cutoff_report = predictive_cutoff.report()
+    if cutoff_report:
+        print(f"[DEBUG] Learned relay cutoff:\n{cutoff_report}")
+        logging.error(f"Learned relay cutoff:\n{cutoff_report}")
+    display_report = display_latency.report()
+    if display_report:
+        print(f"[DEBUG] Sample-to-pixel latency:\n{display_report}")
+        logging.error(f"Sample-to-pixel latency:\n{display_report}")
+    # Nothing will answer or record a fill from here on
+    fill_stager.withdraw_all(arduinos)
+    if hardware_engine is not None:
+        hardware_engine.stop()
+    if hardware_process is not None:
+        hardware_process.stop()
+    if serial_trace is not None:
+        serial_trace.close()
+        print(f"[DEBUG] Serial trace written to {serial_trace.path}")
+    logging.info("Shutting down and cleaning up GPIO.")
+    GPIO.cleanup()
+
 # ========== MAIN ENTRY POINT ==========
 
 def main():
-    global arduinos, station_connected
+    global async_bridge
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtCore import QTimer, Qt
+    from gui.gui import RelayControlApp, SelectionDialog, InfoDialog, StartupWizardDialog
     try:
         print("[DEBUG] main() started")
         logging.info("Starting main application.")
-        load_scale_calibrations()
-        print("[DEBUG] load_scale_calibrations() complete")
-        global station_enabled
-        config_path = "config.txt"
-        station_enabled = load_station_enabled(config_path)
-        print(f"[DEBUG] Loaded station_enabled: {station_enabled}")
+        load_settings("config.txt")
+        event_bus.subscribe(FillCompleted, log_fill_completed, DELIVER_THREAD, name="stats_log")
         setup_gpio()
         print("[DEBUG] setup_gpio() complete")
 
@@ -527,7 +847,8 @@ def main():
             global RELAY_POWER_ENABLED
             app = RelayControlApp(
                 station_enabled=station_enabled,
-                filling_mode_callback=filling_mode_callback
+                filling_mode_callback=filling_mode_callback,
+                connect_station_callback=try_connect_station,
             )
             app.set_calibrate = None
             # Always update target_weight and time_limit from startup.py globals
@@ -545,6 +866,7 @@ def main():
             for i, widget in enumerate(app.station_widgets):
                 if station_enabled[i]:
                     widget.set_weight(0, app.target_weight, "g")
+            display_latency.attach(app.station_widgets, PATH_MAIN)
 
             timer.timeout.disconnect()
             timer.timeout.connect(lambda: poll_hardware(app))
@@ -559,9 +881,17 @@ def main():
             app.active_dialog = app
             print("[DEBUG] after_startup() finished")
 
+        # asyncio engine: one event loop stepped from Qt, used for handshakes and streaming
+        if config.SERIAL_ENGINE == "asyncio":
+            async_bridge = QtAsyncioBridge()
+        # process engine: serial ports, handshakes and the E-STOP broadcast in a child process
+        if config.SERIAL_ENGINE == "process":
+            start_hardware_process()
+
         print("[DEBUG] Creating StartupWizardDialog...")
         wizard = StartupWizardDialog(num_stations=NUM_STATIONS)
         print("[DEBUG] StartupWizardDialog created")
+        display_latency.attach(wizard.station_boxes, PATH_WIZARD)
         app_qt.active_dialog = wizard  # Set wizard as active dialog for button handling
         print("[DEBUG] app_qt.active_dialog set to wizard")
         context = {
@@ -580,7 +910,10 @@ def main():
             'config_file': config_file,
             'filling_mode_callback': filling_mode_callback,
             'ping_buzzer_invalid': ping_buzzer_invalid,
-            'after_startup': after_startup
+            'after_startup': after_startup,
+            'SERIAL_ENGINE': config.SERIAL_ENGINE,
+            'async_bridge': async_bridge,
+            'hardware_process': hardware_process,
         }
         print("[DEBUG] context built")
 
@@ -590,14 +923,30 @@ def main():
             result = step_func(context)
             print(f"[DEBUG] Prestartup step {step_func.__name__} returned: {result}")
 
-        # Update global variables from context before main startup
-        if 'arduinos' in context:
-            arduinos = context['arduinos']
+        # Copy what the steps found into the station registry, and let the
+        # remaining steps see the registry rather than the steps' own lists
+        if context['arduinos'] is not arduinos:
+            arduinos[:] = context['arduinos']
+            context['arduinos'] = arduinos
             print(f"[DEBUG] Updated global arduinos: {arduinos}")
-        if 'station_connected' in context:
-            station_connected = context['station_connected']
+        if context['station_connected'] is not station_connected:
+            station_connected[:] = context['station_connected']
+            context['station_connected'] = station_connected
             print(f"[DEBUG] Updated global station_connected: {station_connected}")
 
+        for station in stations:
+            if station.arduino is not None:
+                station.port = getattr(station.arduino, "port", None)
+
+        # Capture starts after the handshakes: the trace holds the streaming traffic
+        if serial_trace is not None:
+            for i, arduino in enumerate(arduinos):
+                if arduino is not None:
+                    arduinos[i] = serial_trace.wrap(i, arduino)
+
+        # Move serial reads off the GUI thread now that the ports are open
+        start_serial_engine()
+
         # Now run the main startup sequence
         print("[DEBUG] Running startup sequence...")
         run_startup_sequence(context)
@@ -630,8 +979,7 @@ def main():
         logging.error(f"Unexpected error: {e}", exc_info=True)
     finally:
         print("[DEBUG] Shutting down...")
-        logging.info("Shutting down and cleaning up GPIO.")
-        GPIO.cleanup()
+        shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,6 +1,8 @@
 import config
 import logging
-from utils import update_station_status
+import struct
+import time
+from event_bus import WeightSample, FillStarted, FinalWeight, FillCompleted, MaxWeight
 from config import (
     NUM_STATIONS,
     config_file,
@@ -10,21 +12,78 @@ from config import (
     DEBUG,
     E_STOP,
     FILL_LOCKED,
-    last_fill_time,
-    last_final_weight,
     fill_time_limit_reached,
     SESSION_ID,
-    arduinos,
-    station_connected,
-    serial_numbers,
+    stations,
     filling_mode,
-    station_max_weight_error,
     BOTTLE_WEIGHT_TOLERANCE,
     RELAY_POWER_ENABLED,
 )
 
+class HandlerContext:
+    """
+    App state the message handlers read, kept in one long-lived object.
+    poll_hardware updates the fields when the state changes instead of
+    building a new dict for every message.
+    Handlers do no widget work: they update the station state and publish
+    events on bus (event_bus.py), which the GUI and others subscribe to.
+    """
+    __slots__ = (
+        'FILL_LOCKED',
+        'DEBUG',
+        'target_weight',
+        'scale_calibrations',
+        'time_limit',
+        'active_dialog',
+        'station_widgets',
+        'refresh_ui',
+        'app',
+        'sample_rates',
+        'display_latency',
+        'bus',
+        'cutoff',
+        'taken_at',
+    )
+
+    def __init__(self, FILL_LOCKED=False, DEBUG=False, target_weight=500.0, scale_calibrations=None,
+                 time_limit=3000, active_dialog=None, station_widgets=None, refresh_ui=None, app=None,
+                 sample_rates=None, display_latency=None, bus=None, cutoff=None, taken_at=None):
+        self.FILL_LOCKED = FILL_LOCKED
+        self.DEBUG = DEBUG
+        self.target_weight = target_weight
+        self.scale_calibrations = scale_calibrations if scale_calibrations is not None else []
+        self.time_limit = time_limit
+        self.active_dialog = active_dialog
+        self.station_widgets = station_widgets
+        self.refresh_ui = refresh_ui
+        self.app = app
+        self.sample_rates = sample_rates
+        self.display_latency = display_latency
+        self.bus = bus
+        self.cutoff = cutoff
+        self.taken_at = taken_at  # host time the CURRENT_WEIGHT being dispatched was taken, if known
+
+# One (device millis, weight) pair in a WEIGHT_BATCH payload
+WEIGHT_SAMPLE = struct.Struct('<Ii')
+
+def decode_weight_batch(payload):
+    """Unpack a WEIGHT_BATCH payload into a list of (device millis, weight)."""
+    usable = len(payload) - len(payload) % WEIGHT_SAMPLE.size
+    if usable != len(payload):
+        logging.error(f"WEIGHT_BATCH payload of {len(payload)} bytes is not a whole number of samples")
+    return list(WEIGHT_SAMPLE.iter_unpack(payload[:usable]))
+
+def sample_flow_rate(samples):
+    """Grams per second between the first and last (device millis, weight) samples, or None."""
+    if len(samples) < 2:
+        return None
+    elapsed_ms = (samples[-1][0] - samples[0][0]) & 0xFFFFFFFF  # millis() wraps after ~49 days
+    if elapsed_ms == 0:
+        return None
+    return (samples[-1][1] - samples[0][1]) * 1000.0 / elapsed_ms
+
 # ========== MESSAGE HANDLERS ==========
-def handle_request_target_weight(station_index, arduino, **ctx):
+def handle_request_target_weight(station_index, arduino, payload, ctx):
     try:
         # Reject fill requests until relay power is enabled
         if not config.RELAY_POWER_ENABLED:
@@ -32,233 +91,152 @@ def handle_request_target_weight(station_index, arduino, **ctx):
                 print(f"Station {station_index+1}: Fill request rejected, relay power not enabled yet. Sending STOP.")
             arduino.write(config.STOP)  # Send STOP to Arduino to abort fill
             return
-        if ctx['FILL_LOCKED']:
+        if ctx.FILL_LOCKED:
             if config.DEBUG:
                 print(f"Station {station_index+1}: Fill locked, sending STOP_FILL")
                 print(f"Station {station_index+1}: Fill locked, sending STOP_FILL")
             arduino.write(config.STOP)
         else:
+            target_weight = cutoff = ctx.target_weight
+            if ctx.cutoff is not None:
+                # Close the relay early by the overshoot learned for this station and bottle
+                cutoff = ctx.cutoff.cutoff_weight(station_index, target_weight)
             arduino.write(config.TARGET_WEIGHT)
-            arduino.write(f"{ctx['target_weight']}\n".encode('utf-8'))
+            arduino.write(f"{cutoff}\n".encode('utf-8'))
+            if ctx.cutoff is not None:
+                ctx.cutoff.arm(station_index, target_weight, cutoff)
+            if ctx.sample_rates is not None:
+                ctx.sample_rates.set_filling(station_index, True, ctx.time_limit)
     except Exception as e:
         logging.error("Error in handle_request_target_weight", exc_info=True)
 
-def handle_request_calibration(station_index, arduino, **ctx):
+def handle_request_calibration(station_index, arduino, payload, ctx):
     try:
         if config.DEBUG:
-            print(f"Station {station_index+1}: REQUEST_CALIBRATION received, sending calibration: {ctx['scale_calibrations'][station_index]}")
+            print(f"Station {station_index+1}: REQUEST_CALIBRATION received, sending calibration: {ctx.scale_calibrations[station_index]}")
         arduino.write(config.REQUEST_CALIBRATION)
-        arduino.write(f"{ctx['scale_calibrations'][station_index]}\n".encode('utf-8'))
+        arduino.write(f"{ctx.scale_calibrations[station_index]}\n".encode('utf-8'))
     except Exception as e:
         logging.error("Error in handle_request_calibration", exc_info=True)
 
-def handle_request_time_limit(station_index, arduino, **ctx):
+def handle_request_time_limit(station_index, arduino, payload, ctx):
     try:
-        if ctx['DEBUG']:
+        if ctx.DEBUG:
             print(f"Station {station_index+1}: REQUEST_TIME_LIMIT")
         arduino.write(config.REQUEST_TIME_LIMIT)
-        arduino.write(f"{ctx['time_limit']}\n".encode('utf-8'))
+        arduino.write(f"{ctx.time_limit}\n".encode('utf-8'))
     except Exception as e:
         logging.error("Error in handle_request_time_limit", exc_info=True)
 
-def handle_current_weight(station_index, arduino, **ctx):
+def handle_current_weight(station_index, arduino, payload, ctx):
     try:
-        weight_bytes = arduino.read(4)
-        # print(f"[DEBUG][handle_current_weight] raw bytes: {weight_bytes!r}")
-        if len(weight_bytes) == 4:
-            weight = int.from_bytes(weight_bytes, byteorder='little', signed=True)
-            # print(f"[DEBUG][handle_current_weight] parsed weight: {weight}")
-            widgets = ctx.get('station_widgets')
-            app = ctx.get('app')
-            target_weight = ctx.get('target_weight', 500.0)
-            unit = getattr(app, "units", "g") if app else "g"
-            if widgets:
-                widget = widgets[station_index]
-                if station_max_weight_error[station_index]:
-                    widget.weight_label.setStyleSheet("color: #FF2222;")
-                else:
-                    widget.weight_label.setStyleSheet("color: #fff;")
-                if hasattr(widget, "set_weight"):
-                    widget.set_weight(weight, target_weight, unit)
-                else:
-                    if widget.weight_label:
-                        if unit == "g":
-                            widget.weight_label.setText(f"{int(round(weight))} g")
-                        else:
-                            oz = weight / 28.3495
-                            widget.weight_label.setText(f"{oz:.1f} oz")
-            # StartupWizardDialog support
-            if ctx['active_dialog'] is not None and ctx['active_dialog'].__class__.__name__ == "StartupWizardDialog":
-                # print(f"[DEBUG] Calling set_weight on StartupWizardDialog for station {station_index} with weight {weight}")
-                ctx['active_dialog'].set_weight(station_index, weight)
-        else:
-            logging.error(f"Station {station_index}: Incomplete weight bytes received: {weight_bytes!r}")
-            widgets = ctx.get('station_widgets')
-            if widgets:
-                widget = widgets[station_index]
-                if widget.weight_label:
-                    widget.weight_label.setText("0.0 g")
-            if ctx['active_dialog'] is not None and ctx['active_dialog'].__class__.__name__ == "StartupWizardDialog":
-                ctx['active_dialog'].set_weight(station_index, 0.0)
+        weight = payload
+        stations[station_index].weight = weight
+        bus = ctx.bus
+        if bus is not None:
+            now = time.monotonic()
+            bus.publish(WeightSample(station_index, weight, now, ctx.taken_at or now))
     except Exception as e:
         logging.error("Error in handle_current_weight", exc_info=True)
 
-def handle_begin_auto_fill(station_index, arduino, **ctx):
+def handle_weight_batch(station_index, arduino, payload, ctx):
+    """Show the newest sample of a batch (main coalesces batches before they get here)."""
+    try:
+        samples = decode_weight_batch(payload)
+        if samples:
+            handle_current_weight(station_index, arduino, samples[-1][1], ctx)
+    except Exception as e:
+        logging.error("Error in handle_weight_batch", exc_info=True)
+
+def handle_begin_auto_fill(station_index, arduino, payload, ctx):
     try:
-        widgets = ctx['station_widgets']
-        app = ctx.get('app')
-        if widgets:
-            widget = widgets[station_index]
-            if hasattr(widget, "set_status"):
-                if app:
-                    widget.set_status(app.tr("AUTO FILL RUNNING"))
-                else:
-                    widget.set_status("AUTO FILL RUNNING")
-        if ctx['DEBUG']:
+        if ctx.bus is not None:
+            ctx.bus.publish(FillStarted(station_index, "AUTO", time.monotonic()))
+        if ctx.sample_rates is not None:
+            ctx.sample_rates.set_filling(station_index, True, ctx.time_limit)
+        if ctx.DEBUG:
             print(f"Station {station_index+1}: BEGIN_AUTO_FILL received, status set.")
     except Exception as e:
         logging.error("Error in handle_begin_auto_fill", exc_info=True)
 
-def handle_begin_smart_fill(station_index, arduino, **ctx):
+def handle_begin_smart_fill(station_index, arduino, payload, ctx):
     try:
-        widgets = ctx['station_widgets']
-        app = ctx.get('app')
-        if widgets:
-            widget = widgets[station_index]
-            if hasattr(widget, "set_status"):
-                if app:
-                    widget.set_status(app.tr("SMART FILL RUNNING"))
-                else:
-                    widget.set_status("SMART FILL RUNNING")
-        if ctx['DEBUG']:
+        if ctx.bus is not None:
+            ctx.bus.publish(FillStarted(station_index, "SMART", time.monotonic()))
+        if ctx.sample_rates is not None:
+            ctx.sample_rates.set_filling(station_index, True, ctx.time_limit)
+        if ctx.DEBUG:
             print(f"Station {station_index+1}: BEGIN_SMART_FILL received, status set.")
     except Exception as e:
         logging.error("Error in handle_begin_smart_fill", exc_info=True)
 
-def handle_final_weight(station_index, arduino, **ctx):
-    print(f"[DEBUG] handle_final_weight called for station {station_index}")
-    try:
-        weight_bytes = arduino.read(4)
-        print(f"[DEBUG][handle_final_weight] raw bytes: {weight_bytes!r}")
-        if len(weight_bytes) == 4:
-            final_weight = int.from_bytes(weight_bytes, byteorder='little', signed=True)
-            print(f"[DEBUG][handle_final_weight] parsed final_weight: {final_weight}")
-            last_final_weight[station_index] = final_weight
-
-            print("About to call update_station_status in handle_final_weight")
-            update_station_status(
-                ctx.get('app'),
-                station_index,
-                final_weight,  # Always use this value
-                ctx.get('app').filling_mode if ctx.get('app') else "AUTO",
-                is_filling=False,
-                fill_result="complete",
-                fill_time=None  # No time yet
-            )
+def publish_fill_completed(station, final_weight, fill_time, ctx):
+    """Both halves of a fill result are in: record it and publish FillCompleted."""
+    station.record_fill(final_weight, fill_time)
+    station.last_fill_time = None
+    station.last_final_weight = None
+    if ctx.bus is not None:
+        # A fill that ran to the time limit is a timeout
+        ctx.bus.publish(FillCompleted(station.index, final_weight, fill_time, fill_time >= ctx.time_limit,
+                                      ctx.target_weight, time.monotonic()))
 
-            fill_time = last_fill_time[station_index]
-            if fill_time is not None:
-                seconds = fill_time / 1000.0
-                update_station_status(
-                    ctx.get('app'),
-                    station_index,
-                    final_weight,
-                    ctx.get('app').filling_mode if ctx.get('app') else "AUTO",
-                    is_filling=False,
-                    fill_result="complete",
-                    fill_time=seconds
-                )
-                last_fill_time[station_index] = None
-                last_final_weight[station_index] = None
-            if ctx['DEBUG']:
-                print(f"Station {station_index+1}: Final weight: {final_weight}")
-        else:
-            if ctx['DEBUG']:
-                print(f"Station {station_index+1}: Incomplete final weight bytes: {weight_bytes!r}")
+def handle_final_weight(station_index, arduino, payload, ctx):
+    try:
+        final_weight = payload
+        station = stations[station_index]
+        station.last_final_weight = final_weight
+        if ctx.bus is not None:
+            ctx.bus.publish(FinalWeight(station_index, final_weight, time.monotonic()))
+        if station.last_fill_time is not None:
+            publish_fill_completed(station, final_weight, station.last_fill_time, ctx)
+        if ctx.DEBUG:
+            print(f"Station {station_index+1}: Final weight: {final_weight}")
     except Exception as e:
         logging.error("Error in handle_final_weight", exc_info=True)
 
-def handle_fill_time(station_index, arduino, **ctx):
+def handle_fill_time(station_index, arduino, payload, ctx):
     try:
-        time_bytes = arduino.read(4)
-        if len(time_bytes) == 4:
-            fill_time = int.from_bytes(time_bytes, byteorder='little', signed=False)
-            last_fill_time[station_index] = fill_time
-            final_weight = last_final_weight[station_index]
-            if final_weight is not None:
-                seconds = fill_time / 1000.0
-                # If fill_time reached the time limit, treat as timeout
-                if fill_time >= ctx.get('time_limit', 3000):
-                    update_station_status(
-                        ctx.get('app'),
-                        station_index,
-                        final_weight,
-                        ctx.get('app').filling_mode if ctx.get('app') else "AUTO",
-                        is_filling=False,
-                        fill_result="timeout",
-                        fill_time=seconds
-                    )
-                else:
-                    update_station_status(
-                        ctx.get('app'),
-                        station_index,
-                        final_weight,
-                        ctx.get('app').filling_mode if ctx.get('app') else "AUTO",
-                        is_filling=False,
-                        fill_result="complete",
-                        fill_time=seconds
-                    )
-                last_fill_time[station_index] = None
-                last_final_weight[station_index] = None
-            if ctx['DEBUG']:
-                print(f"Station {station_index+1}: Fill time: {fill_time} ms")
-        else:
-            if ctx['DEBUG']:
-                print(f"Station {station_index+1}: Incomplete fill time bytes: {time_bytes!r}")
+        fill_time = payload
+        station = stations[station_index]
+        station.last_fill_time = fill_time
+        if ctx.sample_rates is not None:
+            ctx.sample_rates.set_filling(station_index, False)
+        if station.last_final_weight is not None:
+            publish_fill_completed(station, station.last_final_weight, fill_time, ctx)
+        if ctx.DEBUG:
+            print(f"Station {station_index+1}: Fill time: {fill_time} ms")
     except Exception as e:
         logging.error("Error in handle_fill_time", exc_info=True)
 
-def handle_unknown(station_index, arduino, message_type, **ctx):
+def handle_unknown(station_index, arduino, message_type, payload, ctx):
     try:
-        if arduino.in_waiting > 0:
-            extra = arduino.readline().decode('utf-8', errors='replace').strip()
-            if ctx['DEBUG']:
+        if payload:
+            extra = payload.decode('utf-8', errors='replace').strip()
+            if ctx.DEBUG:
                 print(f"Station {station_index+1}: Unknown message_type: {message_type!r}, extra: {extra!r}")
             else:
                 logging.error(f"Station {station_index+1}: Unknown message_type: {message_type!r}, extra: {extra!r}")
         else:
-            if ctx['DEBUG']:
+            if ctx.DEBUG:
                 print(f"Station {station_index+1}: Unknown message_type: {message_type!r}")
             else:
                 logging.error(f"Station {station_index+1}: Unknown message_type: {message_type!r}")
-            if ctx['refresh_ui']:
-                ctx['refresh_ui']()
+            if ctx.refresh_ui:
+                ctx.refresh_ui()
     except Exception as e:
         logging.error("Error in handle_unknown", exc_info=True)
 
-def handle_max_weight_warning(station_index, arduino, **ctx):
-    widgets = ctx.get('station_widgets')
-    app = ctx.get('app')
-    station_max_weight_error[station_index] = True
-    if widgets:
-        widget = widgets[station_index]
-        if hasattr(widget, "set_status"):
-            if app:
-                widget.set_status(f"<b>{app.tr('MAX WEIGHT EXCEEDED')}</b>", color="#FF2222", flashing=True)
-            else:
-                widget.set_status("<b>MAX WEIGHT EXCEEDED</b>", color="#FF2222", flashing=True)
+def handle_max_weight_warning(station_index, arduino, payload, ctx):
+    stations[station_index].max_weight_error = True
+    if ctx.bus is not None:
+        ctx.bus.publish(MaxWeight(station_index, True, time.monotonic()))
     if DEBUG:
         print(f"[WARNING] Station {station_index+1}: MAX_WEIGHT_WARNING received")
 
-def handle_max_weight_end(station_index, arduino, **ctx):
-    widgets = ctx.get('station_widgets')
-    station_max_weight_error[station_index] = False
-    if widgets:
-        widget = widgets[station_index]
-        if hasattr(widget, "clear_status"):
-            widget.clear_status()
-        elif hasattr(widget, "set_status"):
-            widget.set_status("")  # Fallback: clear status text
+def handle_max_weight_end(station_index, arduino, payload, ctx):
+    stations[station_index].max_weight_error = False
+    if ctx.bus is not None:
+        ctx.bus.publish(MaxWeight(station_index, False, time.monotonic()))
     if DEBUG:
         print(f"[INFO] Station {station_index+1}: MAX_WEIGHT_END received, warning cleared.")
 
@@ -267,6 +245,7 @@ MESSAGE_HANDLERS = {
     config.REQUEST_CALIBRATION: handle_request_calibration,
     config.REQUEST_TIME_LIMIT: handle_request_time_limit,
     config.CURRENT_WEIGHT: handle_current_weight,
+    config.WEIGHT_BATCH: handle_weight_batch,
     config.BEGIN_AUTO_FILL: handle_begin_auto_fill,
     config.BEGIN_SMART_FILL: handle_begin_smart_fill,
     config.FINAL_WEIGHT: handle_final_weight,
@@ -274,3 +253,21 @@ MESSAGE_HANDLERS = {
     config.MAX_WEIGHT_WARNING: handle_max_weight_warning,
     config.MAX_WEIGHT_END: handle_max_weight_end,  # <-- Register the new handler
 }
+
+def build_handler_table(handlers):
+    """Turn a {message byte: handler} dict into a 256-entry list indexed by the byte value."""
+    table = [None] * 256
+    for message_type, handler in handlers.items():
+        table[message_type[0]] = handler
+    return table
+
+# Rebuild with build_handler_table() after changing MESSAGE_HANDLERS
+HANDLER_TABLE = build_handler_table(MESSAGE_HANDLERS)
+
+def dispatch_message(station_index, arduino, message_type, payload, ctx):
+    """Run the handler for one decoded message."""
+    handler = HANDLER_TABLE[message_type[0]]
+    if handler is None:
+        handle_unknown(station_index, arduino, message_type, payload, ctx)
+    else:
+        handler(station_index, arduino, payload, ctx)
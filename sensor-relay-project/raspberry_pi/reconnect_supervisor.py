@@ -0,0 +1,103 @@
+import logging
+import queue
+import random
+import threading
+import config
+
+# Station state transitions reported by the supervisor
+STATION_CONNECTING = "connecting"
+STATION_ONLINE = "online"
+STATION_FAILED = "failed"
+
+# Backoff between attempts: base * 2^(attempt-1), capped, then +/- jitter
+RECONNECT_BASE_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+RECONNECT_JITTER = 0.25
+
+
+def backoff_delay(attempt, base=RECONNECT_BASE_DELAY, cap=RECONNECT_MAX_DELAY, jitter=RECONNECT_JITTER):
+    """Seconds to wait after the given failed attempt (1-based)."""
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return delay * random.uniform(1.0 - jitter, 1.0 + jitter)
+
+
+class ReconnectSupervisor:
+    """
+    Reconnects lost stations on background threads.
+    connect_func(station_index, port) must return an open, handshaked port or
+    None; it is retried with capped exponential backoff until it succeeds.
+    State changes are queued as (station_index, state, arduino, detail) and
+    picked up on the GUI thread with drain(), so healthy stations and the
+    E-STOP logic keep running while a sick station recovers.
+    """
+    def __init__(self, connect_func):
+        self.connect_func = connect_func
+        self.events = queue.Queue()
+        self._workers = {}  # station_index -> stop Event
+        self._lock = threading.Lock()
+
+    def is_recovering(self, station_index):
+        with self._lock:
+            return station_index in self._workers
+
+    def request(self, station_index, port):
+        """Start recovering station_index on port unless already in progress."""
+        with self._lock:
+            if station_index in self._workers:
+                return False
+            stop_event = threading.Event()
+            self._workers[station_index] = stop_event
+        threading.Thread(
+            target=self._run,
+            args=(station_index, port, stop_event),
+            name=f"station{station_index+1}-reconnect",
+            daemon=True,
+        ).start()
+        return True
+
+    def cancel(self, station_index):
+        with self._lock:
+            stop_event = self._workers.pop(station_index, None)
+        if stop_event is not None:
+            stop_event.set()
+
+    def stop(self):
+        with self._lock:
+            workers, self._workers = self._workers, {}
+        for stop_event in workers.values():
+            stop_event.set()
+
+    def drain(self):
+        """Yield queued state changes without blocking."""
+        while True:
+            try:
+                yield self.events.get_nowait()
+            except queue.Empty:
+                return
+
+    def _run(self, station_index, port, stop_event):
+        attempt = 0
+        try:
+            while not stop_event.is_set():
+                attempt += 1
+                self.events.put((station_index, STATION_CONNECTING, None, f"attempt {attempt} on {port}"))
+                arduino = None
+                try:
+                    arduino = self.connect_func(station_index, port)
+                except Exception as e:
+                    logging.error(f"Station {station_index+1}: reconnect attempt {attempt} failed: {e}")
+                if arduino is not None:
+                    if stop_event.is_set():
+                        arduino.close()
+                        return
+                    self.events.put((station_index, STATION_ONLINE, arduino, f"online after {attempt} attempt(s)"))
+                    return
+                delay = backoff_delay(attempt)
+                self.events.put((station_index, STATION_FAILED, None, f"attempt {attempt} failed, retrying in {delay:.1f} s"))
+                if config.DEBUG:
+                    print(f"[ReconnectSupervisor] Station {station_index+1}: attempt {attempt} failed, retrying in {delay:.1f} s")
+                stop_event.wait(delay)
+        finally:
+            with self._lock:
+                if self._workers.get(station_index) is stop_event:
+                    del self._workers[station_index]
@@ -0,0 +1,243 @@
+import collections
+import json
+import logging
+import os
+import threading
+from event_bus import FillStarted, FillCompleted, DELIVER_THREAD
+from message_handlers import sample_flow_rate
+
+# Completed AUTO fills of a station and bottle before its cutoff moves
+MIN_FILLS = 3
+# Weight of the newest fill in the running averages
+OVERSHOOT_ALPHA = 0.2
+FLOW_ALPHA = 0.5
+# Recent fills per station and bottle the cutoff is taken from
+OVERSHOOT_HISTORY = 20
+# The cutoff advances by this low percentile of the recent overshoots, not their
+# mean: overshoot is often bimodal (valve closing between drips or mid-stream),
+# and only the low end is safe to take off every fill
+MARGIN_PERCENTILE = 10
+# A short fill (final weight under target) scales the advance by this much;
+# each fill that reaches the target wins back BACKOFF_RECOVERY of it
+SHORT_FILL_BACKOFF = 0.5
+BACKOFF_RECOVERY = 0.1
+# Never cut off more than this fraction of the target early
+MAX_CUTOFF_FRACTION = 0.2
+# Weight samples per station kept for the flow rate at cutoff
+TRAJECTORY_SAMPLES = 6
+# Flow rates below this (g/s) are too slow to learn a valve lag from
+MIN_FLOW_RATE = 1.0
+
+
+def bottle_key(target_weight):
+    """Bottle type of a fill: each bottle size in config.txt has its own full weight."""
+    return f"{int(round(target_weight))}g"
+
+
+def low_percentile(values, percentile=MARGIN_PERCENTILE):
+    ordered = sorted(values)
+    return ordered[int(round(percentile / 100.0 * (len(ordered) - 1)))]
+
+
+class OvershootModel:
+    """Recent overshoots and running averages for one station and bottle type."""
+    __slots__ = ('fills', 'overshoot', 'lag', 'history', 'lags', 'backoff')
+
+    def __init__(self, fills=0, overshoot=0.0, lag=None, history=(), lags=(), backoff=1.0):
+        self.fills = fills
+        self.overshoot = overshoot  # running average, grams landing after the cutoff (report only)
+        self.lag = lag              # running average, seconds of flow in the air (report only)
+        self.history = collections.deque(history, maxlen=OVERSHOOT_HISTORY)  # recent overshoots, g
+        self.lags = collections.deque(lags, maxlen=OVERSHOOT_HISTORY)        # recent overshoot / flow, s
+        self.backoff = backoff      # fraction of the learned advance in use, lowered by short fills
+
+    def learn(self, overshoot, flow_rate):
+        if self.fills == 0:
+            self.overshoot = overshoot
+        else:
+            self.overshoot += OVERSHOOT_ALPHA * (overshoot - self.overshoot)
+        self.history.append(overshoot)
+        if flow_rate is not None and flow_rate >= MIN_FLOW_RATE and overshoot > 0:
+            lag = overshoot / flow_rate
+            self.lags.append(lag)
+            self.lag = lag if self.lag is None else self.lag + OVERSHOOT_ALPHA * (lag - self.lag)
+        self.fills += 1
+
+    def fill_result(self, short):
+        """Back off after a fill that came up short; recover slowly after good ones."""
+        if short:
+            self.backoff *= SHORT_FILL_BACKOFF
+        else:
+            self.backoff = min(1.0, self.backoff + BACKOFF_RECOVERY)
+
+    def to_dict(self):
+        return {'fills': self.fills, 'overshoot': self.overshoot, 'lag': self.lag,
+                'history': list(self.history), 'lags': list(self.lags), 'backoff': self.backoff}
+
+
+class PredictiveCutoff:
+    """
+    Host-side predictive relay cutoff for AUTO fills.
+    The firmware closes the relay once the scale reads the target it was
+    sent; the paint in the air and the valve's closing time then land on
+    top (the overshoot). This learns that overshoot per station and bottle
+    type from FINAL_WEIGHT against the weight the relay was told to close at,
+    and sends target - predicted overshoot instead, staged ahead of the fill
+    (FillStager) or on REQUEST_TARGET_WEIGHT. cutoff_weight() only answers;
+    the sender calls arm() once the value has actually been written, so a
+    fill is learned against the cutoff the station really holds.
+    The prediction is a low percentile (MARGIN_PERCENTILE) of the recent
+    overshoots, so most fills still land at or above target. The weight
+    trajectory gives the flow rate at cutoff, so the in-flight mass is also
+    kept as a lag (seconds of flow) and scaled by the station's current flow
+    when there is one. A fill that still comes up short halves the advance.
+    The model is kept in a JSON file (cutoff_model= in config.txt) and saved
+    after every learned fill.
+    """
+    def __init__(self, num_stations):
+        self.enabled = False    # predictive_cutoff= in config.txt
+        self.auto_mode = True   # poll_hardware: only AUTO fills stop on weight
+        self.path = None
+        self._models = {}       # (station_index, bottle key) -> OvershootModel
+        self._flow = [None] * num_stations  # recent flow rate at cutoff, g/s
+        self._armed = [None] * num_stations   # (target, cutoff) last written to the station
+        self._filling = [None] * num_stations  # (target, cutoff) of the fill in progress
+        self._trajectory = [collections.deque(maxlen=TRAJECTORY_SAMPLES) for _ in range(num_stations)]
+        self._lock = threading.Lock()
+
+    def subscribe(self, bus):
+        """Learn from fill events on bus (synchronously: it is a few float updates)."""
+        return bus.subscribe((FillStarted, FillCompleted), self.on_event, name="predictive_cutoff")
+
+    # ---------- prediction ----------
+
+    def predicted_overshoot(self, station_index, target_weight):
+        """Grams expected to land after the cutoff, or 0 while still learning."""
+        model = self._models.get((station_index, bottle_key(target_weight)))
+        if model is None or len(model.history) < MIN_FILLS:
+            return 0.0
+        flow = self._flow[station_index]
+        if len(model.lags) >= MIN_FILLS and flow is not None:
+            overshoot = low_percentile(model.lags) * flow
+        else:
+            overshoot = low_percentile(model.history)
+        overshoot *= model.backoff
+        return max(0.0, min(overshoot, MAX_CUTOFF_FRACTION * target_weight))
+
+    def cutoff_weight(self, station_index, target_weight):
+        """Weight to send the station as its target for the next fill."""
+        if not self.enabled or not self.auto_mode or target_weight <= 0:
+            return target_weight
+        return round(target_weight - self.predicted_overshoot(station_index, target_weight), 1)
+
+    def arm(self, station_index, target_weight, cutoff):
+        """The station was sent cutoff for target_weight (STAGE_FILL or TARGET_WEIGHT)."""
+        self._armed[station_index] = (target_weight, cutoff)
+
+    # ---------- learning ----------
+
+    def on_sample(self, station_index, weight, taken_at, device_millis=None):
+        """WeightCoalescer consumer: the weight trajectory of fills in progress."""
+        if self._filling[station_index] is None:
+            return
+        millis = device_millis if device_millis is not None else int(taken_at * 1000)
+        self._trajectory[station_index].append((millis, weight))
+
+    def on_event(self, event):
+        station_index = event.station_index
+        if type(event) is FillStarted:
+            self._filling[station_index] = self._armed[station_index] if event.mode == "AUTO" else None
+            self._trajectory[station_index].clear()
+            return
+        filling, self._filling[station_index] = self._filling[station_index], None
+        flow_rate = self._trajectory_flow(station_index)
+        if filling is None or event.timed_out:
+            # Not a weight cutoff (time limit, other modes): nothing to learn
+            return
+        target, cutoff = filling
+        if target != event.target_weight:
+            return
+        overshoot = event.final_weight - cutoff
+        with self._lock:
+            key = (station_index, bottle_key(target))
+            model = self._models.get(key)
+            if model is None:
+                model = self._models[key] = OvershootModel()
+            model.learn(overshoot, flow_rate)
+            if cutoff < target:
+                # Cut off early and still short: the prediction was too bold
+                model.fill_result(event.final_weight < target)
+            if flow_rate is not None and flow_rate >= MIN_FLOW_RATE:
+                flow = self._flow[station_index]
+                self._flow[station_index] = flow_rate if flow is None else flow + FLOW_ALPHA * (flow_rate - flow)
+
+    def _trajectory_flow(self, station_index):
+        """Grams per second over the samples leading up to the cutoff, or None."""
+        return sample_flow_rate(self._trajectory[station_index])
+
+    # ---------- persistence ----------
+
+    def load(self, path):
+        """Read a saved model; later saves go to path too. A missing file starts from scratch."""
+        self.path = path
+        try:
+            with open(path, "r") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read cutoff model {path}: {e}")
+            return
+        with self._lock:
+            for entry in saved.get('models', []):
+                try:
+                    self._models[(int(entry['station']) - 1, entry['bottle'])] = OvershootModel(
+                        int(entry['fills']), float(entry['overshoot']),
+                        None if entry.get('lag') is None else float(entry['lag']),
+                        [float(x) for x in entry.get('history', [])],
+                        [float(x) for x in entry.get('lags', [])],
+                        float(entry.get('backoff', 1.0)),
+                    )
+                except (KeyError, TypeError, ValueError):
+                    logging.error(f"Ignoring cutoff model entry {entry!r}")
+            for station, flow in saved.get('flow', {}).items():
+                station_index = int(station) - 1
+                if 0 <= station_index < len(self._flow):
+                    self._flow[station_index] = flow
+
+    def save(self, event=None):
+        """Write the model to path (also an event_bus subscriber, on its own thread)."""
+        if self.path is None:
+            return
+        with self._lock:
+            saved = {
+                'models': [
+                    dict(station=station_index + 1, bottle=bottle, **model.to_dict())
+                    for (station_index, bottle), model in sorted(self._models.items())
+                ],
+                'flow': {str(i + 1): flow for i, flow in enumerate(self._flow) if flow is not None},
+            }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(saved, f, indent=1)
+        os.replace(temporary, self.path)
+
+    def subscribe_saver(self, bus):
+        """Save after every completed fill, off the GUI thread."""
+        return bus.subscribe(FillCompleted, self.save, DELIVER_THREAD, name="cutoff_model")
+
+    def report(self):
+        """One line per learned station and bottle type."""
+        lines = []
+        for (station_index, bottle), model in sorted(self._models.items()):
+            lag = f"{model.lag * 1000:.0f}ms" if model.lag is not None else "-"
+            lines.append(
+                f"Station {station_index+1} {bottle}: {model.fills} fills, overshoot {model.overshoot:.1f} g "
+                f"(p{MARGIN_PERCENTILE} {low_percentile(model.history) if model.history else 0.0:.1f} g), "
+                f"lag {lag}, backoff {model.backoff:.2f}, cutoff now "
+                f"{self.predicted_overshoot(station_index, float(bottle[:-1])):.1f} g early"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,65 @@
+import logging
+import time
+import config
+from frame_decoder import PROTOCOL_V1, PROTOCOL_V2
+
+# Extra time a fill may run past its time limit before the station is assumed idle
+FILL_GRACE = 5.0
+# Interval the firmware streams at after every handshake (every reading)
+HANDSHAKE_INTERVAL = 0
+
+
+class SampleRateController:
+    """
+    Chooses each station's weight streaming rate and sends SET_SAMPLE_RATE when it changes.
+    Stations stream at the full rate while filling, in MANUAL mode and during the
+    startup wizard's bottle checks, and at idle_interval ms otherwise.
+    Filling is marked by the message handlers; a fill that ends without FILL_TIME
+    (e.g. a bottle that was already full) falls back to idle after its time limit.
+    Protocol v1 firmware has no SET_SAMPLE_RATE and streams every reading; those
+    ports are left alone.
+    """
+    def __init__(self, num_stations, idle_interval=config.IDLE_SAMPLE_INTERVAL_MS,
+                 active_interval=config.ACTIVE_SAMPLE_INTERVAL_MS):
+        self.idle_interval = idle_interval
+        self.active_interval = active_interval
+        self.all_active = False
+        self._fill_until = [None] * num_stations  # time.monotonic() a fill is given up at
+        self._sent = [None] * num_stations        # interval the station was last told
+
+    def set_filling(self, station_index, filling, time_limit_ms=0):
+        if filling:
+            self._fill_until[station_index] = time.monotonic() + time_limit_ms / 1000.0 + FILL_GRACE
+        else:
+            self._fill_until[station_index] = None
+
+    def reset(self, station_index, protocol_version=PROTOCOL_V2):
+        """A station that just handshaked streams every reading and is not filling."""
+        self._fill_until[station_index] = None
+        self._sent[station_index] = HANDSHAKE_INTERVAL if protocol_version >= PROTOCOL_V2 else None
+
+    def interval_for(self, station_index, now=None):
+        if self.all_active:
+            return self.active_interval
+        fill_until = self._fill_until[station_index]
+        if fill_until is not None:
+            if (now or time.monotonic()) < fill_until:
+                return self.active_interval
+            self._fill_until[station_index] = None
+        return self.idle_interval
+
+    def apply(self, arduinos):
+        now = time.monotonic()
+        for station_index, arduino in enumerate(arduinos):
+            if arduino is None or getattr(arduino, "protocol_version", PROTOCOL_V1) < PROTOCOL_V2:
+                continue
+            interval = self.interval_for(station_index, now)
+            if interval == self._sent[station_index]:
+                continue
+            try:
+                arduino.write(config.SET_SAMPLE_RATE + f"{interval}\n".encode('utf-8'))
+                self._sent[station_index] = interval
+                if config.DEBUG:
+                    print(f"[SampleRateController] Station {station_index+1}: {interval} ms between samples")
+            except Exception as e:
+                logging.error(f"Station {station_index+1}: SET_SAMPLE_RATE failed: {e}")
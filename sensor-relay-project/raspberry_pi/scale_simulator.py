@@ -0,0 +1,992 @@
+"""
+Virtual scale_controller stations on pseudo-terminals.
+
+Each SimulatedStation owns one pty and runs the same state machine as
+arduino/scale_controller/scale_controller.ino on its own thread: PMID
+handshake, calibration, protocol v2 framing, baud negotiation, weight
+streaming and batching, heartbeats, clock pings, staged fills, AUTO/SMART/
+MANUAL fills, tare, recalibration and the MAX_WEIGHT block. A simple
+physics model fills the bottle at a configurable flow rate, with scale
+noise, transport latency and injected faults on top.
+
+Run from the raspberry_pi directory:
+    python scale_simulator.py --stations 4 --link-dir /tmp/pm-sim --cycle
+then put the printed arduino_ports= line into config.txt and start main.py.
+"""
+import argparse
+import errno
+import heapq
+import itertools
+import os
+import pty
+import random
+import select
+import struct
+import threading
+import time
+import tty
+import config
+from frame_decoder import encode_frame, FRAME_MAX_PAYLOAD
+
+# Firmware opcodes the host never names
+MANUAL_FILL_END = b'\x21'
+BEGIN_FILL = config.BEGIN_AUTO_FILL
+
+# Firmware constants (scale_controller.ino)
+SCALE_MAX_GRAMS = 1000
+MAX_WEIGHT_CLEAR_GRAMS = 50
+BUTTON_STUCK_THRESHOLD = 3.0
+HEARTBEAT_INTERVAL = 0.1
+TARGET_WEIGHT_TIMEOUT = 2.0  # fill gives up waiting for TARGET_WEIGHT
+STAGED_FILL_TIMEOUT = 6.0    # staged values dropped after this long without a host command
+TARE_READINGS = 10
+WEIGHT_BATCH_MAX = 8
+WEIGHT_BATCH_MAX_AGE = 0.05
+BAUD_CONFIRM_TIMEOUT = 1.0
+READ_STRING_TIMEOUT = 1.0  # Serial.readStringUntil() gives up after the default 1 s
+SUPPORTED_BAUD_RATES = (config.DEFAULT_BAUD, 115200, 250000)
+WEIGHT_SAMPLE = struct.Struct('<Ii')
+
+# Model defaults
+DEFAULT_FLOW_RATE = 100.0     # grams per second with the relay open
+DEFAULT_NOISE = 0.3           # standard deviation of a reading, grams
+DEFAULT_SAMPLE_PERIOD = 0.0375  # one scale.get_units(3) at 80 samples/s
+DEFAULT_OVERSHOOT = 3.0       # grams still in the air when the relay closes
+DEFAULT_BOTTLE_WEIGHT = 30.0
+DEFAULT_CYCLE_PAUSE = 2.0
+
+
+class PowerCycle(Exception):
+    """Raised inside a station thread to reboot the simulated board."""
+
+
+class FaultInjector:
+    """
+    Random faults for one station.
+    drop and corrupt are per-message probabilities, garbage is a per-loop
+    probability of injecting stray bytes. stall_every, disconnect_every and
+    overload_every are mean seconds between events (0 disables them).
+    """
+    def __init__(self, drop=0.0, corrupt=0.0, garbage=0.0, stall_every=0.0, stall_duration=1.0,
+                 disconnect_every=0.0, reboot_delay=2.0, overload_every=0.0, overload_duration=2.0, rng=None):
+        self.drop = drop
+        self.corrupt = corrupt
+        self.garbage = garbage
+        self.stall_every = stall_every
+        self.stall_duration = stall_duration
+        self.disconnect_every = disconnect_every
+        self.reboot_delay = reboot_delay
+        self.overload_every = overload_every
+        self.overload_duration = overload_duration
+        self.rng = rng or random.Random()
+        self.counts = {"drop": 0, "corrupt": 0, "garbage": 0, "stall": 0, "disconnect": 0, "overload": 0}
+        now = time.monotonic()
+        self._next = {
+            "stall": self._schedule(now, stall_every),
+            "disconnect": self._schedule(now, disconnect_every),
+            "overload": self._schedule(now, overload_every),
+        }
+
+    def _schedule(self, now, mean):
+        return now + self.rng.expovariate(1.0 / mean) if mean > 0 else None
+
+    def due(self, kind, now):
+        """True (and reschedule) if a timed fault of this kind is due."""
+        at = self._next[kind]
+        if at is None or now < at:
+            return False
+        mean = {"stall": self.stall_every, "disconnect": self.disconnect_every, "overload": self.overload_every}[kind]
+        self._next[kind] = self._schedule(now, mean)
+        self.counts[kind] += 1
+        return True
+
+    def mangle(self, data):
+        """Apply drop/corrupt to one outgoing message; returns the bytes to send."""
+        if self.drop and self.rng.random() < self.drop:
+            self.counts["drop"] += 1
+            return b''
+        if self.corrupt and data and self.rng.random() < self.corrupt:
+            self.counts["corrupt"] += 1
+            data = bytearray(data)
+            data[self.rng.randrange(len(data))] ^= 1 << self.rng.randrange(8)
+            return bytes(data)
+        return data
+
+    def stray_bytes(self):
+        if self.garbage and self.rng.random() < self.garbage:
+            self.counts["garbage"] += 1
+            return bytes(self.rng.randrange(256) for _ in range(self.rng.randint(1, 16)))
+        return b''
+
+
+class SimulatedStation(threading.Thread):
+    """One virtual scale_controller board behind a pty."""
+    def __init__(self, station_index, serial_number, link_path=None, flow_rate=DEFAULT_FLOW_RATE,
+                 noise=DEFAULT_NOISE, sample_period=DEFAULT_SAMPLE_PERIOD, latency=0.0, jitter=0.0,
+                 protocol=2, max_baud=250000, overshoot=DEFAULT_OVERSHOOT, bottle_weight=DEFAULT_BOTTLE_WEIGHT,
+                 cycle=False, cycle_pause=DEFAULT_CYCLE_PAUSE, fill_mode="AUTO", drift_ppm=0.0,
+                 faults=None, seed=None):
+        super().__init__(name=f"sim-station{station_index+1}", daemon=True)
+        self.station_index = station_index
+        self.serial_number = serial_number
+        self.link_path = link_path
+        self.flow_rate = flow_rate
+        self.noise = noise
+        self.sample_period = sample_period
+        self.latency = latency
+        self.jitter = jitter
+        self.max_protocol = protocol
+        self.max_baud = max_baud
+        self.overshoot = overshoot
+        self.bottle_weight = bottle_weight
+        self.cycle = cycle
+        self.cycle_pause = cycle_pause
+        self.fill_mode = fill_mode.upper()
+        self.drift_ppm = drift_ppm
+        self.rng = random.Random(seed)
+        self.faults = faults or FaultInjector(rng=self.rng)
+        self.port = None
+        self.master = None
+        self._slave = None
+        self._rx = bytearray()
+        self._stop_event = threading.Event()
+        self._tx_queue = []  # heap of (due, seq, data)
+        self._tx_seq = itertools.count()
+        self._tx_lock = threading.Condition()
+        self._last_due = 0.0
+        # Counters for reports
+        self.bytes_sent = 0
+        self.bytes_lost = 0
+        self.fills = 0
+        # Scale and fill model
+        self.weight = 0.0          # grams on the platform
+        self.relay_open = False
+        self.valve_powered = True  # False after the host reported an E-STOP
+        self._in_flight = 0.0
+        self._last_physics = time.monotonic()
+        self._overload_until = None
+        self._button_release_at = 0.0
+        self._operator_phase = "empty"
+        self._operator_next = time.monotonic() + cycle_pause
+        self._open_pty()
+        self._reset_firmware()
+
+    # ---------- pty and transport ----------
+
+    def _open_pty(self):
+        master, slave = pty.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+        os.set_blocking(master, False)
+        self.master = master
+        # Keep our own slave fd open so the master survives the host closing the port
+        self._slave = slave
+        self.port = os.ttyname(slave)
+        if self.link_path:
+            tmp_path = self.link_path + ".tmp"
+            if os.path.lexists(tmp_path):
+                os.unlink(tmp_path)
+            os.symlink(self.port, tmp_path)
+            os.replace(tmp_path, self.link_path)
+
+    def _close_pty(self):
+        for fd in (self.master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = None
+        self._slave = None
+        self._rx.clear()
+        with self._tx_lock:
+            self._tx_queue.clear()
+
+    def _write(self, data):
+        try:
+            written = os.write(self.master, data)
+        except BlockingIOError:
+            written = 0
+        except OSError:
+            written = 0
+        self.bytes_sent += written
+        self.bytes_lost += len(data) - written  # Host not reading: the USB buffer overflows
+
+    def _emit(self, data):
+        data = self.faults.mangle(data)
+        if not data:
+            return
+        if self.latency <= 0 and self.jitter <= 0:
+            self._write(data)
+            return
+        now = time.monotonic()
+        delay = max(0.0, self.latency + (self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0))
+        # Keep the byte order even when the jitter would reorder messages
+        due = max(now + delay, self._last_due)
+        self._last_due = due
+        with self._tx_lock:
+            heapq.heappush(self._tx_queue, (due, next(self._tx_seq), data))
+            self._tx_lock.notify()
+
+    def _run_writer(self):
+        while not self._stop_event.is_set():
+            with self._tx_lock:
+                if not self._tx_queue:
+                    self._tx_lock.wait(0.1)
+                    continue
+                due, _, data = self._tx_queue[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._tx_lock.wait(wait)
+                    continue
+                heapq.heappop(self._tx_queue)
+            if self.master is not None:
+                self._write(data)
+
+    def _pump(self, timeout=0.0):
+        """Move whatever the host wrote into the receive buffer."""
+        if self._stop_event.is_set():
+            raise PowerCycle("stopped")
+        try:
+            readable, _, _ = select.select([self.master], [], [], timeout)
+            if readable:
+                data = os.read(self.master, 4096)
+                if config.E_STOP_ACTIVATED in data:
+                    # On the machine the E-STOP cuts the valve power whatever the firmware is doing
+                    self._update_physics()
+                    self._land_in_flight()
+                    self.valve_powered = False
+                self._rx += data
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            if e.errno != errno.EIO:  # EIO just means no host has the port open
+                raise
+
+    def available(self):
+        self._pump()
+        return len(self._rx)
+
+    def read_byte(self):
+        self._pump()
+        if not self._rx:
+            return -1
+        value = self._rx[0]
+        del self._rx[0]
+        return value
+
+    def peek(self):
+        self._pump()
+        return self._rx[0] if self._rx else -1
+
+    def read_string_until(self, terminator=b'\n', timeout=READ_STRING_TIMEOUT):
+        """Serial.readStringUntil(): text up to (not including) terminator, or what arrived in time."""
+        deadline = time.monotonic() + timeout
+        while True:
+            index = self._rx.find(terminator)
+            if index >= 0:
+                text = bytes(self._rx[:index])
+                del self._rx[:index + 1]
+                return text.decode('utf-8', errors='replace')
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                text = bytes(self._rx)
+                self._rx.clear()
+                return text.decode('utf-8', errors='replace')
+            self._pump(min(remaining, 0.01))
+
+    def delay(self, seconds):
+        """delay(): time passes, nothing is serviced (but stop/faults still apply)."""
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self._stop_event.wait(min(remaining, 0.05)):
+                raise PowerCycle("stopped")
+
+    def wait_ms(self, seconds):
+        """wait_ms(): a delay that keeps the heartbeat going."""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.heartbeat()
+            self.delay(0.01)
+
+    # ---------- firmware state ----------
+
+    def _reset_firmware(self):
+        self.boot_time = time.monotonic()
+        self.protocol_version = 1
+        self.pending_protocol_version = 1
+        self.current_baud = config.DEFAULT_BAUD
+        self.sample_interval = 0
+        self.last_sample_sent = 0
+        self.last_transmit = 0
+        self.heartbeat_enabled = False
+        self.staged_target = 0.0
+        self.staged_time_limit = 0
+        self.last_host_command = 0
+        self.batch = []
+        self.calibration = 0.0
+        self.tare = 0.0
+        self.tare_offset = 0.0
+        self.button_low_start = None
+        self.button_was_stuck = False
+
+    def millis(self):
+        elapsed = (time.monotonic() - self.boot_time) * (1.0 + self.drift_ppm * 1e-6)
+        return int(elapsed * 1000) & 0xFFFFFFFF
+
+    def send_frame(self, opcode, payload=b''):
+        if self.batch and opcode != config.WEIGHT_BATCH:
+            self.flush_weight_batch()
+        self.last_transmit = self.millis()
+        if self.protocol_version < 2:
+            self._emit(opcode + payload)
+        else:
+            self._emit(encode_frame(opcode, payload))
+
+    def send_byte(self, opcode):
+        self.send_frame(opcode)
+
+    def send_value(self, opcode, value, signed=True):
+        self.send_frame(opcode, struct.pack('<i' if signed else '<I', value))
+
+    def send_text(self, opcode, text):
+        if self.protocol_version < 2:
+            self.last_transmit = self.millis()
+            self._emit((opcode or b'') + text.encode('utf-8') + b'\r\n')
+            return
+        self.send_frame(opcode or config.VERBOSE_DEBUG, text.encode('utf-8')[:FRAME_MAX_PAYLOAD])
+
+    def flush_weight_batch(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        self.send_frame(config.WEIGHT_BATCH, b''.join(WEIGHT_SAMPLE.pack(m, w) for m, w in batch))
+
+    def send_weight(self, weight):
+        now = self.millis()
+        if self.sample_interval > 0 and now - self.last_sample_sent < self.sample_interval:
+            return
+        gap = now - self.last_sample_sent
+        self.last_sample_sent = now
+        if self.protocol_version < 2:
+            self.send_value(config.CURRENT_WEIGHT, weight)
+            return
+        self.batch.append((now, weight))
+        # Send before the next reading (one gap away) would make the batch too old
+        if len(self.batch) >= WEIGHT_BATCH_MAX or now - self.batch[0][0] + gap >= WEIGHT_BATCH_MAX_AGE * 1000:
+            self.flush_weight_batch()
+
+    def heartbeat(self):
+        # A partial batch goes out once it is WEIGHT_BATCH_MAX_AGE old, even between slow samples
+        if self.batch and self.millis() - self.batch[0][0] >= WEIGHT_BATCH_MAX_AGE * 1000:
+            self.flush_weight_batch()
+        if self.heartbeat_enabled and self.millis() - self.last_transmit >= HEARTBEAT_INTERVAL * 1000:
+            self.send_byte(config.HEARTBEAT)
+
+    def handle_link_command(self, cmd):
+        self.last_host_command = self.millis()
+        if cmd == config.TIME_PING[0]:
+            self.send_value(config.TIME_ECHO, self.millis(), signed=False)
+            return True
+        if cmd == config.SET_SAMPLE_RATE[0]:
+            self.sample_interval = _to_int(self.read_string_until())
+            return True
+        if cmd == config.STAGE_FILL[0]:
+            target, _, limit = self.read_string_until().partition(',')
+            self.staged_target = _to_float(target)
+            self.staged_time_limit = _to_int(limit)
+            return True
+        return False
+
+    def read_command(self):
+        self.heartbeat()
+        while self.available():
+            cmd = self.read_byte()
+            if self.handle_link_command(cmd):
+                continue
+            return cmd
+        return -1
+
+    def service_link(self):
+        self.heartbeat()
+        while self.peek() in (config.TIME_PING[0], config.SET_SAMPLE_RATE[0], config.STAGE_FILL[0]):
+            self.handle_link_command(self.read_byte())
+
+    # ---------- scale model ----------
+
+    def set_relay(self, open_):
+        self._update_physics()
+        if self.relay_open and not open_:
+            self._land_in_flight()
+        self.relay_open = open_
+
+    def _land_in_flight(self):
+        if self.relay_open and self.valve_powered:
+            self._in_flight += self.overshoot
+
+    def _update_physics(self):
+        now = time.monotonic()
+        dt = now - self._last_physics
+        self._last_physics = now
+        if self.relay_open and self.valve_powered:
+            self.weight += self.flow_rate * dt * self.rng.uniform(0.95, 1.05)
+        elif self._in_flight > 0:
+            landed = min(self._in_flight, self.flow_rate * dt)
+            self.weight += landed
+            self._in_flight -= landed
+        if self._overload_until is not None and now >= self._overload_until:
+            self._overload_until = None
+            self.weight = 0.0
+
+    def _check_faults(self):
+        now = time.monotonic()
+        faults = self.faults
+        if faults.due("disconnect", now):
+            raise PowerCycle("disconnect")
+        if faults.due("stall", now):
+            # Wedged but still enumerated: no heartbeats, no replies
+            self.delay(faults.stall_duration)
+        if faults.due("overload", now):
+            self.inject_overload(faults.overload_duration)
+        stray = faults.stray_bytes()
+        if stray:
+            self._write(stray)
+
+    def read_scale(self, samples=3, alive=False):
+        """
+        scale.get_units(samples): blocks for the conversions, returns tared grams.
+        alive: get_units_alive(), which heartbeats between the conversions.
+        """
+        if alive:
+            for _ in range(samples):
+                self.heartbeat()
+                self.delay(self.sample_period / 3.0)
+        else:
+            self.delay(self.sample_period * samples / 3.0)
+        self._check_faults()
+        self._update_physics()
+        noise = self.rng.gauss(0.0, self.noise) if self.noise else 0.0
+        return int(round(self.weight - self.tare + noise))
+
+    def true_weight(self, reading):
+        return reading + self.tare_offset
+
+    def tare_and_update_offset(self):
+        before = self.read_scale(alive=True)
+        self.read_scale(TARE_READINGS, alive=True)
+        self._update_physics()
+        self.tare = self.weight
+        self.tare_offset += before
+
+    # ---------- operator ----------
+
+    def press_button(self, hold=0.1):
+        """Press the station button for hold seconds (a fill starts on release)."""
+        self._button_release_at = time.monotonic() + hold
+
+    def button_down(self):
+        return time.monotonic() < self._button_release_at
+
+    def place_bottle(self, weight=None):
+        self.weight += self.bottle_weight if weight is None else weight
+
+    def remove_bottle(self):
+        self.weight = 0.0
+        self._in_flight = 0.0
+
+    def inject_overload(self, duration=2.0):
+        """Put more than SCALE_MAX_GRAMS on the scale for duration seconds."""
+        self.weight += SCALE_MAX_GRAMS * 1.1
+        self._overload_until = time.monotonic() + duration
+
+    def _operator_step(self):
+        """With cycle=True: place a bottle, start a fill, take the bottle away, repeat."""
+        if not self.cycle:
+            return
+        now = time.monotonic()
+        if now < self._operator_next:
+            return
+        if self._operator_phase == "empty":
+            self.place_bottle()
+            self._operator_phase = "placed"
+            self._operator_next = now + 0.5
+        elif self._operator_phase == "placed":
+            hold = 0.1
+            if self.fill_mode == "MANUAL":
+                hold = (self.staged_target or config.target_weight) / self.flow_rate
+            self.press_button(hold)
+            self._operator_phase = "filling"
+            self._operator_next = now + hold + 0.1
+        elif self._operator_phase == "filling" and not self.button_down() and not self.relay_open:
+            self._operator_phase = "done"
+            self._operator_next = now + self.cycle_pause
+        elif self._operator_phase == "done":
+            self.remove_bottle()
+            self._operator_phase = "empty"
+            self._operator_next = now + self.cycle_pause
+
+    # ---------- firmware routines ----------
+
+    def handshake_station_id(self):
+        self.batch = []
+        self.sample_interval = 0
+        self.heartbeat_enabled = False
+        self.staged_target = 0.0
+        self.staged_time_limit = 0
+        self.protocol_version = 1
+        self.pending_protocol_version = 1
+        self.current_baud = config.DEFAULT_BAUD
+        sequence = b'PMID'
+        position = 0
+        while position < len(sequence):
+            value = self.read_byte()
+            if value < 0:
+                self._pump(0.005)
+                continue
+            position = position + 1 if value == sequence[position] else 0
+        self.delay(0.5)
+        reply = f"<SERIAL:{self.serial_number}>"
+        if self.max_protocol >= 2:
+            reply += f"<PROTO:{self.max_protocol}><BAUD:{self.max_baud}>"
+        self._emit(reply.encode('utf-8') + b'\r\n')
+        while True:
+            value = self.read_byte()
+            if value == config.CONFIRM_ID[0]:
+                break
+            if value == config.CONFIRM_ID_V2[0] and self.max_protocol >= 2:
+                self.pending_protocol_version = 2
+                break
+            if value < 0:
+                self._pump(0.005)
+        self.delay(0.2)
+
+    def request_and_apply_calibration(self):
+        while True:
+            self.send_byte(config.REQUEST_CALIBRATION)
+            deadline = time.monotonic() + 0.5
+            received = False
+            while time.monotonic() < deadline:
+                if self.read_byte() == config.REQUEST_CALIBRATION[0]:
+                    self.calibration = _to_float(self.read_string_until())
+                    received = True
+                    break
+                self._pump(0.005)
+            if received:
+                break
+        self.protocol_version = self.pending_protocol_version
+        self.heartbeat_enabled = True
+        self.send_text(config.VERBOSE_DEBUG, f"Calibration value received and applied: {self.calibration:.2f}")
+
+    def handle_set_baud(self):
+        text = self.read_string_until()
+        baud = _to_int(text)
+        if baud not in SUPPORTED_BAUD_RATES or baud > self.max_baud:
+            self.send_text(config.VERBOSE_DEBUG, "Unsupported baud rate: " + text)
+            return
+        previous = self.current_baud
+        self.send_value(config.SET_BAUD, baud, signed=False)
+        self.current_baud = baud  # A pty carries any rate; only the exchange is simulated
+        deadline = time.monotonic() + BAUD_CONFIRM_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.read_byte() == config.SET_BAUD[0]:
+                self.send_value(config.SET_BAUD, baud, signed=False)
+                return
+            self._pump(0.005)
+        self.current_baud = previous
+
+    def handle_max_weight_block(self):
+        self.set_relay(False)
+        sent_warning = False
+        while True:
+            reading = self.read_scale()
+            self.send_weight(reading)
+            if abs(self.true_weight(reading)) < MAX_WEIGHT_CLEAR_GRAMS:
+                self.wait_ms(1.5)
+                self.send_byte(config.MAX_WEIGHT_END)
+                self.send_text(None, "<INFO:MAX WEIGHT CLEARED>")
+                return
+            if not sent_warning:
+                self.send_byte(config.MAX_WEIGHT_WARNING)
+                self.send_text(None, "<ERR:MAX WEIGHT EXCEEDED>")
+                sent_warning = True
+            self.heartbeat()
+            self.delay(0.01)
+
+    def loop(self):
+        reading = self.read_scale()
+        if self.true_weight(reading) >= SCALE_MAX_GRAMS:
+            self.handle_max_weight_block()
+            return
+
+        self._operator_step()
+        if self.button_down():
+            if self.button_low_start is None:
+                self.button_low_start = time.monotonic()
+            elif time.monotonic() - self.button_low_start > BUTTON_STUCK_THRESHOLD and not self.button_was_stuck:
+                self.send_byte(config.BUTTON_ERROR)
+                self.send_text(None, "<ERR:BUTTON STUCK>")
+                self.button_was_stuck = True
+        else:
+            if self.button_low_start is not None and not self.button_was_stuck:
+                if self.fill_mode == "SMART":
+                    self.smart_fill()
+                else:
+                    self.fill()
+            self.button_low_start = None
+            self.button_was_stuck = False
+
+        cmd = self.read_command()
+        if cmd >= 0:
+            if cmd in (config.RESET_HANDSHAKE[0], config.GET_ID[0]):
+                if cmd == config.GET_ID[0]:
+                    self.send_text(config.VERBOSE_DEBUG, "Resetting handshake...")
+                else:
+                    self.send_text(config.VERBOSE_DEBUG, "RESET_HANDSHAKE received. Restarting handshake...")
+                self.handshake_station_id()
+                self.request_and_apply_calibration()
+                return
+            if cmd == config.TARE_SCALE[0]:
+                self.tare_and_update_offset()
+                self.send_byte(config.TARE_CONFIRMED)
+            elif cmd == config.RESET_CALIBRATION[0]:
+                self.recalibrate()
+            elif cmd == config.SET_BAUD[0]:
+                self.handle_set_baud()
+            elif cmd == config.MANUAL_FILL_START[0]:
+                self.send_text(config.VERBOSE_DEBUG, "Manual fill started.")
+                self.manual_fill()
+
+        self.send_weight(self.read_scale())
+
+    def staged_fill_ready(self):
+        """Staged values, if any, are only used while the host is still talking to us."""
+        if self.staged_target <= 0 or self.staged_time_limit <= 0:
+            return False
+        if self.millis() - self.last_host_command < STAGED_FILL_TIMEOUT * 1000:
+            return True
+        self.staged_target = 0.0
+        self.staged_time_limit = 0
+        self.send_text(config.VERBOSE_DEBUG, "Staged fill expired: nothing from the host for a while.")
+        return False
+
+    def _receive_fill_parameters(self):
+        """Staged values, or the REQUEST_TARGET_WEIGHT/REQUEST_TIME_LIMIT exchange; None if aborted."""
+        self.read_command()
+        if self.staged_fill_ready():
+            return self.staged_target, self.staged_time_limit
+        self.send_byte(config.REQUEST_TARGET_WEIGHT)
+        requested_at = time.monotonic()
+        while True:
+            cmd = self.read_command()
+            if cmd == config.TARGET_WEIGHT[0]:
+                target = _to_float(self.read_string_until())
+                break
+            if cmd == config.STOP[0]:
+                self.send_text(None, "E-Stop activated. Aborting fill process.")
+                return None
+            if time.monotonic() - requested_at >= TARGET_WEIGHT_TIMEOUT:
+                self.send_text(config.VERBOSE_DEBUG, "No target weight from host. Aborting fill process.")
+                return None
+            if cmd < 0:
+                self._pump(0.001)
+        self.send_byte(config.REQUEST_TIME_LIMIT)
+        self.wait_ms(0.2)
+        cmd = self.read_command()
+        if cmd == config.REQUEST_TIME_LIMIT[0]:
+            time_limit = _to_int(self.read_string_until())
+            self.send_text(config.VERBOSE_DEBUG, f"Received time limit: {time_limit}")
+        elif cmd == config.RELAY_DEACTIVATED[0]:
+            self.send_text(config.VERBOSE_DEBUG, "E-Stop activated. Aborting fill process.")
+            return None
+        elif cmd < 0:
+            return None
+        else:
+            time_limit = 0
+        return target, time_limit
+
+    def fill(self):
+        parameters = self._receive_fill_parameters()
+        if parameters is None:
+            return
+        target, time_limit = parameters
+        self.send_text(config.VERBOSE_DEBUG, f"Target Weight Received: {target:.2f}")
+        self.send_text(config.VERBOSE_DEBUG, f"Time Limit Received: {time_limit}")
+        reading = self.read_scale()
+        self.send_text(config.VERBOSE_DEBUG, f"Current Weight: {reading}")
+        if self.true_weight(reading) > 0.2 * target:
+            return
+
+        self.fills += 1
+        # Nothing tells the station the E-STOP was released; assume it was by the next fill
+        self.valve_powered = True
+        self.set_relay(True)
+        fill_start = self.millis()
+        fill_end = fill_start + time_limit
+        self.send_byte(BEGIN_FILL)
+        while self.read_scale() < target:
+            now = self.millis()
+            reading = self.read_scale()
+            if self.true_weight(reading) >= SCALE_MAX_GRAMS:
+                self.send_byte(config.MAX_WEIGHT_WARNING)
+                self.send_text(None, "<ERR:MAX WEIGHT DURING FILL>")
+                self.set_relay(False)
+                self.handle_max_weight_block()
+                self.set_relay(True)
+                continue
+            self.send_weight(reading)
+            self.service_link()
+            if now >= fill_end:
+                self.set_relay(False)
+                self.send_value(config.FINAL_WEIGHT, self.read_scale())
+                self.send_value(config.FILL_TIME, now - fill_start, signed=False)
+                return
+        self.set_relay(False)
+        self.send_text(config.VERBOSE_DEBUG, "TARGET WEIGHT REACHED")
+        self.send_value(config.FINAL_WEIGHT, self.read_scale())
+        self.send_value(config.FILL_TIME, self.millis() - fill_start, signed=False)
+
+    def smart_fill(self):
+        """Fill to half the target, measure the flow, then run the predicted remainder on time."""
+        self.tare_and_update_offset()
+        parameters = self._receive_fill_parameters()
+        if parameters is None:
+            return
+        target, _ = parameters
+        self.fills += 1
+        self.valve_powered = True
+        self.send_byte(config.SMART_FILL_START)
+        start_weight = self.read_scale()
+        start_time = self.millis()
+        self.set_relay(True)
+        while True:
+            reading = self.read_scale()
+            self.send_weight(reading)
+            self.service_link()
+            if reading >= target * 0.5:
+                break
+        half_weight, half_time = reading, self.millis()
+        elapsed = half_time - start_time
+        flow = (half_weight - start_weight) / elapsed if elapsed > 0 else 0.0
+        predicted_end = time.monotonic() + ((target - half_weight) / flow / 1000.0 if flow > 0 else 0.0)
+        while time.monotonic() < predicted_end:
+            self.send_weight(self.read_scale())
+            self.service_link()
+            self.delay(0.01)
+        self.set_relay(False)
+        self.send_byte(config.SMART_FILL_END)
+        end_weight = self.read_scale()
+        self.send_text(config.VERBOSE_DEBUG, f"Flow rate (g/ms): {flow:.6f}")
+        self.send_text(config.VERBOSE_DEBUG, f"Final weight: {end_weight}")
+
+    def manual_fill(self):
+        self.set_relay(False)
+        while True:
+            while not self.button_down():
+                reading = self.read_scale()
+                if self.true_weight(reading) >= SCALE_MAX_GRAMS:
+                    self.send_byte(config.MAX_WEIGHT_WARNING)
+                    self.send_text(None, "<ERR:MAX WEIGHT DURING MANUAL (IDLE)>")
+                    self.handle_max_weight_block()
+                    continue
+                self.send_weight(reading)
+                self._operator_step()
+                if self.read_command() == config.EXIT_MANUAL_END[0]:
+                    return
+            self.set_relay(True)
+            while self.button_down():
+                reading = self.read_scale()
+                if self.true_weight(reading) >= SCALE_MAX_GRAMS:
+                    self.send_byte(config.MAX_WEIGHT_WARNING)
+                    self.send_text(None, "<ERR:MAX WEIGHT DURING MANUAL>")
+                    self.set_relay(False)
+                    self.handle_max_weight_block()
+                    self.set_relay(True)
+                    continue
+                self.send_weight(reading)
+                if self.read_command() == MANUAL_FILL_END[0]:
+                    self.set_relay(False)
+                    return
+            self.set_relay(False)
+
+    def recalibrate(self):
+        self.send_text(None, "Starting recalibration...")
+        while True:
+            self.send_weight(self.read_scale())
+            if self.read_command() == config.CALIBRATION_CONTINUE[0]:
+                break
+        self.tare_and_update_offset()
+        self.read_scale(10, alive=True)
+        self.wait_ms(0.5)
+        self.send_byte(config.CALIBRATION_STEP_DONE)
+        while True:
+            cmd = self.read_command()
+            if cmd == config.CALIBRATION_WEIGHT[0]:
+                self.read_string_until()
+                self.delay(0.1)
+                self.send_byte(config.CALIBRATION_STEP_DONE)
+                self.delay(0.2)
+                break
+            if cmd < 0:
+                self._pump(0.005)
+        self.read_scale(10, alive=True)
+        self.wait_ms(0.5)
+        self.send_byte(config.CALIBRATION_STEP_DONE)
+        # The model scale is always in grams, so the calibration factor does not change
+        self.send_text(config.CALIBRATION_WEIGHT, f"{self.calibration:.2f}")
+        self.send_byte(config.CALIBRATION_STEP_DONE)
+
+    # ---------- thread ----------
+
+    def run(self):
+        threading.Thread(target=self._run_writer, name=f"{self.name}-tx", daemon=True).start()
+        while not self._stop_event.is_set():
+            try:
+                self._reset_firmware()
+                self.handshake_station_id()
+                self.request_and_apply_calibration()
+                while True:
+                    self.loop()
+            except PowerCycle as e:
+                if self._stop_event.is_set():
+                    break
+                # Unplugged: the port disappears, then the board enumerates again
+                self._close_pty()
+                self.relay_open = False
+                if self._stop_event.wait(self.faults.reboot_delay):
+                    break
+                self._open_pty()
+                if config.DEBUG:
+                    print(f"[scale_simulator] Station {self.station_index+1}: {e}, back on {self.port}")
+        self._close_pty()
+
+    def stop(self):
+        self._stop_event.set()
+        with self._tx_lock:
+            self._tx_lock.notify()
+
+
+def _to_int(text):
+    try:
+        return int(float(text.strip() or 0))
+    except ValueError:
+        return 0
+
+
+def _to_float(text):
+    try:
+        return float(text.strip() or 0)
+    except ValueError:
+        return 0.0
+
+
+class ScaleSimulator:
+    """A set of SimulatedStations; ports lists the pty (or symlink) per station."""
+    def __init__(self, num_stations=config.NUM_STATIONS, serial_numbers=None, link_dir=None, seed=None,
+                 fault_options=None, **station_options):
+        if link_dir:
+            os.makedirs(link_dir, exist_ok=True)
+        self.stations = []
+        for station_index in range(num_stations):
+            serial_number = (serial_numbers[station_index] if serial_numbers and station_index < len(serial_numbers)
+                             else f"PM-SN{station_index+1:04d}")
+            link_path = os.path.join(link_dir, f"ttySIM{station_index}") if link_dir else None
+            station_seed = None if seed is None else seed + station_index
+            rng = random.Random(station_seed)
+            faults = FaultInjector(rng=rng, **(fault_options or {}))
+            self.stations.append(SimulatedStation(
+                station_index, serial_number, link_path=link_path, faults=faults, seed=station_seed,
+                **station_options
+            ))
+
+    @property
+    def ports(self):
+        return [station.link_path or station.port for station in self.stations]
+
+    def start(self):
+        for station in self.stations:
+            station.start()
+        return self
+
+    def stop(self):
+        for station in self.stations:
+            station.stop()
+        for station in self.stations:
+            station.join(timeout=2.0)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def report(self):
+        lines = []
+        for station in self.stations:
+            faults = " ".join(f"{kind}={count}" for kind, count in station.faults.counts.items() if count)
+            lines.append(
+                f"Station {station.station_index+1} ({station.serial_number}): fills={station.fills} "
+                f"sent={station.bytes_sent} B lost={station.bytes_lost} B {faults}".rstrip()
+            )
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate scale_controller stations on pseudo-terminals.")
+    parser.add_argument("--stations", type=int, default=config.NUM_STATIONS)
+    parser.add_argument("--serials", help="comma-separated serial numbers (default PM-SN0001, PM-SN0002, ...)")
+    parser.add_argument("--link-dir", help="also create stable symlinks <dir>/ttySIM<n> to the ptys")
+    parser.add_argument("--protocol", type=int, choices=(1, 2), default=2, help="highest protocol to offer")
+    parser.add_argument("--max-baud", type=int, default=250000)
+    parser.add_argument("--flow-rate", type=float, default=DEFAULT_FLOW_RATE, help="grams per second")
+    parser.add_argument("--noise", type=float, default=DEFAULT_NOISE, help="reading noise (grams, std dev)")
+    parser.add_argument("--sample-period", type=float, default=DEFAULT_SAMPLE_PERIOD, help="seconds per scale read")
+    parser.add_argument("--overshoot", type=float, default=DEFAULT_OVERSHOOT, help="grams landing after the relay closes")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every message")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--drift-ppm", type=float, default=0.0, help="station clock error")
+    parser.add_argument("--cycle", action="store_true", help="place bottles and start fills automatically")
+    parser.add_argument("--cycle-pause", type=float, default=DEFAULT_CYCLE_PAUSE)
+    parser.add_argument("--fill-mode", choices=("AUTO", "SMART", "MANUAL"), default="AUTO")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability a message is lost")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="probability a message has a flipped bit")
+    parser.add_argument("--garbage", type=float, default=0.0, help="probability per loop of stray bytes")
+    parser.add_argument("--stall-every", type=float, default=0.0, help="mean seconds between stalls")
+    parser.add_argument("--stall-duration", type=float, default=1.0)
+    parser.add_argument("--disconnect-every", type=float, default=0.0, help="mean seconds between unplugs")
+    parser.add_argument("--overload-every", type=float, default=0.0, help="mean seconds between MAX_WEIGHT events")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    simulator = ScaleSimulator(
+        args.stations,
+        serial_numbers=args.serials.split(",") if args.serials else None,
+        link_dir=args.link_dir,
+        seed=args.seed,
+        fault_options=dict(
+            drop=args.drop, corrupt=args.corrupt, garbage=args.garbage,
+            stall_every=args.stall_every, stall_duration=args.stall_duration,
+            disconnect_every=args.disconnect_every, overload_every=args.overload_every,
+        ),
+        flow_rate=args.flow_rate, noise=args.noise, sample_period=args.sample_period,
+        overshoot=args.overshoot, latency=args.latency, jitter=args.jitter, drift_ppm=args.drift_ppm,
+        protocol=args.protocol, max_baud=args.max_baud, cycle=args.cycle, cycle_pause=args.cycle_pause,
+        fill_mode=args.fill_mode,
+    )
+    with simulator:
+        for station in simulator.stations:
+            print(f"Station {station.station_index+1} ({station.serial_number}): {station.link_path or station.port}")
+        print(f"arduino_ports={','.join(simulator.ports)}")
+        try:
+            while True:
+                time.sleep(10)
+                print(simulator.report())
+        except KeyboardInterrupt:
+            pass
+    print(simulator.report())
+
+
+if __name__ == "__main__":
+    main()
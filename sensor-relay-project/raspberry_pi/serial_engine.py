@@ -0,0 +1,268 @@
+import logging
+import os
+import queue
+import selectors
+import threading
+import time
+import serial
+import config
+from frame_decoder import make_decoder
+
+# Pseudo message type posted by a reader when its serial port goes away.
+LINK_LOST = None
+
+# Weight samples beyond this backlog are dropped instead of blocking a reader.
+EVENT_QUEUE_SIZE = 512
+
+
+def post_event(events, event, stop_event):
+    """
+    Queue one (station_index, arduino, message_type, payload, received_at) event.
+    received_at is the time.monotonic() at which the bytes were read.
+    Returns False if it was a weight sample dropped because the queue is full.
+    """
+    if event[2] == config.CURRENT_WEIGHT:
+        # Weight samples are superseded by the next one, so never block on them
+        try:
+            events.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+    while not stop_event.is_set():
+        try:
+            events.put(event, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return True
+
+
+def drain_events(events, max_events=None):
+    """Yield queued events without blocking."""
+    count = 0
+    while max_events is None or count < max_events:
+        try:
+            yield events.get_nowait()
+        except queue.Empty:
+            return
+        count += 1
+
+
+class StationReader(threading.Thread):
+    """
+    Drains one station's serial port on a background thread.
+    Each complete message is posted to the shared event queue as
+    (station_index, arduino, message_type, payload, received_at), and
+    reported to the stall watchdog, if any, from this thread.
+    """
+    def __init__(self, station_index, arduino, events, watchdog=None):
+        super().__init__(name=f"station{station_index+1}-reader", daemon=True)
+        self.station_index = station_index
+        self.arduino = arduino
+        self.events = events
+        self.decoder = make_decoder(arduino)
+        self.watchdog = watchdog
+        self.dropped_samples = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _post(self, message_type, payload, received_at):
+        event = (self.station_index, self.arduino, message_type, payload, received_at)
+        if not post_event(self.events, event, self._stop_event):
+            self.dropped_samples += 1
+
+    def run(self):
+        arduino = self.arduino
+        decoder = self.decoder
+        watchdog = self.watchdog
+        while not self._stop_event.is_set():
+            try:
+                # Blocks for at most arduino.timeout, then takes whatever else is buffered
+                if not decoder.read_from(arduino, block=True):
+                    continue
+                received_at = decoder.received_at
+                for message_type, payload in decoder.decode():
+                    if watchdog is not None:
+                        watchdog.feed(self.station_index, message_type, received_at)
+                    self._post(message_type, payload, received_at)
+            except serial.SerialException as e:
+                if not self._stop_event.is_set():
+                    self._post(LINK_LOST, str(e).encode('utf-8', errors='replace'), time.monotonic())
+                break
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                logging.error(f"Station {self.station_index+1}: error in serial reader: {e}")
+                if config.DEBUG:
+                    print(f"[StationReader] Station {self.station_index+1}: {e}")
+
+
+class ThreadedSerialEngine:
+    """One StationReader per connected station, feeding a bounded event queue."""
+    def __init__(self, maxsize=EVENT_QUEUE_SIZE, watchdog=None):
+        self.events = queue.Queue(maxsize=maxsize)
+        self.watchdog = watchdog
+        self.readers = {}
+
+    def start(self, arduinos):
+        for station_index, arduino in enumerate(arduinos):
+            if arduino is not None:
+                self.attach(station_index, arduino)
+
+    def attach(self, station_index, arduino):
+        self.detach(station_index)
+        reader = StationReader(station_index, arduino, self.events, self.watchdog)
+        self.readers[station_index] = reader
+        reader.start()
+        if config.DEBUG:
+            print(f"[ThreadedSerialEngine] Reader started for station {station_index+1}")
+
+    def detach(self, station_index):
+        reader = self.readers.pop(station_index, None)
+        if reader is not None:
+            reader.stop()
+
+    def stop(self):
+        for station_index in list(self.readers):
+            self.detach(station_index)
+
+    def drain(self, max_events=None):
+        return drain_events(self.events, max_events)
+
+
+class SelectorSerialEngine:
+    """
+    Services every station from a single thread.
+    Each port's file descriptor is registered with a selector, so the thread
+    sleeps until bytes arrive on some port instead of polling in_waiting.
+    Events go to the same queue format as ThreadedSerialEngine.
+    """
+    def __init__(self, maxsize=EVENT_QUEUE_SIZE, watchdog=None):
+        self.events = queue.Queue(maxsize=maxsize)
+        self.watchdog = watchdog
+        self.dropped_samples = 0
+        self._selector = selectors.DefaultSelector()
+        self._stations = {}  # station_index -> selector key
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        # Self-pipe so attach/detach/stop can interrupt select()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, None)
+
+    def start(self, arduinos):
+        for station_index, arduino in enumerate(arduinos):
+            if arduino is not None:
+                self.attach(station_index, arduino)
+        self._thread = threading.Thread(target=self._run, name="serial-selector", daemon=True)
+        self._thread.start()
+
+    def attach(self, station_index, arduino):
+        self._request(("attach", station_index, arduino))
+
+    def detach(self, station_index):
+        self._request(("detach", station_index, None))
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self._selector.close()
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+
+    def drain(self, max_events=None):
+        return drain_events(self.events, max_events)
+
+    def _request(self, op):
+        with self._lock:
+            self._pending.append(op)
+        self._wake()
+
+    def _wake(self):
+        try:
+            os.write(self._wakeup_write, b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _apply_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for action, station_index, arduino in pending:
+            self._unregister(station_index)
+            if action == "attach":
+                try:
+                    key = self._selector.register(
+                        arduino.fileno(), selectors.EVENT_READ,
+                        (station_index, arduino, make_decoder(arduino))
+                    )
+                    self._stations[station_index] = key
+                    if config.DEBUG:
+                        print(f"[SelectorSerialEngine] Watching station {station_index+1}")
+                except Exception as e:
+                    logging.error(f"Station {station_index+1}: could not watch serial port: {e}")
+                    post_event(self.events, (station_index, arduino, LINK_LOST, str(e).encode('utf-8', errors='replace'), time.monotonic()), self._stop_event)
+
+    def _unregister(self, station_index):
+        key = self._stations.pop(station_index, None)
+        if key is not None:
+            try:
+                self._selector.unregister(key.fileobj)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._apply_pending()
+            try:
+                ready = self._selector.select(timeout=1.0)
+            except OSError as e:
+                logging.error(f"Error in serial selector: {e}")
+                continue
+            for key, mask in ready:
+                if key.data is None:
+                    try:
+                        while os.read(self._wakeup_read, 512):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                station_index, arduino, decoder = key.data
+                try:
+                    # Readable, so this returns at once (or raises if the port vanished)
+                    decoder.read_from(arduino, block=True)
+                    received_at = decoder.received_at
+                    for message_type, payload in decoder.decode():
+                        if self.watchdog is not None:
+                            self.watchdog.feed(station_index, message_type, received_at)
+                        event = (station_index, arduino, message_type, payload, received_at)
+                        if not post_event(self.events, event, self._stop_event):
+                            self.dropped_samples += 1
+                except serial.SerialException as e:
+                    self._unregister(station_index)
+                    post_event(self.events, (station_index, arduino, LINK_LOST, str(e).encode('utf-8', errors='replace'), time.monotonic()), self._stop_event)
+                except Exception as e:
+                    logging.error(f"Station {station_index+1}: error in serial selector: {e}")
+                    if config.DEBUG:
+                        print(f"[SelectorSerialEngine] Station {station_index+1}: {e}")
+
+
+def create_serial_engine(name, async_bridge=None, watchdog=None, hardware_process=None):
+    """Return the serial engine for name, or None for the legacy polling path."""
+    if name == "threaded":
+        return ThreadedSerialEngine(watchdog=watchdog)
+    if name == "selector":
+        return SelectorSerialEngine(watchdog=watchdog)
+    if name == "asyncio":
+        from async_serial import AsyncSerialEngine
+        return AsyncSerialEngine(async_bridge, watchdog=watchdog)
+    if name == "process":
+        from hardware_process import ProcessSerialEngine
+        return ProcessSerialEngine(hardware_process, watchdog=watchdog)
+    return None
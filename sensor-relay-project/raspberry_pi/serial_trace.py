@@ -0,0 +1,353 @@
+"""
+Record and replay the raw serial traffic of every station.
+
+With serial_trace=<directory> in config.txt, main.py wraps each handshaked
+port in a TracingSerial that tees every byte read and written into a
+compact binary trace (one file per session). The replay driver feeds a
+trace back through main.poll_hardware, in real time or as fast as possible.
+
+Trace file: TRACE_MAGIC, then a TRACE_HEADER (format version, wall-clock
+start), then records of RECORD (microseconds since start, station index,
+kind, length) followed by length bytes of data.
+
+Run from the raspberry_pi directory:
+    python serial_trace.py info logs/traces/serial_20250101_120000.pmt
+    python serial_trace.py replay logs/traces/serial_20250101_120000.pmt [--fast] [--speed 2] [--profile]
+"""
+import argparse
+import collections
+import json
+import os
+import struct
+import threading
+import time
+
+TRACE_MAGIC = b'PMTRACE'
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct('<Bd')      # version, time.time() at start
+RECORD = struct.Struct('<QBBH')          # microseconds since start, station, kind, length
+RECORD_MAX_DATA = 0xFFFF
+
+# Record kinds
+KIND_RX = 0      # bytes read from the station
+KIND_TX = 1      # bytes written to the station
+KIND_OPEN = 2    # JSON: port, protocol_version, baudrate of a newly installed port
+KIND_CLOSE = 3   # the port was closed
+
+# poll_hardware period, used as the virtual tick for --fast replays
+REPLAY_TICK = 0.035
+
+
+class TraceWriter:
+    """Appends timestamped records to one trace file; safe to call from any thread."""
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._file = open(path, "wb")
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._file.write(TRACE_MAGIC + TRACE_HEADER.pack(TRACE_VERSION, time.time()))
+
+    def record(self, station_index, kind, data=b'', at=None):
+        offset_us = int(((at if at is not None else time.monotonic()) - self._started) * 1e6)
+        with self._lock:
+            if self._file is None:
+                return
+            for start in range(0, max(len(data), 1), RECORD_MAX_DATA):
+                chunk = data[start:start + RECORD_MAX_DATA]
+                self._file.write(RECORD.pack(max(0, offset_us), station_index, kind, len(chunk)))
+                self._file.write(chunk)
+
+    def wrap(self, station_index, arduino):
+        """Start tracing a handshaked port; returns the port to use instead."""
+        if isinstance(arduino, TracingSerial):
+            arduino = arduino.wrapped
+        meta = {
+            "port": getattr(arduino, "port", None),
+            "protocol_version": getattr(arduino, "protocol_version", 1),
+            "baudrate": getattr(arduino, "baudrate", None),
+        }
+        self.record(station_index, KIND_OPEN, json.dumps(meta).encode('utf-8'))
+        return TracingSerial(arduino, station_index, self)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class TracingSerial:
+    """
+    Stands in for a serial.Serial and records what passes through it.
+    Everything else (in_waiting, fileno, baudrate, protocol_version, ...)
+    goes straight to the wrapped port.
+    """
+    __slots__ = ('wrapped', 'station_index', 'writer')
+
+    def __init__(self, wrapped, station_index, writer):
+        object.__setattr__(self, 'wrapped', wrapped)
+        object.__setattr__(self, 'station_index', station_index)
+        object.__setattr__(self, 'writer', writer)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.wrapped, name, value)
+
+    def read(self, size=1):
+        data = self.wrapped.read(size)
+        if data:
+            self.writer.record(self.station_index, KIND_RX, data)
+        return data
+
+    def write(self, data):
+        self.writer.record(self.station_index, KIND_TX, bytes(data))
+        return self.wrapped.write(data)
+
+    def close(self):
+        self.writer.record(self.station_index, KIND_CLOSE)
+        self.wrapped.close()
+
+
+def read_trace(path):
+    """Return (wall-clock start, [(seconds since start, station_index, kind, data), ...])."""
+    with open(path, "rb") as f:
+        blob = f.read()
+    if not blob.startswith(TRACE_MAGIC):
+        raise ValueError(f"{path} is not a serial trace")
+    offset = len(TRACE_MAGIC)
+    version, started = TRACE_HEADER.unpack_from(blob, offset)
+    if version != TRACE_VERSION:
+        raise ValueError(f"{path}: unsupported trace version {version}")
+    offset += TRACE_HEADER.size
+    records = []
+    size = len(blob)
+    while offset + RECORD.size <= size:
+        offset_us, station_index, kind, length = RECORD.unpack_from(blob, offset)
+        offset += RECORD.size
+        if offset + length > size:
+            break  # Cut off mid-record (e.g. the app was killed)
+        records.append((offset_us / 1e6, station_index, kind, blob[offset:offset + length]))
+        offset += length
+    return started, records
+
+
+class ReplaySerial:
+    """
+    A recorded port session: bytes the station sent become readable once the
+    replay clock passes the time they were read. Writes are counted and dropped.
+    """
+    def __init__(self, meta, clock):
+        self.port = meta.get("port") or "replay"
+        self.protocol_version = meta.get("protocol_version", 1)
+        self.baudrate = meta.get("baudrate")
+        self.timeout = 0
+        self.is_open = True
+        self.bytes_written = 0
+        self._clock = clock
+        self._chunks = collections.deque()  # (seconds, data)
+        self._buffer = bytearray()
+
+    def add(self, at, data):
+        self._chunks.append((at, data))
+
+    @property
+    def exhausted(self):
+        return not self._chunks and not self._buffer
+
+    def _release(self):
+        now = self._clock()
+        chunks = self._chunks
+        while chunks and chunks[0][0] <= now:
+            self._buffer += chunks.popleft()[1]
+
+    @property
+    def in_waiting(self):
+        self._release()
+        return len(self._buffer)
+
+    def read(self, size=1):
+        self._release()
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._buffer.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+def build_sessions(records, clock):
+    """Split a trace into (start, station_index, ReplaySerial) port sessions, in order."""
+    sessions = []
+    current = {}
+    for at, station_index, kind, data in records:
+        if kind == KIND_OPEN:
+            session = ReplaySerial(json.loads(data.decode('utf-8')), clock)
+            current[station_index] = session
+            sessions.append((at, station_index, session))
+        elif kind == KIND_RX and station_index in current:
+            current[station_index].add(at, data)
+        elif kind == KIND_CLOSE:
+            current.pop(station_index, None)
+    return sessions
+
+
+class ReplayApp:
+    """The few attributes poll_hardware reads from the GUI app, without a GUI."""
+    active_dialog = None
+    overlay_widget = None
+    refresh_ui = None
+    station_widgets = None
+    filling_mode = "AUTO"
+
+    def tr(self, text):
+        return text
+
+
+def prepare_host():
+    """Import main for a headless replay: legacy polling path, no debug output."""
+    import config
+    config.DEBUG = False
+    config.SERIAL_ENGINE = "poll"
+    import main as host
+    host.DEBUG = False
+    host.handler_ctx.DEBUG = False
+    host.hardware_engine = None
+    host.station_enabled[:] = [True] * host.NUM_STATIONS
+    return host
+
+
+def drive(host, sessions, clock, advance, app=None):
+    """
+    Install each (start, station_index, port) session when clock() reaches its
+    start and call host.poll_hardware until every port has been read dry.
+    advance() moves time on by one tick. Returns the number of ticks.
+    """
+    sessions = collections.deque(sessions)
+    app = app or ReplayApp()
+    live = []
+    ticks = 0
+    while sessions or any(not port.exhausted for port in live):
+        now = clock()
+        while sessions and sessions[0][0] <= now:
+            _, station_index, port = sessions.popleft()
+            host.install_station_port(station_index, port)
+            live.append(port)
+        host.poll_hardware(app)
+        ticks += 1
+        advance()
+    return ticks
+
+
+def replay(path, speed=1.0, fast=False, app=None):
+    """
+    Feed a trace through main.poll_hardware on the legacy polling path.
+    fast=True advances a virtual clock by one REPLAY_TICK per poll instead of sleeping.
+    Returns a dict of counters.
+    """
+    host = prepare_host()
+    _, records = read_trace(path)
+    duration = records[-1][0] if records else 0.0
+    replay_time = [0.0]
+    started = time.monotonic()
+
+    if fast:
+        def clock():
+            return replay_time[0]
+
+        def advance():
+            replay_time[0] += REPLAY_TICK
+    else:
+        def clock():
+            return (time.monotonic() - started) * speed
+
+        def advance():
+            time.sleep(REPLAY_TICK)
+
+    sessions = build_sessions(records, clock)
+    rx_bytes = sum(len(data) for _, _, kind, data in records if kind == KIND_RX)
+    samples_before = sum(host.weight_coalescer.total_samples)
+    cpu_started = time.process_time()
+    wall_started = time.monotonic()
+    ticks = drive(host, sessions, clock, advance, app)
+    return {
+        "trace_seconds": duration,
+        "replay_seconds": time.monotonic() - wall_started,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "ticks": ticks,
+        "rx_bytes": rx_bytes,
+        "samples": sum(host.weight_coalescer.total_samples) - samples_before,
+    }
+
+
+def describe(path):
+    started, records = read_trace(path)
+    per_station = collections.defaultdict(lambda: [0, 0, 0])  # rx bytes, tx bytes, sessions
+    for _, station_index, kind, data in records:
+        if kind == KIND_RX:
+            per_station[station_index][0] += len(data)
+        elif kind == KIND_TX:
+            per_station[station_index][1] += len(data)
+        elif kind == KIND_OPEN:
+            per_station[station_index][2] += 1
+    duration = records[-1][0] if records else 0.0
+    lines = [f"{path}: started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))}, "
+             f"{duration:.1f} s, {len(records)} records"]
+    for station_index in sorted(per_station):
+        rx, tx, opened = per_station[station_index]
+        lines.append(f"  Station {station_index+1}: {rx} B read, {tx} B written, {opened} session(s)")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay a serial trace.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="summarize a trace")
+    info.add_argument("trace")
+    play = sub.add_parser("replay", help="feed a trace through poll_hardware")
+    play.add_argument("trace")
+    play.add_argument("--fast", action="store_true", help="as fast as possible instead of real time")
+    play.add_argument("--speed", type=float, default=1.0, help="real-time speed factor")
+    play.add_argument("--profile", action="store_true", help="print the top functions by cumulative time")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        print(describe(args.trace))
+        return
+    if args.profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        result = profiler.runcall(replay, args.trace, args.speed, args.fast)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    else:
+        result = replay(args.trace, args.speed, args.fast)
+    print(
+        f"Replayed {result['trace_seconds']:.1f} s of traffic in {result['replay_seconds']:.2f} s "
+        f"({result['ticks']} ticks, {result['cpu_seconds']:.2f} s CPU): "
+        f"{result['rx_bytes'] / max(result['replay_seconds'], 1e-9):.0f} B/s, "
+        f"{result['samples'] / max(result['replay_seconds'], 1e-9):.0f} weight samples/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import logging
+import os
+
+
+class SimulatedGPIO:
+    """
+    Stand-in for RPi.GPIO on a machine without GPIO pins (e.g. a desktop
+    running main.py against scale_simulator). Inputs read as pulled up, so
+    no button is pressed and the E-STOP is released; outputs are remembered.
+    Tests and scripts can change an input with set_input().
+    """
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    HIGH = 1
+    LOW = 0
+    PUD_UP = 22
+    PUD_DOWN = 21
+    PUD_OFF = 20
+
+    def __init__(self):
+        self.levels = {}
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        if direction == self.IN:
+            self.levels.setdefault(pin, self.LOW if pull_up_down == self.PUD_DOWN else self.HIGH)
+        else:
+            self.levels[pin] = initial if initial is not None else self.LOW
+
+    def input(self, pin):
+        return self.levels.get(pin, self.HIGH)
+
+    def output(self, pin, level):
+        self.levels[pin] = level
+
+    def set_input(self, pin, level):
+        self.levels[pin] = level
+
+    def cleanup(self, *pins):
+        pass
+
+
+class FileGPIO(SimulatedGPIO):
+    """
+    SimulatedGPIO whose inputs are driven from a text file of "<pin>=<level>"
+    lines, e.g. "23=0" holds the E-STOP (BCM 23) pressed. The file is re-read
+    whenever its modification time changes, so a load test or an operator on
+    a headless host can press buttons by rewriting it. Pins the file does not
+    mention, and every pin while the file is missing, keep their simulated level.
+    """
+    LEVEL_NAMES = {"0": 0, "1": 1, "low": 0, "high": 1}
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._mtime = None
+        self._file_levels = {}
+
+    def input(self, pin):
+        self._reload()
+        level = self._file_levels.get(pin)
+        if level is None:
+            return super().input(pin)
+        return level
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self._mtime = None
+            self._file_levels = {}
+            return
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        levels = {}
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    line = line.split("#", 1)[0].strip()
+                    if "=" not in line:
+                        continue
+                    pin, level = (part.strip() for part in line.split("=", 1))
+                    try:
+                        levels[int(pin)] = self.LEVEL_NAMES[level.lower()]
+                    except (ValueError, KeyError):
+                        logging.error(f"{self.path}: ignoring GPIO line {line!r}")
+        except OSError as e:
+            logging.error(f"Could not read GPIO input file {self.path}: {e}")
+        self._file_levels = levels
@@ -0,0 +1,86 @@
+import logging
+import queue
+import threading
+import time
+import config
+
+
+class StallWatchdog:
+    """
+    Notices stations that are still enumerated but have stopped talking.
+    The serial readers call feed() for every decoded message; a station is
+    watched from its first HEARTBEAT on, so firmware without heartbeats is
+    never flagged. A background thread checks the stations every interval
+    seconds, independent of the GUI timer, and queues (station_index, silence)
+    for any station that has been quiet for longer than timeout. The GUI
+    thread picks them up with drain() and sends the station down the
+    reconnect path.
+    """
+    def __init__(self, num_stations, timeout=config.STATION_STALL_TIMEOUT, interval=None):
+        self.timeout = timeout
+        self.interval = interval if interval is not None else timeout / 5.0
+        self.events = queue.Queue()
+        self.stall_count = [0] * num_stations
+        self._last_seen = [None] * num_stations  # time.monotonic() of the last message, None = not watched
+        self._stalled = [False] * num_stations
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="stall-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def feed(self, station_index, message_type, received_at):
+        """Record a valid message from the station (safe from any thread)."""
+        if message_type == config.HEARTBEAT or self._last_seen[station_index] is not None:
+            self._last_seen[station_index] = received_at
+            self._stalled[station_index] = False
+
+    def forget(self, station_index):
+        """Stop watching a station until it sends its next HEARTBEAT (lost or reconnected)."""
+        self._last_seen[station_index] = None
+        self._stalled[station_index] = False
+
+    def silence(self, station_index, now=None):
+        """Seconds since the station's last message, or None if it is not watched."""
+        last_seen = self._last_seen[station_index]
+        if last_seen is None:
+            return None
+        return (now or time.monotonic()) - last_seen
+
+    def check(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        for station_index, last_seen in enumerate(self._last_seen):
+            if last_seen is None or self._stalled[station_index]:
+                continue
+            silence = now - last_seen
+            if silence > self.timeout:
+                self._stalled[station_index] = True
+                self.stall_count[station_index] += 1
+                logging.error(f"Station {station_index+1}: no message for {silence * 1000:.0f} ms, marking it stalled")
+                self.events.put((station_index, silence))
+
+    def drain(self):
+        """Yield queued (station_index, silence) stalls without blocking."""
+        while True:
+            try:
+                yield self.events.get_nowait()
+            except queue.Empty:
+                return
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Error in stall watchdog: {e}")
@@ -4,7 +4,15 @@ import config
 import serial
 import re
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from config import GPIO
+from frame_decoder import PROTOCOL_V1, negotiated_protocol, offered_baud, confirm_id_for, make_decoder
+
+# Baud switch-over: the station acks SET_BAUD at the old rate, then waits
+# BAUD_CONFIRM_TIMEOUT in the firmware for our SET_BAUD at the new rate
+BAUD_ACK_TIMEOUT = 1.0
+BAUD_SWITCH_DELAY = 0.05
+FIRMWARE_BAUD_CONFIRM_TIMEOUT = 1.0
 
 from utils import (
     load_scale_calibrations,
@@ -21,7 +29,7 @@ def get_current_station_weights(context):
     Returns a list of current weights for all enabled and connected stations.
     Uses context['station_weights'] if available, else returns zeros.
     """
-    NUM_STATIONS = context.get('NUM_STATIONS', 4)
+    NUM_STATIONS = context.get('NUM_STATIONS', config.NUM_STATIONS)
     station_enabled = context.get('station_enabled', [True]*NUM_STATIONS)
     station_connected = context.get('station_connected', [True]*NUM_STATIONS)
     # Always reference the latest weights from the wizard
@@ -35,6 +43,7 @@ def step_load_serials_and_ranges(context):
         print("Step: Load serials, bottle sizes, ranges, and calibration values")
         # Load serials
         context['station_serials'] = load_station_serials()
+        config.serial_numbers[:] = context['station_serials']
         # Load bottle sizes and ranges
         context['bottle_sizes'] = load_bottle_sizes(context['config_file'])
         context['bottle_ranges'] = load_bottle_weight_ranges(context['config_file'], tolerance=context.get('BOTTLE_WEIGHT_TOLERANCE', 25))
@@ -50,7 +59,205 @@ def step_load_serials_and_ranges(context):
         print(f"[ERROR] Exception in step_load_serials_and_ranges: {e}")
 
 
+def handshake_port(port, station_serials, scale_calibrations, config, DEBUG=False):
+    """
+    Open one port and run the PMID handshake and calibration exchange.
+    Returns (station_index, arduino, timings); station_index and arduino are
+    None if no recognized station answered. timings holds seconds per phase.
+    """
+    started = time.monotonic()
+    timings = {'port': port, 'result': 'no station', 'station': None}
+
+    def mark(phase):
+        timings[phase] = time.monotonic() - started
+
+    arduino = None
+    try:
+        print(f"[DEBUG] Trying port {port}...")
+        arduino = serial.Serial(port, config.DEFAULT_BAUD, timeout=0.5)
+        mark('open')
+        station_serial_number = None
+        protocol_version = PROTOCOL_V1
+        fastest_baud = None
+        for attempt in range(2):
+            if attempt:
+                if not config.SERIAL_BAUD_RATES:
+                    break
+                # No answer at the default rate: the station may still be on a rate
+                # negotiated before we lost it. RESET_HANDSHAKE drops it back to default.
+                print(f"[DEBUG] No reply on {port} at {config.DEFAULT_BAUD} baud, resetting at {config.SERIAL_BAUD_RATES}")
+                for rate in config.SERIAL_BAUD_RATES:
+                    arduino.baudrate = rate
+                    arduino.write(config.RESET_HANDSHAKE)
+                    arduino.flush()
+                    time.sleep(0.05)
+                arduino.baudrate = config.DEFAULT_BAUD
+                arduino.reset_input_buffer()
+            # Send RESET_HANDSHAKE before PMID to allow handshake restart
+            arduino.write(config.RESET_HANDSHAKE)
+            arduino.flush()
+            time.sleep(0.05)
+            for b in b'PMID':
+                arduino.write(bytes([b]))
+                arduino.flush()
+                time.sleep(0.01)
+            for _ in range(60):
+                if arduino.in_waiting > 0:
+                    line = arduino.read_until(b'\n').decode(errors='replace').strip()
+                    print(f"[DEBUG] Received from {port}: {repr(line)}")
+                    match = re.search(r"SN\d{3,4}", line)
+                    if match:
+                        serial_match = re.search(r"<SERIAL:([A-Z\-]*SN\d{3,4})>", line)
+                        if serial_match:
+                            station_serial_number = serial_match.group(1)
+                        else:
+                            station_serial_number = match.group(0)
+                        print(f"[DEBUG] Station serial {station_serial_number} detected on {port}")
+                        protocol_version = negotiated_protocol(line)
+                        fastest_baud = offered_baud(line)
+                        arduino.write(confirm_id_for(protocol_version))
+                        arduino.flush()
+                        print(f"[DEBUG] Sent CONFIRM_ID (protocol v{protocol_version}) to station on port {port}")
+                        break
+                time.sleep(0.1)
+            if station_serial_number is not None:
+                break
+        mark('serial')
+        matched_entry = None
+        if station_serial_number is not None:
+            for entry in station_serials:
+                if entry and station_serial_number in entry:
+                    matched_entry = entry
+                    break
+        if matched_entry is None:
+            if DEBUG:
+                print(f"[DEBUG] No recognized station detected on port {port}, skipping...")
+            arduino.close()
+            mark('total')
+            return None, None, timings
+        station_index = station_serials.index(matched_entry)
+        timings['station'] = station_index + 1
+        got_request = False
+        for _ in range(40):
+            if arduino.in_waiting > 0:
+                req = arduino.read(1)
+                if req == config.REQUEST_CALIBRATION:
+                    if DEBUG:
+                        print(f"[DEBUG] Station {station_index+1}: REQUEST_CALIBRATION received, sending calibration: {scale_calibrations[station_index]}")
+                    arduino.write(config.REQUEST_CALIBRATION)
+                    arduino.write(f"{scale_calibrations[station_index]}\n".encode('utf-8'))
+                    got_request = True
+                    break
+                else:
+                    arduino.reset_input_buffer()
+            time.sleep(0.1)
+        mark('calibration')
+        if not got_request:
+            if DEBUG:
+                print(f"[DEBUG] Station {station_index+1}: Did not receive calibration request, skipping.")
+            arduino.close()
+            timings['result'] = 'no calibration request'
+            mark('total')
+            return None, None, timings
+        # The station frames everything after the calibration reply if it accepted v2
+        arduino.protocol_version = protocol_version
+        timings['protocol'] = protocol_version
+        timings['baud_rate'] = negotiate_baud(arduino, fastest_baud, DEBUG)
+        mark('baud')
+        timings['result'] = 'ready'
+        mark('total')
+        if DEBUG:
+            print(f"[DEBUG] Station {station_index+1} on {port} initialized and ready.")
+        return station_index, arduino, timings
+    except Exception as e:
+        logging.error(f"Error initializing Arduino on {port}: {e}")
+        if DEBUG:
+            print(f"[DEBUG] Error initializing Arduino on {port}: {e}")
+        if arduino is not None:
+            try:
+                arduino.close()
+            except Exception:
+                pass
+        timings['result'] = f"error: {e}"
+        mark('total')
+        return None, None, timings
+
+
+def wait_for_baud_ack(arduino, decoder, rate, timeout):
+    """Read station messages until SET_BAUD acks rate; other messages are discarded."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not decoder.read_from(arduino, block=True):
+            continue
+        for message_type, payload in decoder.decode():
+            if message_type == config.SET_BAUD and payload == rate:
+                return True
+    return False
+
+
+def negotiate_baud(arduino, fastest_baud, DEBUG=False):
+    """
+    Move a handshaked station to the fastest rate in config.SERIAL_BAUD_RATES
+    that it offered. The switch only sticks once the station acknowledged it at
+    the new rate; otherwise both sides fall back to config.DEFAULT_BAUD.
+    Returns the baud rate in use.
+    """
+    rates = [rate for rate in config.SERIAL_BAUD_RATES if fastest_baud and rate <= fastest_baud]
+    if not rates:
+        return arduino.baudrate
+    rate = rates[0]
+    decoder = make_decoder(arduino)
+    try:
+        arduino.write(config.SET_BAUD + f"{rate}\n".encode('utf-8'))
+        arduino.flush()
+        if not wait_for_baud_ack(arduino, decoder, rate, BAUD_ACK_TIMEOUT):
+            if DEBUG:
+                print(f"[DEBUG] {arduino.port}: no SET_BAUD ack for {rate}, staying at {arduino.baudrate}")
+            return arduino.baudrate
+        time.sleep(BAUD_SWITCH_DELAY)
+        arduino.baudrate = rate
+        arduino.reset_input_buffer()
+        decoder.reset()
+        arduino.write(config.SET_BAUD)
+        arduino.flush()
+        if wait_for_baud_ack(arduino, decoder, rate, BAUD_ACK_TIMEOUT):
+            if DEBUG:
+                print(f"[DEBUG] {arduino.port}: switched to {rate} baud")
+            return rate
+    except serial.SerialException:
+        raise
+    except Exception as e:
+        logging.error(f"Baud negotiation failed on {arduino.port}: {e}")
+    # Not confirmed: the firmware reverts on its own, follow it
+    logging.error(f"{arduino.port}: could not verify {rate} baud, falling back to {config.DEFAULT_BAUD}")
+    arduino.baudrate = config.DEFAULT_BAUD
+    time.sleep(FIRMWARE_BAUD_CONFIRM_TIMEOUT)
+    arduino.reset_input_buffer()
+    return config.DEFAULT_BAUD
+
+
+def format_handshake_report(reports, elapsed):
+    """One line per port with the time spent in each handshake phase."""
+    lines = [f"Arduino discovery finished in {elapsed:.2f} s"]
+    for t in sorted(reports, key=lambda r: r['port']):
+        phases = " ".join(
+            f"{phase}={t[phase]:.2f}s" for phase in ('open', 'serial', 'calibration', 'baud', 'total') if phase in t
+        )
+        station = f"station {t['station']}" if t['station'] else "-"
+        protocol = f", protocol v{t['protocol']}" if 'protocol' in t else ""
+        if 'baud_rate' in t:
+            protocol += f" at {t['baud_rate']} baud"
+        lines.append(f"  {t['port']}: {station}, {t['result']}{protocol} ({phases})")
+    return "\n".join(lines)
+
+
 def step_connect_arduinos(context):
+    if context.get('SERIAL_ENGINE') == "asyncio":
+        from async_serial import step_connect_arduinos_async
+        return step_connect_arduinos_async(context)
+    if context.get('SERIAL_ENGINE') == "process":
+        from hardware_process import step_connect_arduinos_process
+        return step_connect_arduinos_process(context)
     try:
         print("Step: Connect and initialize Arduinos")
         NUM_STATIONS = context['NUM_STATIONS']
@@ -58,87 +265,46 @@ def step_connect_arduinos(context):
         scale_calibrations = context['scale_calibrations']
         config = context['config']
         DEBUG = context.get('DEBUG', False)
+        ports = list(getattr(config, 'arduino_ports', []))
 
         print(f"[DEBUG] NUM_STATIONS: {NUM_STATIONS}")
         print(f"[DEBUG] station_serials: {station_serials}")
         print(f"[DEBUG] scale_calibrations: {scale_calibrations}")
-        print(f"[DEBUG] arduino_ports: {getattr(config, 'arduino_ports', [])}")
+        print(f"[DEBUG] arduino_ports: {ports}")
 
         station_connected = [False] * NUM_STATIONS
         arduinos = [None] * NUM_STATIONS
+        reports = []
+
+        # Handshake every port at once; total time is that of the slowest board
+        started = time.monotonic()
+        if ports:
+            with ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="handshake") as executor:
+                futures = [
+                    executor.submit(handshake_port, port, station_serials, scale_calibrations, config, DEBUG)
+                    for port in ports
+                ]
+                for future in as_completed(futures):
+                    station_index, arduino, timings = future.result()
+                    reports.append(timings)
+                    if arduino is None:
+                        continue
+                    if arduinos[station_index] is not None:
+                        logging.error(f"Station {station_index+1} answered on {timings['port']} as well, keeping the first port")
+                        arduino.close()
+                        timings['result'] = 'duplicate station'
+                        continue
+                    arduinos[station_index] = arduino
+                    station_connected[station_index] = True
+                    print(f"[DEBUG] Station {station_index+1} connected on {timings['port']} after {timings['total']:.2f} s")
 
-        for port in getattr(config, 'arduino_ports', []):
-            try:
-                print(f"[DEBUG] Trying port {port}...")
-                arduino = serial.Serial(port, 9600, timeout=0.5)
-                # Send RESET_HANDSHAKE before PMID to allow handshake restart
-                arduino.write(config.RESET_HANDSHAKE)
-                arduino.flush()
-                time.sleep(0.05)
-                for b in b'PMID':
-                    arduino.write(bytes([b]))
-                    arduino.flush()
-                    time.sleep(0.01)
-                station_serial_number = None
-                for _ in range(60):
-                    if arduino.in_waiting > 0:
-                        line = arduino.read_until(b'\n').decode(errors='replace').strip()
-                        print(f"[DEBUG] Received from {port}: {repr(line)}")
-                        match = re.search(r"SN\d{3,4}", line)
-                        if match:
-                            serial_match = re.search(r"<SERIAL:([A-Z\-]*SN\d{3,4})>", line)
-                            if serial_match:
-                                station_serial_number = serial_match.group(1)
-                            else:
-                                station_serial_number = match.group(0)
-                            print(f"[DEBUG] Station serial {station_serial_number} detected on {port}")
-                            arduino.write(config.CONFIRM_ID)
-                            arduino.flush()
-                            print(f"[DEBUG] Sent CONFIRM_ID to station on port {port}")
-                            break
-                    time.sleep(0.1)
-                matched_entry = None
-                if station_serial_number is not None:
-                    for entry in station_serials:
-                        if station_serial_number in entry:
-                            matched_entry = entry
-                            break
-                if matched_entry is None:
-                    if DEBUG:
-                        print(f"[DEBUG] No recognized station detected on port {port}, skipping...")
-                    arduino.close()
-                    continue
-                station_index = station_serials.index(matched_entry)
-                got_request = False
-                for _ in range(40):
-                    if arduino.in_waiting > 0:
-                        req = arduino.read(1)
-                        if req == config.REQUEST_CALIBRATION:
-                            if DEBUG:
-                                print(f"[DEBUG] Station {station_index+1}: REQUEST_CALIBRATION received, sending calibration: {scale_calibrations[station_index]}")
-                            arduino.write(config.REQUEST_CALIBRATION)
-                            arduino.write(f"{scale_calibrations[station_index]}\n".encode('utf-8'))
-                            got_request = True
-                            break
-                        else:
-                            arduino.reset_input_buffer()
-                    time.sleep(0.1)
-                if not got_request:
-                    if DEBUG:
-                        print(f"[DEBUG] Station {station_index+1}: Did not receive calibration request, skipping.")
-                    arduino.close()
-                    continue
-                arduinos[station_index] = arduino
-                station_connected[station_index] = True
-                if DEBUG:
-                    print(f"[DEBUG] Station {station_index+1} on {port} initialized and ready.")
-            except Exception as e:
-                logging.error(f"Error initializing Arduino on {port}: {e}")
-                if DEBUG:
-                    print(f"[DEBUG] Error initializing Arduino on {port}: {e}")
+        report = format_handshake_report(reports, time.monotonic() - started)
+        print(report)
+        logging.info(report)
 
         context['station_connected'] = station_connected
         context['arduinos'] = arduinos
+        context['handshake_report'] = reports
         print(f"[DEBUG] Final station_connected: {context['station_connected']}")
         print(f"[DEBUG] Final arduinos: {context['arduinos']}")
         return 'completed'
@@ -178,7 +344,8 @@ def step_station_verification(context):
 
         # Save the enabled/disabled stations to context as soon as user continues
         if "enabled" in step_result:
-            context['station_enabled'] = step_result["enabled"]
+            # In place: main and the GUI hold the same station_enabled
+            context['station_enabled'][:] = step_result["enabled"]
         return 'completed'
     except Exception as e:
         logging.error(f"Error in step_station_verification: {e}\n{traceback.format_exc()}")
@@ -0,0 +1,123 @@
+import logging
+from config import stations
+from utils import update_station_status
+from display_latency import PATH_MAIN, PATH_WIZARD
+from event_bus import (
+    WeightSample,
+    FillStarted,
+    FinalWeight,
+    FillCompleted,
+    MaxWeight,
+    DELIVER_BATCHED,
+)
+
+
+class StationDisplay:
+    """
+    GUI subscriber of the event bus: weights, fill statuses and max-weight
+    warnings on the station widgets and the StartupWizardDialog.
+    Delivered in batches at the end of each poll_hardware tick, so all the
+    widget work of a tick happens in one place, after the ports are read.
+    Widgets, app and active dialog come from the HandlerContext that
+    poll_hardware refreshes every tick.
+    """
+    EVENT_TYPES = (WeightSample, FillStarted, FinalWeight, FillCompleted, MaxWeight)
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+
+    def subscribe(self, bus):
+        return bus.subscribe(self.EVENT_TYPES, self.on_events, DELIVER_BATCHED, name="station_display")
+
+    def on_events(self, events):
+        # Only the newest weight of a station in this batch is drawn
+        newest_weight = {}
+        for position, event in enumerate(events):
+            if type(event) is WeightSample:
+                newest_weight[event.station_index] = position
+        for position, event in enumerate(events):
+            event_type = type(event)
+            try:
+                if event_type is WeightSample:
+                    if newest_weight[event.station_index] == position:
+                        self.show_weight(event.station_index, event.weight)
+                elif event_type is FillStarted:
+                    self.show_fill_started(event.station_index, event.mode)
+                elif event_type is FinalWeight:
+                    self.show_fill_result(event.station_index, event.final_weight, "complete", None)
+                elif event_type is FillCompleted:
+                    self.show_fill_result(event.station_index, event.final_weight,
+                                          "timeout" if event.timed_out else "complete",
+                                          event.fill_time_ms / 1000.0)
+                elif event_type is MaxWeight:
+                    self.show_max_weight(event.station_index, event.active)
+            except Exception:
+                logging.error(f"Error showing {event_type.__name__} for station {event.station_index+1}", exc_info=True)
+
+    def show_weight(self, station_index, weight):
+        ctx = self.ctx
+        widgets = ctx.station_widgets
+        app = ctx.app
+        unit = getattr(app, "units", "g") if app else "g"
+        display_latency = ctx.display_latency
+        if widgets:
+            widget = widgets[station_index]
+            if stations[station_index].max_weight_error:
+                widget.weight_label.setStyleSheet("color: #FF2222;")
+            else:
+                widget.weight_label.setStyleSheet("color: #fff;")
+            if hasattr(widget, "set_weight"):
+                changed = widget.set_weight(weight, ctx.target_weight, unit)
+                if display_latency is not None:
+                    display_latency.shown(station_index, PATH_MAIN, bool(changed))
+            elif widget.weight_label:
+                if unit == "g":
+                    widget.weight_label.setText(f"{int(round(weight))} g")
+                else:
+                    oz = weight / 28.3495
+                    widget.weight_label.setText(f"{oz:.1f} oz")
+        # StartupWizardDialog support
+        if ctx.active_dialog is not None and ctx.active_dialog.__class__.__name__ == "StartupWizardDialog":
+            changed = ctx.active_dialog.set_weight(station_index, weight)
+            if display_latency is not None:
+                display_latency.shown(station_index, PATH_WIZARD, bool(changed))
+
+    def show_fill_started(self, station_index, mode):
+        widgets = self.ctx.station_widgets
+        app = self.ctx.app
+        if widgets:
+            widget = widgets[station_index]
+            if hasattr(widget, "set_status"):
+                text = f"{mode} FILL RUNNING"
+                widget.set_status(app.tr(text) if app else text)
+
+    def show_fill_result(self, station_index, final_weight, fill_result, seconds):
+        app = self.ctx.app
+        if app is None or not getattr(app, "station_widgets", None):
+            return
+        update_station_status(
+            app,
+            station_index,
+            final_weight,
+            getattr(app, "filling_mode", "AUTO"),
+            is_filling=False,
+            fill_result=fill_result,
+            fill_time=seconds
+        )
+
+    def show_max_weight(self, station_index, active):
+        widgets = self.ctx.station_widgets
+        app = self.ctx.app
+        if not widgets:
+            return
+        widget = widgets[station_index]
+        if active:
+            if hasattr(widget, "set_status"):
+                if app:
+                    widget.set_status(f"<b>{app.tr('MAX WEIGHT EXCEEDED')}</b>", color="#FF2222", flashing=True)
+                else:
+                    widget.set_status("<b>MAX WEIGHT EXCEEDED</b>", color="#FF2222", flashing=True)
+        elif hasattr(widget, "clear_status"):
+            widget.clear_status()
+        elif hasattr(widget, "set_status"):
+            widget.set_status("")  # Fallback: clear status text
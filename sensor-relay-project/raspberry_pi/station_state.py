@@ -0,0 +1,140 @@
+import collections.abc
+from array import array
+from operator import attrgetter
+
+# Completed fills remembered per station (final weight, fill time)
+FILL_HISTORY = 32
+
+
+class StationState:
+    """
+    Everything the host tracks about one station, in one record.
+    __slots__ keeps the record small and attribute access cheap on the
+    poll_hardware path; the fill history is a pair of fixed-size arrays
+    used as a ring.
+    """
+    __slots__ = (
+        'index',
+        'arduino',            # open port (serial.Serial, TracingSerial or RemotePort), None while offline
+        'port',               # device the station was last installed from, for reconnects
+        'serial_number',
+        'enabled',
+        'connected',
+        'weight',             # last weight shown
+        'max_weight_error',
+        'last_final_weight',  # FINAL_WEIGHT waiting for its FILL_TIME (or the other way round)
+        'last_fill_time',
+        'fill_count',
+        '_fill_weights',
+        '_fill_times',
+    )
+
+    def __init__(self, index):
+        self.index = index
+        self.arduino = None
+        self.port = None
+        self.serial_number = None
+        self.enabled = False
+        self.connected = False
+        self.weight = 0
+        self.max_weight_error = False
+        self.last_final_weight = None
+        self.last_fill_time = None
+        self.fill_count = 0
+        self._fill_weights = array('i', bytes(4 * FILL_HISTORY))
+        self._fill_times = array('I', bytes(4 * FILL_HISTORY))
+
+    def record_fill(self, final_weight, fill_time_ms):
+        slot = self.fill_count % FILL_HISTORY
+        self._fill_weights[slot] = int(final_weight)
+        self._fill_times[slot] = int(fill_time_ms)
+        self.fill_count += 1
+
+    def recent_fills(self):
+        """[(final weight, fill time ms), ...] of the last FILL_HISTORY fills, oldest first."""
+        count = min(self.fill_count, FILL_HISTORY)
+        start = self.fill_count - count
+        return [
+            (self._fill_weights[i % FILL_HISTORY], self._fill_times[i % FILL_HISTORY])
+            for i in range(start, self.fill_count)
+        ]
+
+    def snapshot(self):
+        return {
+            'station': self.index + 1,
+            'port': self.port,
+            'serial_number': self.serial_number,
+            'enabled': self.enabled,
+            'connected': self.connected,
+            'weight': self.weight,
+            'max_weight_error': self.max_weight_error,
+            'fills': self.fill_count,
+            'recent_fills': self.recent_fills(),
+        }
+
+    def __repr__(self):
+        return (f"StationState({self.index + 1}, port={self.port!r}, enabled={self.enabled}, "
+                f"connected={self.connected}, weight={self.weight})")
+
+
+class StationColumn(collections.abc.Sequence):
+    """
+    Live list-like view of one StationState attribute across all stations,
+    for code that works with per-station lists (station_enabled[i], arduinos[i]).
+    Reads and writes go to the registry, so every holder sees the same values.
+    """
+    __slots__ = ('_stations', '_attribute', '_get')
+
+    def __init__(self, stations, attribute):
+        self._stations = stations
+        self._attribute = attribute
+        self._get = attrgetter(attribute)
+
+    def __len__(self):
+        return len(self._stations)
+
+    def __iter__(self):
+        return map(self._get, self._stations)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [getattr(station, self._attribute) for station in self._stations[index]]
+        return getattr(self._stations[index], self._attribute)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            stations = self._stations[index]
+            values = list(value)
+            if len(values) != len(stations):
+                raise ValueError(f"{self._attribute}: {len(values)} values for {len(stations)} stations")
+            for station, item in zip(stations, values):
+                setattr(station, self._attribute, item)
+            return
+        setattr(self._stations[index], self._attribute, value)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class StationRegistry(list):
+    """
+    The StationState of every station, indexed by station number - 1.
+    A plain list underneath so stations[i] stays a C-level lookup; column()
+    gives list-like views for older code.
+    """
+    def __init__(self, num_stations):
+        super().__init__(StationState(i) for i in range(num_stations))
+        self._columns = {}
+
+    def column(self, attribute):
+        view = self._columns.get(attribute)
+        if view is None:
+            view = self._columns[attribute] = StationColumn(self, attribute)
+        return view
+
+    def snapshot(self):
+        """Plain-data copy of every station, e.g. for telemetry or logs."""
+        return [station.snapshot() for station in self]
@@ -0,0 +1,83 @@
+"""
+Protocol v2 framing: CRC, encode/decode round trip, partial frames and resync.
+
+Run from the raspberry_pi directory:
+    python -m pytest tests
+"""
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from frame_decoder import FRAME_SYNC, FramedDecoder, crc8, encode_frame
+
+FRAMES = [
+    (config.CURRENT_WEIGHT, struct.pack('<i', 1234), 1234),
+    (config.BEGIN_AUTO_FILL, b'', b''),
+    (config.WEIGHT_BATCH, struct.pack('<IiIi', 1000, 10, 1020, -5), struct.pack('<IiIi', 1000, 10, 1020, -5)),
+    (config.FINAL_WEIGHT, struct.pack('<i', -7), -7),
+]
+
+
+def expected():
+    return [(message_type, decoded) for message_type, _, decoded in FRAMES]
+
+
+def stream():
+    return b''.join(encode_frame(message_type, payload) for message_type, payload, _ in FRAMES)
+
+
+def test_crc8_check_value():
+    # The standard CRC-8 (poly 0x07, init 0) check value
+    assert crc8(b"123456789") == 0xF4
+    assert crc8(b"") == 0
+
+
+def test_round_trip():
+    decoder = FramedDecoder()
+    decoder.feed(stream())
+    assert decoder.decode() == expected()
+    assert len(decoder) == 0
+    assert decoder.bad_frames == 0
+    assert decoder.skipped_bytes == 0
+
+
+def test_split_at_every_byte():
+    data = stream()
+    for split in range(len(data) + 1):
+        decoder = FramedDecoder()
+        decoder.feed(data[:split])
+        frames = decoder.decode()
+        decoder.feed(data[split:])
+        frames += decoder.decode()
+        assert frames == expected(), f"split at byte {split}"
+        assert decoder.bad_frames == 0
+
+
+def test_one_byte_at_a_time():
+    decoder = FramedDecoder()
+    frames = []
+    for b in stream():
+        decoder.feed(bytes((b,)))
+        frames += decoder.decode()
+    assert frames == expected()
+
+
+def test_bad_crc_resyncs_to_next_frame():
+    good = encode_frame(config.CURRENT_WEIGHT, struct.pack('<i', 42))
+    corrupt = bytearray(encode_frame(config.CURRENT_WEIGHT, struct.pack('<i', 99)))
+    corrupt[-1] ^= 0xFF
+    decoder = FramedDecoder()
+    decoder.feed(bytes(corrupt) + good)
+    assert decoder.decode() == [(config.CURRENT_WEIGHT, 42)]
+    assert decoder.bad_frames == 1
+    assert decoder.skipped_bytes == len(corrupt) - 1
+
+
+def test_noise_before_sync_is_skipped():
+    noise = b'\x01\x02' + bytes((FRAME_SYNC,)) + b'\x03'
+    decoder = FramedDecoder()
+    decoder.feed(noise + stream())
+    assert decoder.decode() == expected()
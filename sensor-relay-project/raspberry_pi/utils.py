@@ -1,5 +1,8 @@
+import glob
 import logging
 import os
+import re
+import config
 from config import (
     DEBUG,
     NUM_STATIONS,
@@ -97,6 +100,7 @@ def save_station_enabled(config_path, station_enabled):
     try:
         with open(config_path, "r") as f:
             lines = f.readlines()
+        saved = set()
         with open(config_path, "w") as f:
             for line in lines:
                 written = False
@@ -104,10 +108,17 @@ def save_station_enabled(config_path, station_enabled):
                     key = f"station{i+1}_enabled="
                     if line.strip().startswith(key):
                         f.write(f"{key}{'true' if station_enabled[i] else 'false'}\n")
+                        saved.add(i)
                         written = True
                         break
                 if not written:
                     f.write(line)
+            # Stations added with num_stations= have no line yet
+            if len(saved) < NUM_STATIONS and lines and not lines[-1].endswith("\n"):
+                f.write("\n")
+            for i in range(NUM_STATIONS):
+                if i not in saved:
+                    f.write(f"station{i+1}_enabled={'true' if station_enabled[i] else 'false'}\n")
     except Exception as e:
         if DEBUG:
             print(f"Error writing station_enabled to config: {e}")
@@ -127,6 +138,103 @@ def load_station_serials():
         logging.error(f"Error reading serials from config: {e}")
     return serials
 
+def load_serial_engine(config_path, default="threaded"):
+    """Return the serial_engine= setting from config.txt, or default if not set."""
+    engine = default
+    try:
+        with open(config_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("serial_engine="):
+                    engine = line.split("=", 1)[1].strip().lower()
+    except Exception as e:
+        logging.error(f"Error reading serial_engine from config: {e}")
+    if engine not in ("threaded", "selector", "asyncio", "process", "poll"):
+        logging.error(f"Unknown serial_engine '{engine}', using '{default}'")
+        engine = default
+    if DEBUG:
+        print(f"[DEBUG] Serial engine: {engine}")
+    return engine
+
+def discover_arduino_ports(patterns=None):
+    """Serial devices matching config.ARDUINO_PORT_PATTERNS, in natural order (ttyACM2 before ttyACM10)."""
+    ports = set()
+    for pattern in patterns or config.ARDUINO_PORT_PATTERNS:
+        ports.update(glob.glob(pattern))
+    return sorted(ports, key=lambda port: [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", port)])
+
+def load_arduino_ports(config_path, default):
+    """
+    Return the arduino_ports= list from config.txt (comma-separated), or default if not set.
+    arduino_ports=auto scans for boards instead and sets config.ARDUINO_PORT_DISCOVERY,
+    so a station that moves to another port is looked for there too.
+    """
+    ports = list(default)
+    try:
+        with open(config_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("arduino_ports="):
+                    value = line.split("=", 1)[1].strip()
+                    if value.lower() == "auto":
+                        config.ARDUINO_PORT_DISCOVERY = True
+                        ports = discover_arduino_ports()
+                    else:
+                        ports = [port.strip() for port in value.split(",") if port.strip()]
+    except Exception as e:
+        logging.error(f"Error reading arduino_ports from config: {e}")
+    if config.ARDUINO_PORT_DISCOVERY and DEBUG:
+        print(f"[DEBUG] Discovered serial ports: {ports}")
+    return ports
+
+def load_stall_timeout(config_path, default=0.5):
+    """Return the stall_timeout= setting (seconds) from config.txt, or default if not set."""
+    timeout = default
+    try:
+        with open(config_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("stall_timeout="):
+                    timeout = float(line.split("=", 1)[1])
+    except Exception as e:
+        logging.error(f"Error reading stall_timeout from config: {e}")
+    if timeout <= 0:
+        logging.error(f"Invalid stall_timeout {timeout}, using {default}")
+        timeout = default
+    return timeout
+
+def load_serial_trace_dir(config_path):
+    """Return the serial_trace= directory from config.txt, or None if capture is off."""
+    directory = None
+    try:
+        with open(config_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("serial_trace="):
+                    directory = line.split("=", 1)[1].strip() or None
+    except Exception as e:
+        logging.error(f"Error reading serial_trace from config: {e}")
+    return directory
+
+def load_predictive_cutoff(config_path, default_path="logs/cutoff_model.json"):
+    """
+    Return (enabled, model path) from predictive_cutoff= (true/false, default false)
+    and cutoff_model= in config.txt.
+    """
+    enabled = False
+    path = default_path
+    try:
+        with open(config_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("predictive_cutoff="):
+                    enabled = line.split("=", 1)[1].strip().lower() == "true"
+                elif line.startswith("cutoff_model="):
+                    path = line.split("=", 1)[1].strip() or default_path
+    except Exception as e:
+        logging.error(f"Error reading predictive_cutoff from config: {e}")
+    return enabled, path
+
 def load_bottle_sizes(config_path):
     bottle_sizes = {}
     try:
@@ -0,0 +1,84 @@
+import time
+
+
+class WeightCoalescer:
+    """
+    Keeps only the newest CURRENT_WEIGHT sample per station between UI ticks.
+    Every sample is still handed to the subscribed consumers (logging,
+    analytics) as it arrives; only the display is limited to one update per
+    station per tick. Superseded samples are counted in dropped_samples.
+    clock(station_index, device_millis), if given, maps a station's millis()
+    onto host time (ClockSync.to_host); it returns None until the station is
+    synced, and the sample is then timed by when the host read it.
+    """
+    def __init__(self, num_stations, clock=None):
+        self.clock = clock
+        self.pending = [None] * num_stations  # station_index -> (arduino, weight, taken_at) or None
+        self.dropped_samples = [0] * num_stations
+        self.total_samples = [0] * num_stations
+        self._consumers = []
+
+    def subscribe(self, consumer):
+        """
+        consumer(station_index, weight, timestamp, device_millis) is called for every
+        sample. timestamp is the host time.monotonic() at which the station took the
+        sample, or at which the host read it while the station's clock is not synced
+        (always, for plain CURRENT_WEIGHT); device_millis is the station's millis() when
+        the sample was taken (None for plain CURRENT_WEIGHT).
+        """
+        self._consumers.append(consumer)
+
+    def unsubscribe(self, consumer):
+        if consumer in self._consumers:
+            self._consumers.remove(consumer)
+
+    def offer(self, station_index, arduino, weight, received_at=None):
+        taken_at = received_at or time.monotonic()
+        for consumer in self._consumers:
+            consumer(station_index, weight, taken_at, None)
+        self.total_samples[station_index] += 1
+        if self.pending[station_index] is not None:
+            self.dropped_samples[station_index] += 1
+        self.pending[station_index] = (arduino, weight, taken_at)
+
+    def offer_batch(self, station_index, arduino, samples, received_at=None):
+        """Offer a decoded WEIGHT_BATCH: a list of (device millis, weight), oldest first."""
+        if not samples:
+            return
+        now = received_at or time.monotonic()
+        clock = self.clock
+        taken_at = now
+        for device_millis, weight in samples:
+            if clock is not None:
+                taken_at = clock(station_index, device_millis)
+                if taken_at is None:
+                    taken_at = now
+            for consumer in self._consumers:
+                consumer(station_index, weight, taken_at, device_millis)
+        count = len(samples)
+        self.total_samples[station_index] += count
+        self.dropped_samples[station_index] += count - 1
+        if self.pending[station_index] is not None:
+            self.dropped_samples[station_index] += 1
+        self.pending[station_index] = (arduino, samples[-1][1], taken_at)
+
+    def take(self, station_index):
+        """Remove and return the pending (arduino, weight, taken_at) for one station, or None."""
+        sample = self.pending[station_index]
+        self.pending[station_index] = None
+        return sample
+
+    def flush(self):
+        """Yield (station_index, arduino, weight, taken_at) for every station with a pending sample."""
+        pending = self.pending
+        for station_index, sample in enumerate(pending):
+            if sample is not None:
+                pending[station_index] = None
+                yield (station_index, *sample)
+
+    def discard(self, station_index=None):
+        """Forget pending samples (e.g. after E-STOP or a reconnect)."""
+        if station_index is None:
+            self.pending = [None] * len(self.pending)
+        else:
+            self.pending[station_index] = None